@@ -0,0 +1,54 @@
+import os
+import sys
+import logging
+import argparse
+
+from sqlalchemy.orm import Session
+
+from app import models
+from app.forms import invalidate_form_cache
+from app.ingestion import METRICS, update_latest_values
+
+logger = logging.getLogger(__name__)
+
+REBUILD_BATCH_SIZE = int(os.getenv('REBUILD_BATCH_SIZE', '500'))
+
+def rebuild_latest_values(db: Session, user_ids=None, only_missing=False, batch_size=REBUILD_BATCH_SIZE):
+    # Recomputes latest_<metric> and its date from every stored result, for
+    # forms written before the dates existed or after results were removed.
+    # only_missing limits it to forms without any date yet.
+    rebuilt = 0
+    last_id = 0
+    while True:
+        query = db.query(models.Form).filter(models.Form.id > last_id)
+        if user_ids is not None:
+            query = query.filter(models.Form.user_id.in_(set(user_ids)))
+        if only_missing:
+            query = query.filter(*(getattr(models.Form, f'latest_{metric}_date').is_(None) for metric in METRICS))
+        forms = query.order_by(models.Form.id).limit(batch_size).all()
+        if not forms:
+            return rebuilt
+        last_id = forms[-1].id
+        for user_form in forms:
+            update_latest_values(db, user_form)
+            invalidate_form_cache(user_form.user_id)
+        rebuilt += len(forms)
+        logger.info("Rebuilt the latest values of %d forms up to %d", rebuilt, last_id)
+
+def main(argv=None):
+    from app.database import get_session_factory
+
+    parser = argparse.ArgumentParser(description="Rebuild the latest values of the forms from every stored lab result")
+    parser.add_argument("--user-id", type=int, action="append", help="only the form of this user (may be repeated)")
+    parser.add_argument("--only-missing", action="store_true", help="only forms that have no latest value date yet")
+    parser.add_argument("--batch-size", type=int, default=REBUILD_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    with get_session_factory()() as db:
+        rebuilt = rebuild_latest_values(db, args.user_id, args.only_missing, args.batch_size)
+    print(f"Rebuilt the latest values of {rebuilt} forms")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from sqlalchemy import select, func
+
+from app import models, scraping
+from app.forms import invalidate_form_cache
+from app.ingestion import get_forms_by_user_id, replace_scraping_results, update_latest_values
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH_SIZE = int(os.getenv('BACKFILL_BATCH_SIZE', '200'))
+BACKFILL_WORKERS = int(os.getenv('BACKFILL_WORKERS', str(scraping.SCRAPING_MAX_WORKERS)))
+BACKFILL_CHECKPOINT = os.getenv('BACKFILL_CHECKPOINT', 'backfill-checkpoint.json')
+
+def load_checkpoint(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {"last_test_id": 0, "processed": 0, "failed": []}
+
+def save_checkpoint(path, checkpoint):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(checkpoint, file)
+    os.replace(tmp_path, path)
+
+def tests_filter(last_test_id, user_id=None):
+    filters = [models.Test.id > last_test_id]
+    if user_id is not None:
+        filters.append(models.Test.user_id == user_id)
+    return filters
+
+def format_eta(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+def scrape_tests(executor, tests):
+    # Downloads and extractions of the whole chunk run at once on the pool;
+    # failed documents are reported and left out of the chunk
+    futures = {
+        executor.submit(scraping.data_scraping, test.user_id, test.test_name): index
+        for index, test in enumerate(tests)
+    }
+    results = [None] * len(tests)
+    for future in as_completed(futures):
+        index = futures[future]
+        try:
+            results[index] = future.result()
+        except Exception:
+            logger.exception("Error while extracting test %d", tests[index].id)
+    return results
+
+def backfill_chunk(db, executor, tests):
+    # Extracts the chunk and swaps its stored rows; returns the ids of the
+    # tests whose extraction failed
+    results = scrape_tests(executor, tests)
+    extracted = [(test, result) for test, result in zip(tests, results) if result is not None]
+    forms_by_user_id = get_forms_by_user_id(db, {test.user_id for test, _ in extracted})
+    replace_scraping_results(db, forms_by_user_id, [test for test, _ in extracted], [result for _, result in extracted])
+    for form_user_id, user_form in forms_by_user_id.items():
+        update_latest_values(db, user_form)
+        invalidate_form_cache(form_user_id)
+    return [test.id for test, result in zip(tests, results) if result is None]
+
+def retry_failed_tests(db, executor, checkpoint, checkpoint_path, batch_size, user_id=None):
+    # Tests that failed in an earlier run are extracted again before the
+    # checkpoint moves on and leave the failed list once they succeed. Failed
+    # tests that were deleted since leave it too, unless the run is limited
+    # to one user and their owner can't be told.
+    retry = list(checkpoint["failed"])
+    for start in range(0, len(retry), batch_size):
+        chunk = retry[start:start + batch_size]
+        tests = db.execute(
+            select(models.Test)
+            .where(models.Test.id.in_(chunk), *tests_filter(0, user_id))
+            .order_by(models.Test.id)
+        ).scalars().all()
+        retried = {test.id for test in tests} if user_id is not None else set(chunk)
+        failed = set(backfill_chunk(db, executor, tests)) if tests else set()
+        checkpoint["processed"] += len(tests) - len(failed)
+        checkpoint["failed"] = [
+            test_id for test_id in checkpoint["failed"]
+            if test_id not in retried or test_id in failed
+        ]
+        save_checkpoint(checkpoint_path, checkpoint)
+        logger.info("Retried %d failed tests, %d still failing", len(tests), len(failed))
+        db.expunge_all()
+
+def run_backfill(session_factory, checkpoint_path=BACKFILL_CHECKPOINT, batch_size=BACKFILL_BATCH_SIZE, workers=BACKFILL_WORKERS, user_id=None):
+    checkpoint = load_checkpoint(checkpoint_path)
+    with session_factory() as db, ThreadPoolExecutor(max_workers=workers, thread_name_prefix='backfill') as executor:
+        retry_failed_tests(db, executor, checkpoint, checkpoint_path, batch_size, user_id)
+
+        total = db.execute(
+            select(func.count()).select_from(models.Test).where(*tests_filter(checkpoint["last_test_id"], user_id))
+        ).scalar()
+        logger.info("%d tests to extract after test %d", total, checkpoint["last_test_id"])
+
+        done = 0
+        start = time.perf_counter()
+        while True:
+            tests = db.execute(
+                select(models.Test)
+                .where(*tests_filter(checkpoint["last_test_id"], user_id))
+                .order_by(models.Test.id)
+                .limit(batch_size)
+            ).scalars().all()
+            if not tests:
+                break
+
+            failed = backfill_chunk(db, executor, tests)
+            checkpoint["last_test_id"] = tests[-1].id
+            checkpoint["processed"] += len(tests) - len(failed)
+            checkpoint["failed"].extend(failed)
+            save_checkpoint(checkpoint_path, checkpoint)
+
+            done += len(tests)
+            elapsed = time.perf_counter() - start
+            rate = done / elapsed if elapsed else 0.0
+            eta = format_eta((total - done) / rate) if rate else "-"
+            logger.info("%d/%d tests, %.1f docs/s, ETA %s", done, total, rate, eta)
+            db.expunge_all()
+
+    return checkpoint
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.backfill", description="Extract the values of every test again.")
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE, help="tests read, extracted and written per chunk")
+    parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS, help="concurrent downloads and extractions")
+    parser.add_argument("--checkpoint", default=BACKFILL_CHECKPOINT, help="file where the progress is saved after every chunk")
+    parser.add_argument("--user-id", type=int, help="only the tests of this user")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start from the first test")
+    args = parser.parse_args(argv)
+
+    from app.database import get_session_factory
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    checkpoint = run_backfill(get_session_factory(), args.checkpoint, args.batch_size, args.workers, args.user_id)
+    print(f"Extracted {checkpoint['processed']} tests, {len(checkpoint['failed'])} failed, last test {checkpoint['last_test_id']}")
+    return 1 if checkpoint["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
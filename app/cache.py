@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+
+from app.utils import create_redis_client
+
+class LRUCache:
+    # Values are kept pickled, so the memory tier can be bounded by their
+    # real size and the disk tier can store exactly the same bytes.
+    def __init__(self, max_bytes: int, directory: str = None, max_disk_bytes: int = None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.current_bytes = 0
+        self.disk_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self.disk_bytes = sum(size for _, size, _ in self._disk_files())
+
+    def _disk_path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest())
+
+    def _disk_files(self):
+        files = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def _trim_disk(self):
+        # The directory may be shared by several workers, so it is measured
+        # again instead of trusting this process' count, and the files used
+        # least recently (mtime is refreshed on every hit) are removed first
+        with self._disk_lock:
+            files = sorted(self._disk_files())
+            total = sum(size for _, size, _ in files)
+            evictions = 0
+            for _, size, path in files:
+                if total <= self.max_disk_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                evictions += 1
+        with self._lock:
+            self.disk_bytes = total
+            self.disk_evictions += evictions
+
+    def _store(self, key, data):
+        if key in self._entries:
+            self.current_bytes -= len(self._entries.pop(key))
+        if len(data) > self.max_bytes:
+            return
+        self._entries[key] = data
+        self.current_bytes += len(data)
+        while self.current_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.current_bytes -= len(evicted)
+            self.evictions += 1
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return pickle.loads(data)
+
+        if self.directory:
+            path = self._disk_path(key)
+            try:
+                with open(path, 'rb') as file:
+                    data = file.read()
+                os.utime(path)
+            except FileNotFoundError:
+                data = None
+            if data is not None:
+                with self._lock:
+                    self._store(key, data)
+                    self.hits += 1
+                    self.disk_hits += 1
+                return pickle.loads(data)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._store(key, data)
+        if self.directory and (self.max_disk_bytes is None or len(data) <= self.max_disk_bytes):
+            path = self._disk_path(key)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as file:
+                file.write(data)
+            os.replace(tmp_path, path)
+            with self._lock:
+                self.disk_bytes += len(data)
+                over = self.max_disk_bytes is not None and self.disk_bytes > self.max_disk_bytes
+            if over:
+                self._trim_disk()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "disk_bytes": self.disk_bytes,
+                "max_disk_bytes": self.max_disk_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_evictions": self.disk_evictions
+            }
+
+class TTLCache:
+    # Entries expire after ttl seconds and the least recently used one is
+    # dropped once max_entries is reached. Values are kept as they are, so
+    # callers must not mutate what they get back.
+    def __init__(self, max_entries: int, ttl: float, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self._clock():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (self._clock() + self.ttl, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+class RedisCache:
+    # Shared between API replicas, so an invalidation made by one of them is
+    # seen by all. Redis applies the TTL and its own maxmemory eviction.
+    def __init__(self, url, prefix="cache", ttl=60, client=None, setting="FORM_CACHE_BACKEND"):
+        self._redis = client if client is not None else create_redis_client(url, setting)
+        self._prefix = prefix
+        self.ttl = ttl
+
+    def _key(self, key):
+        return f"{self._prefix}:{key}"
+
+    def get(self, key):
+        raw = self._redis.get(self._key(key))
+        return json.loads(raw) if raw else None
+
+    def set(self, key, value):
+        self._redis.set(self._key(key), json.dumps(value), ex=max(1, int(self.ttl)))
+
+    def delete(self, key):
+        self._redis.delete(self._key(key))
+
+    def clear(self):
+        keys = list(self._redis.scan_iter(match=f"{self._prefix}:*"))
+        if keys:
+            self._redis.delete(*keys)
+
+    def stats(self):
+        return {"backend": "redis", "ttl": self.ttl}
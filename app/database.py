@@ -1,7 +1,15 @@
 import os
+import time
+import threading
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, exc, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from starlette.concurrency import run_in_threadpool
+
+from app.metrics import instrument_engine
 
 load_dotenv() 
 
@@ -9,13 +17,235 @@ DATABASE_URL = os.getenv('DATABASE_URL')
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is not set")
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# "async" serves the routes through an AsyncSession (asyncpg/aiosqlite),
+# "sync" through a blocking Session run on the thread pool.
+DATABASE_MODE = os.getenv('DATABASE_MODE', 'async')
+
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '-1'))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'false').lower() == 'true'
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '0'))
+
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite'
+}
+
+# Query options of a PostgreSQL URL that asyncpg.connect accepts as they are
+ASYNCPG_QUERY_OPTIONS = {'ssl', 'passfile', 'target_session_attrs', 'prepared_statement_cache_size'}
+
+def to_async_url(url: str) -> str:
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for database '{backend}'")
+    if backend == 'postgresql':
+        # libpq's sslmode takes the same values as asyncpg's ssl; any other
+        # libpq option would make every asyncpg connection fail
+        query = dict(url.query)
+        if 'sslmode' in query:
+            query['ssl'] = query.pop('sslmode')
+        unsupported = sorted(set(query) - ASYNCPG_QUERY_OPTIONS)
+        if unsupported:
+            raise ValueError(
+                f"DATABASE_URL options {', '.join(unsupported)} are not supported by asyncpg; "
+                "set ASYNC_DATABASE_URL or DATABASE_MODE=\"sync\""
+            )
+        url = url.set(query=query)
+    return url.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+class PoolMetrics:
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connections_created = 0
+        self.peak_checked_out = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.pool = None
+        self._lock = threading.Lock()
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            if self.pool is not None:
+                self.peak_checked_out = max(self.peak_checked_out, self.pool.checkedout())
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def record_connect(self):
+        with self._lock:
+            self.connections_created += 1
+
+    def snapshot(self):
+        pool = self.pool
+        with self._lock:
+            return {
+                "pool_size": pool.size(),
+                "max_overflow": DB_MAX_OVERFLOW,
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": max(0, pool.overflow()),
+                "peak_checked_out": self.peak_checked_out,
+                "connections_created": self.connections_created,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_avg": round(self.wait_seconds_total / self.checkouts, 6) if self.checkouts else 0.0,
+                "wait_seconds_max": round(self.wait_seconds_max, 6)
+            }
+
+def instrumented_pool_class(base, metrics):
+    # Times how long each checkout waits for a free connection; pool events
+    # only fire once a connection was already handed out.
+    class InstrumentedPool(base):
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except exc.TimeoutError:
+                metrics.record_timeout()
+                raise
+            metrics.record_wait(time.perf_counter() - start)
+            return connection
+
+        def _create_connection(self):
+            metrics.record_connect()
+            return super()._create_connection()
+
+    return InstrumentedPool
+
+def engine_options(url: str, metrics: PoolMetrics, is_async: bool = False):
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        # In-memory SQLite keeps one connection per thread, there is no pool to size
+        return {}
+
+    options = {
+        "poolclass": instrumented_pool_class(AsyncAdaptedQueuePool if is_async else QueuePool, metrics),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING
+    }
+    if DB_STATEMENT_TIMEOUT_MS and url.get_backend_name() == 'postgresql':
+        if is_async:
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return options
+
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
+# The engines are created on first use, or by the warm-up in the app
+# lifespan, so importing the app does not load the database drivers.
+pool_metrics = PoolMetrics()
+async_pool_metrics = PoolMetrics() if DATABASE_MODE == 'async' else None
+
+_engine = None
+_session_factory = None
+_async_engine = None
+_async_session_factory = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    global _engine, _session_factory
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL, pool_metrics))
+                pool_metrics.pool = engine.pool
+                instrument_engine(engine)
+                _session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+                _engine = engine
+    return _engine
+
+def get_session_factory():
+    get_engine()
+    return _session_factory
+
+def get_async_engine():
+    global _async_engine, _async_session_factory
+    if _async_engine is None and DATABASE_MODE == 'async':
+        with _engine_lock:
+            if _async_engine is None:
+                async_url = os.getenv('ASYNC_DATABASE_URL') or to_async_url(DATABASE_URL)
+                async_engine = create_async_engine(async_url, **engine_options(async_url, async_pool_metrics, is_async=True))
+                async_pool_metrics.pool = async_engine.pool
+                instrument_engine(async_engine.sync_engine)
+                _async_session_factory = async_sessionmaker(async_engine, autoflush=False)
+                _async_engine = async_engine
+    return _async_engine
+
+def get_async_session_factory():
+    get_async_engine()
+    return _async_session_factory
+
+# engine, SessionLocal, async_engine and AsyncSessionLocal can still be
+# imported from this module, which creates them at that point
+LAZY_ATTRIBUTES = {
+    'engine': get_engine,
+    'SessionLocal': get_session_factory,
+    'async_engine': get_async_engine,
+    'AsyncSessionLocal': get_async_session_factory
+}
+
+def __getattr__(name):
+    if name in LAZY_ATTRIBUTES:
+        return LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def get_pool_stats():
+    stats = {"sync": pool_metrics.snapshot() if isinstance(get_engine().pool, QueuePool) else None}
+    async_engine = get_async_engine()
+    if async_engine is not None:
+        stats["async"] = async_pool_metrics.snapshot() if isinstance(async_engine.pool, QueuePool) else None
+    return stats
+
+def add_missing_columns(bind, table):
+    # The schema has no migration tool: columns added to the model later are
+    # created in place on an existing table. They must be nullable.
+    existing = {column['name'] for column in inspect(bind).get_columns(table.name)}
+    quote = bind.dialect.identifier_preparer.quote
+    added = []
+    with bind.begin() as connection:
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=bind.dialect)
+                connection.execute(text(f'ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column_type}'))
+                added.append(column.name)
+    return added
+
+def get_sync_db():
+    db = get_session_factory()()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with get_async_session_factory()() as db:
+        yield db
+
+get_db = get_async_db if DATABASE_MODE == 'async' else get_sync_db
+
+async def run_db(db, fn, *args):
+    # The data access code is written once against a regular Session. With an
+    # AsyncSession it runs through run_sync on the async driver, otherwise on
+    # the thread pool, and in neither case blocks the event loop.
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args)
+    return await run_in_threadpool(fn, db, *args)
+
+async def close_db(db):
+    if isinstance(db, AsyncSession):
+        await db.close()
+    else:
+        await run_in_threadpool(db.close)
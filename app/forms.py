@@ -0,0 +1,98 @@
+import os
+import hashlib
+
+import orjson
+
+from sqlalchemy.orm import Session
+
+from app import models
+from app.cache import TTLCache, RedisCache
+from app.schemas import FormRequest
+from app.utils import RequestError, is_form_filled, create_form_response
+
+FORM_CACHE_BACKEND = os.getenv('FORM_CACHE_BACKEND', 'memory')
+FORM_CACHE_REDIS_URL = os.getenv('FORM_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+FORM_CACHE_TTL_SECONDS = float(os.getenv('FORM_CACHE_TTL_SECONDS', '60'))
+FORM_CACHE_MAX_ENTRIES = int(os.getenv('FORM_CACHE_MAX_ENTRIES', '10000'))
+FORMS_BATCH_MAX_USERS = int(os.getenv('FORMS_BATCH_MAX_USERS', '1000'))
+# Stays below SQLite's default limit of 999 bound parameters
+FORMS_BATCH_CHUNK_SIZE = 500
+
+def create_form_cache():
+    if FORM_CACHE_BACKEND == 'redis':
+        return RedisCache(FORM_CACHE_REDIS_URL, prefix="forms", ttl=FORM_CACHE_TTL_SECONDS)
+    return TTLCache(max_entries=FORM_CACHE_MAX_ENTRIES, ttl=FORM_CACHE_TTL_SECONDS)
+
+form_cache = create_form_cache()
+
+def form_cache_key(user_id: int):
+    return f"form:{user_id}"
+
+def invalidate_form_cache(user_id: int):
+    form_cache.delete(form_cache_key(user_id))
+
+def form_etag(body: bytes):
+    # Hash of the serialized response, which is built once per cache entry
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+def form_cache_entry(content):
+    # Cached already serialized, so a hit is answered without encoding again
+    body = orjson.dumps(content)
+    return {"etag": form_etag(body), "body": body.decode()}
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+def get_form_response(db: Session, user_id: int):
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    if not user:
+        raise RequestError(404, f"User with ID {user_id} not found")
+
+    user_form = db.query(models.Form).filter(models.Form.user_id == user_id).first()
+    if not user_form:
+        return None
+    return create_form_response(user, user_form)
+
+def get_form_responses(db: Session, user_ids):
+    # One joined IN query for at most FORMS_BATCH_CHUNK_SIZE users instead of
+    # two queries per user. Users that do not exist are left out, users
+    # without a form map to None.
+    rows = {}
+    query = (
+        db.query(models.User, models.Form)
+        .outerjoin(models.Form, models.Form.user_id == models.User.id)
+        .filter(models.User.id.in_(user_ids))
+    )
+    for user, user_form in query:
+        rows.setdefault(user.id, (user, user_form))
+    return {
+        user_id: create_form_response(user, user_form) if user_form else None
+        for user_id, (user, user_form) in rows.items()
+    }
+
+def update_user_form(db: Session, user_id: int, request_form: FormRequest):
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    if not user:
+        raise RequestError(404, f"User with ID '{user_id}' not found")
+
+    request_form_dict = request_form.model_dump(exclude_unset=True)
+    if all(value is None for value in request_form_dict.values()):
+        raise RequestError(400, "Empty form")
+
+    user_form = db.query(models.Form).filter(models.Form.user_id == user_id).first()
+
+    if not user_form:
+        form_status = "Filled" if is_form_filled(request_form) else "In progress"
+        user_form = models.Form(user_id=user_id, form_status=form_status, **request_form_dict)
+        db.add(user_form)
+    else:
+        for key, value in request_form_dict.items():
+            setattr(user_form, key, value)
+        form_status = "Filled" if is_form_filled(user_form) else "In progress"
+        user_form.form_status = form_status
+    db.commit()
+    db.refresh(user_form)
+    invalidate_form_cache(user_id)
@@ -0,0 +1,94 @@
+import json
+import base64
+import binascii
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import select, func, and_, or_
+from sqlalchemy.orm import Session
+
+from app import models
+from app.lab_results import ANALYTES, ANALYTE_NAMES
+from app.utils import RequestError
+
+HISTORY_BUCKETS = ('day', 'month', 'year')
+SQLITE_BUCKET_FORMATS = {'day': '%Y-%m-%d', 'month': '%Y-%m-01', 'year': '%Y-01-01'}
+
+def encode_cursor(analyte, period):
+    return base64.urlsafe_b64encode(json.dumps([analyte, period]).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        analyte, period = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        date.fromisoformat(period)
+    except (binascii.Error, ValueError, TypeError):
+        raise RequestError(400, "Invalid cursor")
+    return analyte, period
+
+def bucket_period(db: Session, bucket):
+    test_date = models.LabResult.test_date
+    if db.get_bind().dialect.name == 'postgresql':
+        return func.to_char(func.date_trunc(bucket, test_date), 'YYYY-MM-DD')
+    return func.strftime(SQLITE_BUCKET_FORMATS[bucket], test_date)
+
+def get_history(db: Session, user_id: int, analytes, start: date = None, end: date = None, bucket='month', cursor=None, limit=500):
+    if not db.query(models.User.id).filter(models.User.id == user_id).first():
+        raise RequestError(404, f"User with ID {user_id} not found")
+    if bucket not in HISTORY_BUCKETS:
+        raise RequestError(400, f"Bucket must be one of {', '.join(HISTORY_BUCKETS)}")
+    unknown = [name for name in analytes if name not in ANALYTES]
+    if unknown:
+        raise RequestError(400, f"Unknown analyte '{unknown[0]}'")
+
+    LabResult = models.LabResult
+    filters = [
+        LabResult.user_id == user_id,
+        LabResult.analyte.in_([ANALYTES[name] for name in analytes or ANALYTES]),
+        LabResult.test_date.is_not(None)
+    ]
+    if start:
+        filters.append(LabResult.test_date >= datetime.combine(start, datetime.min.time()))
+    if end:
+        filters.append(LabResult.test_date < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+    if cursor:
+        after_analyte, after_period = decode_cursor(cursor)
+        # Skips earlier rows through the index; the bucket the cursor points
+        # at starts on after_period and is dropped again after grouping
+        filters.append(or_(
+            LabResult.analyte > after_analyte,
+            and_(LabResult.analyte == after_analyte, LabResult.test_date >= datetime.fromisoformat(after_period))
+        ))
+
+    period = bucket_period(db, bucket).label('period')
+    buckets = (
+        select(
+            LabResult.analyte,
+            period,
+            func.min(LabResult.value).label('min'),
+            func.avg(LabResult.value).label('mean'),
+            func.max(LabResult.value).label('max'),
+            func.count().label('count')
+        )
+        .where(*filters)
+        .group_by(LabResult.analyte, period)
+        .subquery()
+    )
+    query = select(buckets).order_by(buckets.c.analyte, buckets.c.period).limit(limit + 1)
+    if cursor:
+        query = query.where(or_(
+            buckets.c.analyte > after_analyte,
+            and_(buckets.c.analyte == after_analyte, buckets.c.period > after_period)
+        ))
+
+    rows = db.execute(query).all()
+    next_cursor = encode_cursor(rows[limit - 1].analyte, rows[limit - 1].period) if len(rows) > limit else None
+
+    series = {}
+    for row in rows[:limit]:
+        series.setdefault(ANALYTE_NAMES[row.analyte], []).append({
+            "period": row.period,
+            "min": float(row.min),
+            "mean": round(float(row.mean), 4),
+            "max": float(row.max),
+            "count": row.count
+        })
+    return {"bucket": bucket, "series": series, "next_cursor": next_cursor}
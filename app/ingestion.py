@@ -0,0 +1,293 @@
+from decimal import Decimal
+
+from sqlalchemy import select, insert, delete, func, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
+
+from app import models
+from app.forms import invalidate_form_cache
+from app.metrics import stage
+from app.lab_results import ANALYTES, ANALYTE_NAMES, lab_result_rows, evaluate_lab_results, format_lab_value
+from app.scraping import EXTRACTION_VERSION, get_s3_object_etags
+from app.utils import RequestError, create_form_response
+
+METRICS = ['red_blood_cell', 'hemoglobin', 'hematocrit', 'glycated_hemoglobin', 'ast', 'alt', 'urea', 'creatinine']
+
+def get_user_and_form(db: Session, user_id: int):
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    if not user:
+        raise RequestError(404, f"User with ID '{user_id}' not found")
+
+    user_form = db.query(models.Form).filter(models.Form.user_id == user_id).first()
+    if not user_form:
+        user_form = models.Form(user_id=user_id)
+        db.add(user_form)
+        db.commit()
+        db.refresh(user_form)
+    return user, user_form
+
+def get_forms_by_user_id(db: Session, user_ids):
+    forms_by_user_id = {}
+    query = (
+        db.query(models.Form)
+        .options(joinedload(models.Form.user))
+        .filter(models.Form.user_id.in_(set(user_ids)))
+        .order_by(models.Form.id)
+    )
+    for user_form in query:
+        forms_by_user_id.setdefault(user_form.user_id, user_form)
+    missing = [models.Form(user_id=user_id) for user_id in set(user_ids) - forms_by_user_id.keys()]
+    if missing:
+        db.add_all(missing)
+        db.commit()
+        forms_by_user_id.update((user_form.user_id, user_form) for user_form in missing)
+    return forms_by_user_id
+
+def get_user_tests(db: Session, user_id: int, testsIdList):
+    tests_by_id = {
+        test.id: test
+        for test in db.query(models.Test).filter(models.Test.id.in_(set(testsIdList)))
+    }
+    # Checked in request order so the first offending id is still reported
+    tests = []
+    for test_id in testsIdList:
+        test = tests_by_id.get(test_id)
+        if not test:
+            raise RequestError(404, f"Test with ID '{test_id}' not found")
+        elif test.user_id != user_id:
+            raise RequestError(400, f"Test with ID '{test_id}' is not a test of the user with ID {user_id}")
+        tests.append(test)
+    return tests
+
+def extracted_tests(tests):
+    # Tests whose PDF was already extracted with the current extractor
+    return [test for test in tests if test.content_hash and test.extractor_version == EXTRACTION_VERSION]
+
+def pending_tests(tests, current_hashes):
+    # An extracted test is skipped while its object in S3 still has the
+    # content hash (ETag) it was extracted from; current_hashes maps test ids
+    # to the ETag read now. A test repeated in the same request runs once.
+    pending = {}
+    for test in tests:
+        if test.content_hash and test.extractor_version == EXTRACTION_VERSION and current_hashes.get(test.id) == test.content_hash:
+            continue
+        pending.setdefault(test.id, test)
+    return list(pending.values())
+
+def select_pending_tests(user_id: int, tests):
+    # Only the already extracted tests need a HEAD request; the others are
+    # downloaded anyway
+    extracted = extracted_tests(tests)
+    etags = get_s3_object_etags(user_id, [test.test_name for test in extracted])
+    return pending_tests(tests, {test.id: etag for test, etag in zip(extracted, etags)})
+
+def prepare_tests_processing(db: Session, user_id: int, testsIdList):
+    user, user_form = get_user_and_form(db, user_id)
+    return user, user_form, get_user_tests(db, user_id, testsIdList)
+
+def scraping_result_rows(forms_by_user_id, tests, scraping_results):
+    # DerivedHealthData keeps the values as read from the report; LabResults
+    # gets the typed copy the latest-value and history queries run on
+    health_data = []
+    lab_results = []
+    for test, result in zip(tests, scraping_results):
+        dataScraped, dateScraped = result
+        user_form = forms_by_user_id[test.user_id]
+        test.test_date = dateScraped
+        content_hash = getattr(result, 'content_hash', None)
+        if content_hash:
+            test.content_hash = content_hash
+            test.extractor_version = EXTRACTION_VERSION
+        health_data.extend(
+            {"form_id": user_form.id, "test_id": test.id, "name": data.name, "value": data.value}
+            for data in dataScraped
+        )
+        lab_results.extend(lab_result_rows(test.user_id, test.id, dateScraped, dataScraped))
+    users_by_id = {user_id: user_form.user for user_id, user_form in forms_by_user_id.items()}
+    evaluate_lab_results(lab_results, users_by_id)
+    return health_data, lab_results
+
+def insert_scraping_results(db: Session, health_data, lab_results):
+    if health_data:
+        db.execute(insert(models.DerivedHealthData.__table__), health_data)
+    if lab_results:
+        db.execute(insert(models.LabResult.__table__), lab_results)
+
+def upsert_rows(db: Session, table, rows, index_elements):
+    # Rows of a test that is processed again overwrite the ones already
+    # stored instead of duplicating them
+    dialect = db.get_bind().dialect.name
+    if dialect == 'postgresql':
+        statement = postgresql.insert(table)
+    elif dialect == 'sqlite':
+        statement = sqlite.insert(table)
+    else:
+        db.execute(insert(table), rows)
+        return
+    statement = statement.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={
+            column.name: statement.excluded[column.name]
+            for column in table.columns
+            if not column.primary_key and column.name not in index_elements
+        }
+    )
+    db.execute(statement, rows)
+
+def delete_stale_rows(db: Session, model, key, test_ids, rows):
+    # Rows of these tests that the new extraction no longer produced
+    kept = [(row["test_id"], row[key]) for row in rows]
+    statement = delete(model).where(model.test_id.in_(test_ids))
+    if kept:
+        statement = statement.where(tuple_(model.test_id, getattr(model, key)).not_in(kept))
+    return db.execute(statement).rowcount
+
+def upsert_scraping_results(db: Session, test_ids, health_data, lab_results):
+    # A re-extraction leaves the same rows as replace_scraping_results:
+    # values still found are overwritten and the others removed. Returns
+    # whether any LabResults row was removed.
+    delete_stale_rows(db, models.DerivedHealthData, "name", test_ids, health_data)
+    removed = delete_stale_rows(db, models.LabResult, "analyte", test_ids, lab_results)
+    if health_data:
+        upsert_rows(db, models.DerivedHealthData.__table__, health_data, ['test_id', 'name'])
+    if lab_results:
+        upsert_rows(db, models.LabResult.__table__, lab_results, ['test_id', 'analyte'])
+    return removed > 0
+
+def save_scraping_results(db: Session, user_form, tests, scraping_results):
+    health_data, lab_results = scraping_result_rows({user_form.user_id: user_form}, tests, scraping_results)
+    removed = upsert_scraping_results(db, [test.id for test in tests], health_data, lab_results)
+    with stage("latest_values"):
+        if removed:
+            # A latest value may come from a removed result
+            update_latest_values(db, user_form)
+        else:
+            apply_latest_values(user_form, lab_results)
+    db.commit()
+
+def replace_scraping_results(db: Session, forms_by_user_id, tests, scraping_results):
+    # Re-extraction: the previous rows of these tests are swapped for the new
+    # ones in a single transaction
+    test_ids = [test.id for test in tests]
+    health_data, lab_results = scraping_result_rows(forms_by_user_id, tests, scraping_results)
+    db.execute(delete(models.DerivedHealthData).where(models.DerivedHealthData.test_id.in_(test_ids)))
+    db.execute(delete(models.LabResult).where(models.LabResult.test_id.in_(test_ids)))
+    insert_scraping_results(db, health_data, lab_results)
+    db.commit()
+
+def get_latest_results(db: Session, user_id: int):
+    LabResult = models.LabResult
+    order_by = (LabResult.test_date.desc().nulls_last(), LabResult.id.desc())
+    filters = (
+        LabResult.user_id == user_id,
+        LabResult.analyte.in_([ANALYTES[metric] for metric in METRICS])
+    )
+
+    if db.get_bind().dialect.name == 'postgresql':
+        query = (
+            select(LabResult.analyte, LabResult.value, LabResult.test_date)
+            .where(*filters)
+            .distinct(LabResult.analyte)
+            .order_by(LabResult.analyte, *order_by)
+        )
+    else:
+        ranked = (
+            select(
+                LabResult.analyte,
+                LabResult.value,
+                LabResult.test_date,
+                func.row_number().over(partition_by=LabResult.analyte, order_by=order_by).label('position')
+            )
+            .where(*filters)
+            .subquery()
+        )
+        query = select(ranked.c.analyte, ranked.c.value, ranked.c.test_date).where(ranked.c.position == 1)
+
+    return {
+        ANALYTE_NAMES[analyte]: (format_lab_value(value), test_date)
+        for analyte, value, test_date in db.execute(query)
+    }
+
+def get_latest_values(db: Session, user_id: int):
+    latest_values = dict.fromkeys(METRICS)
+    for metric, (value, _) in get_latest_results(db, user_id).items():
+        latest_values[metric] = value
+    return latest_values
+
+def apply_latest_values(user_form, lab_results):
+    # Incremental: only the results just saved are compared with the latest
+    # value of their metric, by test date. A dated result wins over the
+    # undated ones, and on the same date the last result saved wins.
+    changed = False
+    for row in lab_results:
+        metric = ANALYTE_NAMES[row["analyte"]]
+        if row["user_id"] != user_form.user_id or metric not in METRICS:
+            continue
+        test_date = row["test_date"]
+        latest_date = getattr(user_form, f'latest_{metric}_date')
+        if latest_date is None or (test_date is not None and test_date >= latest_date):
+            # Rounded and formatted like the Numeric(12, 4) column reads back
+            # in a rebuild, so "12.0" is stored as "12" by both
+            setattr(user_form, f'latest_{metric}', format_lab_value(round(Decimal(str(row["value"])), 4)))
+            setattr(user_form, f'latest_{metric}_date', test_date)
+            changed = True
+
+    if changed and user_form.form_status != "Filled":
+        user_form.form_status = "In progress"
+    return changed
+
+def update_latest_values(db: Session, user_form):
+    # Full rebuild from every stored result of the user, for re-extractions
+    # and the admin rebuild; ingestion uses apply_latest_values. Metrics
+    # without any stored result left are cleared.
+    latest_results = get_latest_results(db, user_form.user_id)
+    for metric in METRICS:
+        value, test_date = latest_results.get(metric, (None, None))
+        setattr(user_form, f'latest_{metric}', value)
+        setattr(user_form, f'latest_{metric}_date', test_date)
+
+    if latest_results:
+        user_form.form_status = "In progress" if user_form.form_status != "Filled" else user_form.form_status
+    db.commit()
+    db.refresh(user_form)
+    return {metric: value for metric, (value, _) in latest_results.items()}
+
+def duplicated_test_upload(user_id: int, filename: str):
+    return RequestError(409, f"The user with ID {user_id} already has a test named '{filename}'")
+
+def prepare_test_upload(db: Session, user_id: int, filename: str):
+    user, user_form = get_user_and_form(db, user_id)
+    existing = db.query(models.Test.id).filter(models.Test.user_id == user_id, models.Test.test_name == filename).first()
+    if existing:
+        raise duplicated_test_upload(user_id, filename)
+    return user, user_form
+
+def reserve_test_upload(db: Session, user_id: int, filename: str, url: str):
+    # Committed before the PDF is written to S3: of two uploads of the same
+    # name, the unique (user_id, test_name) index lets only one go on
+    test = models.Test(user_id=user_id, test_name=filename, url=url)
+    db.add(test)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise duplicated_test_upload(user_id, filename)
+    return test.id
+
+def cancel_test_upload(db: Session, test_id: int):
+    db.rollback()
+    db.execute(delete(models.DerivedHealthData).where(models.DerivedHealthData.test_id == test_id))
+    db.execute(delete(models.LabResult).where(models.LabResult.test_id == test_id))
+    db.execute(delete(models.Test).where(models.Test.id == test_id))
+    db.commit()
+
+def finish_test_upload(db: Session, user, user_form, test_id: int, scraping_result):
+    test = db.get(models.Test, test_id)
+    return finish_tests_processing(db, user, user_form, [test], [scraping_result])
+
+def finish_tests_processing(db: Session, user, user_form, tests, scraping_results):
+    with stage("save_results"):
+        save_scraping_results(db, user_form, tests, scraping_results)
+    invalidate_form_cache(user.id)
+    return create_form_response(user, user_form)
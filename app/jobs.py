@@ -0,0 +1,212 @@
+import os
+import json
+import queue
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from app import scraping
+from app.database import get_session_factory
+from app.ingestion import get_user_and_form, get_user_tests, select_pending_tests, finish_tests_processing
+from app.utils import RequestError, create_redis_client
+
+logger = logging.getLogger(__name__)
+
+JOBS_BACKEND = os.getenv('JOBS_BACKEND', 'memory')
+JOBS_REDIS_URL = os.getenv('JOBS_REDIS_URL', 'redis://localhost:6379/0')
+JOBS_WORKERS = int(os.getenv('JOBS_WORKERS', '2'))
+JOBS_TTL_SECONDS = int(os.getenv('JOBS_TTL_SECONDS', '86400'))
+
+FINISHED_STATES = ("completed", "failed")
+
+class InMemoryJobBackend:
+    # Finished jobs are forgotten JOBS_TTL_SECONDS after they finish, as
+    # Redis expires them, so their results do not pile up in the process
+    def __init__(self, ttl=JOBS_TTL_SECONDS, clock=time.monotonic):
+        self._jobs = {}
+        # Finished job ids in the order they expire
+        self._expiries = OrderedDict()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._ttl = ttl
+        self._clock = clock
+
+    def _prune(self):
+        now = self._clock()
+        while self._expiries:
+            job_id, expires_at = next(iter(self._expiries.items()))
+            if expires_at > now:
+                break
+            del self._expiries[job_id]
+            self._jobs.pop(job_id, None)
+
+    def _track(self, job):
+        if job["state"] in FINISHED_STATES:
+            self._expiries.pop(job["id"], None)
+            self._expiries[job["id"]] = self._clock() + self._ttl
+
+    def save(self, job):
+        with self._lock:
+            self._prune()
+            self._jobs[job["id"]] = dict(job)
+            self._track(job)
+
+    def get(self, job_id):
+        with self._lock:
+            self._prune()
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+                self._track(job)
+
+    def enqueue(self, job_id):
+        self._queue.put(job_id)
+
+    def dequeue(self, timeout):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class RedisJobBackend:
+    # Job state and the pending queue live in Redis, so any API replica can
+    # accept a job and any replica's workers can pick it up.
+    def __init__(self, url, prefix="jobs", ttl=JOBS_TTL_SECONDS, client=None):
+        self._redis = client if client is not None else create_redis_client(url, "JOBS_BACKEND")
+        self._prefix = prefix
+        self._ttl = ttl
+
+    def _key(self, job_id):
+        return f"{self._prefix}:{job_id}"
+
+    def save(self, job):
+        self._redis.set(self._key(job["id"]), json.dumps(job), ex=self._ttl)
+
+    def get(self, job_id):
+        raw = self._redis.get(self._key(job_id))
+        return json.loads(raw) if raw else None
+
+    def update(self, job_id, **fields):
+        # Only the worker that dequeued a job writes to it, so a plain
+        # read-modify-write is enough.
+        job = self.get(job_id)
+        if job is not None:
+            job.update(fields)
+            self.save(job)
+
+    def enqueue(self, job_id):
+        self._redis.rpush(f"{self._prefix}:queue", job_id)
+
+    def dequeue(self, timeout):
+        item = self._redis.blpop([f"{self._prefix}:queue"], timeout=max(1, int(timeout)))
+        if not item:
+            return None
+        job_id = item[1]
+        return job_id.decode() if isinstance(job_id, bytes) else job_id
+
+class JobQueue:
+    def __init__(self, backend, session_factory=None, workers=JOBS_WORKERS):
+        self.backend = backend
+        self.session_factory = session_factory
+        self.workers = workers
+        self._threads = []
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._threads:
+                return
+            self._stop.clear()
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"jobs-worker-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def submit(self, user_id: int, testsIdList):
+        now = datetime.utcnow().isoformat()
+        job = {
+            "id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "tests": list(testsIdList),
+            "state": "queued",
+            "total": len(testsIdList),
+            "processed": 0,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now
+        }
+        self.backend.save(job)
+        self.backend.enqueue(job["id"])
+        self.start()
+        return job
+
+    def get(self, job_id: str):
+        return self.backend.get(job_id)
+
+    def _update(self, job_id, **fields):
+        self.backend.update(job_id, updated_at=datetime.utcnow().isoformat(), **fields)
+
+    def _work(self):
+        while not self._stop.is_set():
+            job_id = self.backend.dequeue(timeout=1)
+            if job_id is None:
+                continue
+            job = self.backend.get(job_id)
+            if job is not None:
+                self.run(job)
+
+    def run(self, job):
+        job_id = job["id"]
+        user_id = job["user_id"]
+        db = (self.session_factory or get_session_factory())()
+        try:
+            user, user_form = get_user_and_form(db, user_id)
+            requested = get_user_tests(db, user_id, job["tests"])
+            tests = select_pending_tests(user_id, requested)
+            self._update(job_id, state="running")
+
+            scraping_results = [None] * len(tests)
+            processed = len(requested) - len(tests)
+            for index, result in scraping.data_scraping_as_completed(user_id, [test.test_name for test in tests]):
+                scraping_results[index] = result
+                processed += 1
+                self._update(job_id, processed=processed)
+
+            form_response = finish_tests_processing(db, user, user_form, tests, scraping_results)
+            self._update(job_id, state="completed", result=form_response)
+        except RequestError as e:
+            self._update(job_id, state="failed", error=e.message)
+        except Exception:
+            logger.exception("Error while processing job '%s'", job_id)
+            self._update(job_id, state="failed", error=f"Error while processing the tests of user with ID '{user_id}'")
+        finally:
+            db.close()
+
+def create_job_backend():
+    if JOBS_BACKEND == 'redis':
+        return RedisJobBackend(JOBS_REDIS_URL)
+    return InMemoryJobBackend()
+
+_job_queue = None
+
+def get_job_queue():
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue(create_job_backend())
+    return _job_queue
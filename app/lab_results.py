@@ -0,0 +1,292 @@
+import sys
+import logging
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+import numpy as np
+from sqlalchemy import select, insert, update, exists
+from sqlalchemy.orm import Session
+
+from app import models
+from app.scraping import ANALYTE_PATTERNS, DataScraped
+
+logger = logging.getLogger(__name__)
+
+# Stored in LabResults.analyte: never renumber, only append
+ANALYTES = {
+    'red_blood_cell': 1,
+    'hemoglobin': 2,
+    'hematocrit': 3,
+    'glycated_hemoglobin': 4,
+    'ast': 5,
+    'alt': 6,
+    'urea': 7,
+    'creatinine': 8
+}
+ANALYTE_NAMES = {code: name for name, code in ANALYTES.items()}
+
+BACKFILL_BATCH_SIZE = 500
+EVALUATION_BATCH_SIZE = 5000
+
+# Values are stored in these units; UNIT_CONVERSIONS maps the other units
+# labs report to them as canonical = value * factor + offset. Unit keys are
+# lower case with "u" for micro.
+CANONICAL_UNITS = {
+    'red_blood_cell': 'milhões/mm3',
+    'hemoglobin': 'g/dL',
+    'hematocrit': '%',
+    'glycated_hemoglobin': '%',
+    'ast': 'U/L',
+    'alt': 'U/L',
+    'urea': 'mg/dL',
+    'creatinine': 'mg/dL'
+}
+UNIT_CONVERSIONS = {
+    ('red_blood_cell', '10^12/l'): (1.0, 0.0),
+    ('red_blood_cell', '10^6/ul'): (1.0, 0.0),
+    ('hemoglobin', 'g/l'): (0.1, 0.0),
+    ('hemoglobin', 'mmol/l'): (1.611, 0.0),
+    ('hematocrit', 'l/l'): (100.0, 0.0),
+    ('glycated_hemoglobin', 'mmol/mol'): (0.09148, 2.152),
+    ('ast', 'ukat/l'): (60.0, 0.0),
+    ('alt', 'ukat/l'): (60.0, 0.0),
+    ('urea', 'mmol/l'): (6.006, 0.0),
+    ('creatinine', 'umol/l'): (1 / 88.42, 0.0)
+}
+
+# (analyte, sex, from age, low, high) in canonical units; sex None applies
+# to both. A range holds from its age up to the next range's age.
+ADULT_AGE = 18
+REFERENCE_RANGES = [
+    ('red_blood_cell', None, 0, 4.0, 5.2),
+    ('red_blood_cell', 'M', ADULT_AGE, 4.5, 5.9),
+    ('red_blood_cell', 'F', ADULT_AGE, 4.1, 5.1),
+    ('hemoglobin', None, 0, 11.5, 15.5),
+    ('hemoglobin', 'M', ADULT_AGE, 13.5, 17.5),
+    ('hemoglobin', 'F', ADULT_AGE, 12.0, 15.5),
+    ('hematocrit', None, 0, 35.0, 45.0),
+    ('hematocrit', 'M', ADULT_AGE, 41.0, 53.0),
+    ('hematocrit', 'F', ADULT_AGE, 36.0, 46.0),
+    ('glycated_hemoglobin', None, 0, 4.0, 5.6),
+    ('ast', None, 0, 0.0, 50.0),
+    ('ast', 'M', ADULT_AGE, 0.0, 40.0),
+    ('ast', 'F', ADULT_AGE, 0.0, 32.0),
+    ('alt', None, 0, 0.0, 45.0),
+    ('alt', 'M', ADULT_AGE, 0.0, 41.0),
+    ('alt', 'F', ADULT_AGE, 0.0, 33.0),
+    ('urea', None, 0, 10.0, 40.0),
+    ('urea', None, ADULT_AGE, 15.0, 45.0),
+    ('creatinine', None, 0, 0.3, 0.7),
+    ('creatinine', 'M', ADULT_AGE, 0.7, 1.3),
+    ('creatinine', 'F', ADULT_AGE, 0.6, 1.1)
+]
+
+FLAG_LOW = -1
+FLAG_NORMAL = 0
+FLAG_HIGH = 1
+
+SEXES = {None: 0, 'M': 1, 'F': 2}
+AGE_BANDS = np.array([0, ADULT_AGE])
+
+def build_range_table():
+    # LOW/HIGH[analyte, sex, age band]; the unknown sex gets the union of the
+    # male and female ranges when no range applies to both
+    shape = (max(ANALYTES.values()) + 1, len(SEXES), len(AGE_BANDS))
+    low = np.full(shape, np.nan)
+    high = np.full(shape, np.nan)
+    for sexes in ((None,), ('M', 'F')):
+        for name, sex, from_age, range_low, range_high in REFERENCE_RANGES:
+            if sex not in sexes:
+                continue
+            bands = slice(int(np.searchsorted(AGE_BANDS, from_age)), None)
+            for sex_index in ([0, 1, 2] if sex is None else [SEXES[sex]]):
+                low[ANALYTES[name], sex_index, bands] = range_low
+                high[ANALYTES[name], sex_index, bands] = range_high
+    for name, sex, from_age, _, _ in REFERENCE_RANGES:
+        if sex is not None:
+            bands = slice(int(np.searchsorted(AGE_BANDS, from_age)), None)
+            analyte = ANALYTES[name]
+            low[analyte, 0, bands] = np.fmin(low[analyte, 1, bands], low[analyte, 2, bands])
+            high[analyte, 0, bands] = np.fmax(high[analyte, 1, bands], high[analyte, 2, bands])
+    return low, high
+
+RANGE_LOW, RANGE_HIGH = build_range_table()
+
+def parse_lab_value(value):
+    try:
+        number = Decimal(value)
+    except (InvalidOperation, TypeError):
+        return None
+    return number if number.is_finite() else None
+
+def format_lab_value(number):
+    # Numeric columns come back with the column scale (14.5000), which is
+    # dropped along with every other trailing zero: a report's "12,0" is
+    # shown as "12", not as written, and converted units differ from it too
+    text = format(number, 'f')
+    return text.rstrip('0').rstrip('.') if '.' in text else text
+
+def unit_key(unit):
+    return unit.strip().replace('µ', 'u').replace('μ', 'u').lower() if unit else None
+
+def lab_result_rows(user_id, test_id, test_date, data_scraped):
+    # Raw rows, in the unit of the report; evaluate_lab_results normalizes
+    # and flags a whole batch of them at once
+    rows = []
+    for data in data_scraped:
+        analyte = ANALYTES.get(data.name)
+        value = parse_lab_value(data.value)
+        if analyte is None or value is None:
+            continue
+        rows.append({
+            "user_id": user_id,
+            "test_id": test_id,
+            "analyte": analyte,
+            "value": value,
+            "unit": getattr(data, 'unit', None) or ANALYTE_PATTERNS[data.name][2],
+            "test_date": test_date,
+            "flag": None
+        })
+    return rows
+
+def unit_conversion(name, unit):
+    key = unit_key(unit)
+    if key == unit_key(CANONICAL_UNITS[name]):
+        return 1.0, 0.0
+    return UNIT_CONVERSIONS.get((name, key), (np.nan, 0.0))
+
+def normalize_units(analytes, values, units):
+    # Each distinct (analyte, unit) pair is looked up once, then every value
+    # is converted with array operations; unknown units are left as they are
+    pairs = {}
+    pair_indexes = np.fromiter(
+        (pairs.setdefault((analyte, unit), len(pairs)) for analyte, unit in zip(analytes.tolist(), units)),
+        dtype=np.intp, count=len(units)
+    )
+    conversions = np.array(
+        [unit_conversion(ANALYTE_NAMES[analyte], unit) for analyte, unit in pairs] or np.empty((0, 2)),
+        dtype=float
+    ).reshape(-1, 2)
+    factors = conversions[pair_indexes, 0]
+    known = ~np.isnan(factors)
+    normalized = np.where(known, values * np.nan_to_num(factors) + conversions[pair_indexes, 1], values)
+    return normalized, known
+
+def reference_flags(analytes, values, sexes, ages):
+    # analytes/sexes are codes, ages in years (NaN when unknown, read as adult)
+    bands = np.searchsorted(AGE_BANDS, np.nan_to_num(ages, nan=ADULT_AGE), side='right') - 1
+    low = RANGE_LOW[analytes, sexes, bands]
+    high = RANGE_HIGH[analytes, sexes, bands]
+    flags = np.where(values < low, FLAG_LOW, np.where(values > high, FLAG_HIGH, FLAG_NORMAL)).astype(np.int8)
+    return flags, ~(np.isnan(low) | np.isnan(high))
+
+def evaluate_lab_results(rows, users_by_id):
+    # Fills value (canonical unit), unit and flag of every row in one pass.
+    # Python only touches each row to read it and to write the result back.
+    if not rows:
+        return rows
+    count = len(rows)
+    user_ids = list(users_by_id)
+    user_indexes = {user_id: index for index, user_id in enumerate(user_ids)}
+    users = [users_by_id[user_id] for user_id in user_ids]
+    user_sexes = np.array([SEXES.get(getattr(user, 'biological_sex', None), 0) for user in users] + [0], dtype=np.intp)
+    user_births = np.array([
+        user.birth_date.toordinal() if getattr(user, 'birth_date', None) else np.nan for user in users
+    ] + [np.nan])
+
+    today = date.today().toordinal()
+    analytes = np.fromiter((row["analyte"] for row in rows), dtype=np.intp, count=count)
+    values = np.fromiter((float(row["value"]) for row in rows), dtype=float, count=count)
+    row_users = np.fromiter((user_indexes.get(row["user_id"], -1) for row in rows), dtype=np.intp, count=count)
+    test_days = np.fromiter(
+        (row["test_date"].toordinal() if row["test_date"] else today for row in rows),
+        dtype=float, count=count
+    )
+    ages = (test_days - user_births[row_users]) / 365.2425
+
+    normalized, known_units = normalize_units(analytes, values, [row["unit"] for row in rows])
+    flags, known_ranges = reference_flags(analytes, normalized, user_sexes[row_users], ages)
+    evaluated = (known_units & known_ranges).tolist()
+    for row, value, known_unit, flag, is_evaluated in zip(rows, normalized.round(4).tolist(), known_units.tolist(), flags.tolist(), evaluated):
+        if known_unit:
+            row["value"] = value
+            row["unit"] = CANONICAL_UNITS[ANALYTE_NAMES[row["analyte"]]]
+        row["flag"] = flag if is_evaluated else None
+    return rows
+
+def get_users_by_id(db: Session, user_ids):
+    return {
+        user.id: user
+        for user in db.query(models.User).filter(models.User.id.in_(set(user_ids)))
+    }
+
+def backfill_lab_results(db: Session, batch_size=BACKFILL_BATCH_SIZE):
+    # Walks Tests by id and copies the string rows of every test that has no
+    # typed rows yet, so it can be stopped and run again at any time.
+    last_test_id = 0
+    copied = 0
+    while True:
+        tests = db.execute(
+            select(models.Test.id, models.Test.user_id, models.Test.test_date)
+            .where(models.Test.id > last_test_id)
+            .where(~exists().where(models.LabResult.test_id == models.Test.id))
+            .order_by(models.Test.id)
+            .limit(batch_size)
+        ).all()
+        if not tests:
+            return copied
+        last_test_id = tests[-1].id
+
+        data_by_test = {}
+        for test_id, name, value in db.execute(
+            select(models.DerivedHealthData.test_id, models.DerivedHealthData.name, models.DerivedHealthData.value)
+            .where(models.DerivedHealthData.test_id.in_([test.id for test in tests]))
+            .order_by(models.DerivedHealthData.id)
+        ):
+            data_by_test.setdefault(test_id, []).append(DataScraped(name, value))
+
+        rows = []
+        for test in tests:
+            rows.extend(lab_result_rows(test.user_id, test.id, test.test_date, data_by_test.get(test.id, [])))
+        evaluate_lab_results(rows, get_users_by_id(db, [test.user_id for test in tests]))
+        if rows:
+            db.execute(insert(models.LabResult.__table__), rows)
+        db.commit()
+        copied += len(rows)
+        logger.info("Copied %d lab results up to test %d", copied, last_test_id)
+
+def evaluate_stored_lab_results(db: Session, batch_size=EVALUATION_BATCH_SIZE):
+    # Normalizes and flags rows written before the flag existed, thousands at
+    # a time. Rows without a known unit or range stay unflagged.
+    LabResult = models.LabResult
+    last_id = 0
+    evaluated = 0
+    while True:
+        stored = db.execute(
+            select(LabResult.id, LabResult.user_id, LabResult.analyte, LabResult.value, LabResult.unit, LabResult.test_date)
+            .where(LabResult.id > last_id, LabResult.flag.is_(None))
+            .order_by(LabResult.id)
+            .limit(batch_size)
+        ).all()
+        if not stored:
+            return evaluated
+        last_id = stored[-1].id
+
+        rows = [row._asdict() for row in stored]
+        evaluate_lab_results(rows, get_users_by_id(db, [row["user_id"] for row in rows]))
+        db.execute(update(LabResult), [
+            {"id": row["id"], "value": row["value"], "unit": row["unit"], "flag": row["flag"]}
+            for row in rows
+        ])
+        db.commit()
+        evaluated += sum(row["flag"] is not None for row in rows)
+        logger.info("Evaluated %d lab results up to %d", evaluated, last_id)
+
+def main():
+    # Kept for existing deployments; the whole schema is migrated by app.migrate
+    from app.migrate import main as migrate_main
+
+    return migrate_main()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+import re
+import json
+import hashlib
+
+TOKEN_REGEX = re.compile(r'\w+')
+
+def fingerprint_tokens(text):
+    return {token.upper() for token in TOKEN_REGEX.findall(text)}
+
+class Layout:
+    def __init__(self, name, analyte_patterns, date_pattern, fingerprints, engine):
+        self.name = name
+        self.analyte_patterns = analyte_patterns
+        self.date_pattern = date_pattern
+        self.fingerprints = frozenset(token for keyword in fingerprints for token in fingerprint_tokens(keyword))
+        self.engine = engine
+
+    def definition(self):
+        return [self.name, self.analyte_patterns, self.date_pattern, sorted(self.fingerprints)]
+
+class LayoutRegistry:
+    # A layout is picked when every token of its fingerprints appears in the
+    # first page; the most specific match wins and the default layout is used
+    # when nothing matches. The first page is tokenized once and each token
+    # is looked up in an index, so detection does not try layout after layout.
+    def __init__(self, engine_factory, fingerprint_chars=4000):
+        self.engine_factory = engine_factory
+        self.fingerprint_chars = fingerprint_chars
+        self.layouts = []
+        self.default = None
+        self._layouts_by_token = {}
+
+    def register(self, name, analyte_patterns, date_pattern, fingerprints=(), default=False):
+        if any(layout.name == name for layout in self.layouts):
+            raise ValueError(f"Layout '{name}' is already registered")
+        layout = Layout(name, analyte_patterns, date_pattern, fingerprints, self.engine_factory(analyte_patterns, date_pattern))
+        layout.position = len(self.layouts)
+        if not layout.fingerprints and not default:
+            raise ValueError(f"Layout '{name}' needs at least one fingerprint")
+        self.layouts.append(layout)
+        for token in layout.fingerprints:
+            self._layouts_by_token.setdefault(token, []).append(layout)
+        if default:
+            self.default = layout
+        return layout
+
+    def detect(self, text):
+        matched_tokens = {}
+        for token in fingerprint_tokens(text[:self.fingerprint_chars]):
+            for layout in self._layouts_by_token.get(token, ()):
+                matched_tokens[layout] = matched_tokens.get(layout, 0) + 1
+
+        matched = [layout for layout, count in matched_tokens.items() if count == len(layout.fingerprints)]
+        if not matched:
+            return self.default
+        # Ties go to the layout registered first
+        return max(matched, key=lambda layout: (len(layout.fingerprints), -layout.position))
+
+    def version(self):
+        definitions = [layout.definition() for layout in self.layouts]
+        return hashlib.sha256(json.dumps(definitions, ensure_ascii=False).encode()).hexdigest()[:12]
+
+def load_layouts(registry, path):
+    # [{"name": ..., "fingerprints": [...], "date_pattern": ...,
+    #   "analytes": {"hemoglobin": [header, value_pattern, unit], ...}}, ...]
+    with open(path, encoding='utf-8') as file:
+        definitions = json.load(file)
+    for definition in definitions:
+        registry.register(
+            definition["name"],
+            {name: tuple(pattern) for name, pattern in definition["analytes"].items()},
+            definition["date_pattern"],
+            definition["fingerprints"]
+        )
+    return registry
@@ -1,8 +1,26 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import data
+from fastapi.responses import ORJSONResponse
+from .jobs import get_job_queue
+from .metrics import MetricsMiddleware
+from .scraping import shutdown_extraction_pool
+from .warmup import warm_up
+from .routers import admin, data, monitoring
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    job_queue = get_job_queue()
+    job_queue.start()
+    warm_up_task = asyncio.create_task(warm_up())
+    yield
+    warm_up_task.cancel()
+    job_queue.stop()
+    shutdown_extraction_pool()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 origins = [
     "http://localhost:5173",
@@ -17,7 +35,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(data.router)
+app.include_router(monitoring.router)
+app.include_router(admin.router)
 
 @app.get("/")
 def read_root():
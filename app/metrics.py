@@ -0,0 +1,191 @@
+import os
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+# Stages are also exported as OpenTelemetry spans when the SDK is installed
+# and configured by the deployment
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'false').lower() == 'true'
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BYTES_BUCKETS = tuple(1024 * 4 ** exponent for exponent in range(10))
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+REGISTRY = []
+
+class Histogram:
+    # Same text exposition as prometheus_client, without the dependency.
+    # Every uvicorn worker keeps its own series, labelled with its pid.
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, *labelvalues):
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def expose(self, pid):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(labelvalues, list(counts), total, count) for labelvalues, (counts, total, count) in self._series.items()]
+        for labelvalues, counts, total, count in sorted(series):
+            labels = [f'{name}="{value}"' for name, value in zip(self.labelnames, labelvalues)] + [f'pid="{pid}"']
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                bucket_labels = ",".join(labels + [f'le="{le}"'])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+            series_labels = ",".join(labels)
+            lines.append(f"{self.name}_sum{{{series_labels}}} {total}")
+            lines.append(f"{self.name}_count{{{series_labels}}} {count}")
+        return lines
+
+REQUEST_DURATION = Histogram('http_request_duration_seconds', 'Duration of HTTP requests', ('method', 'route'))
+STAGE_DURATION = Histogram('stage_duration_seconds', 'Duration of each processing stage', ('stage',))
+PDF_BYTES = Histogram('pdf_bytes', 'Size of the downloaded PDFs', buckets=BYTES_BUCKETS)
+PDF_PAGES = Histogram('pdf_pages', 'Pages read from each PDF', buckets=COUNT_BUCKETS)
+DB_QUERIES = Histogram('db_queries_per_request', 'Database queries run by each HTTP request', ('route',), buckets=COUNT_BUCKETS)
+
+def render_metrics():
+    pid = os.getpid()
+    lines = []
+    for histogram in REGISTRY:
+        lines.extend(histogram.expose(pid))
+    return "\n".join(lines) + "\n"
+
+class RequestTimings:
+    # Shared by the request and the worker threads it starts, so the stages
+    # of files scraped in parallel add up (and may exceed the total)
+    def __init__(self):
+        self.stages = {}
+        self.queries = 0
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_query(self, seconds):
+        with self._lock:
+            self.queries += 1
+            self.stages['db'] = self.stages.get('db', 0.0) + seconds
+
+    def server_timing(self, total):
+        with self._lock:
+            entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+            if self.queries:
+                entries.append(f'db_queries;desc="{self.queries}"')
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+current_timings = contextvars.ContextVar('current_timings', default=None)
+
+_tracer = None
+
+def get_tracer():
+    global _tracer
+    if _tracer is None:
+        from opentelemetry import trace
+        _tracer = trace.get_tracer('app')
+    return _tracer
+
+def record_stage(name, seconds):
+    if not METRICS_ENABLED:
+        return
+    STAGE_DURATION.observe(seconds, name)
+    timings = current_timings.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+@contextmanager
+def stage(name):
+    if not METRICS_ENABLED:
+        yield
+        return
+    span = get_tracer().start_as_current_span(name) if TRACING_ENABLED else None
+    if span is not None:
+        span.__enter__()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+        if span is not None:
+            span.__exit__(None, None, None)
+
+def record_pdf(size, pages):
+    if METRICS_ENABLED:
+        PDF_BYTES.observe(size)
+        PDF_PAGES.observe(pages)
+
+def bind_current_context(fn):
+    # loop.run_in_executor does not carry contextvars into the thread
+    context = contextvars.copy_context()
+    return lambda *args: context.run(fn, *args)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the execution context: it is dropped with the statement, so a
+    # statement that raises (no after_cursor_execute) leaves nothing behind
+    context._query_start = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = context._query_start
+    timings = current_timings.get()
+    if timings is not None:
+        timings.add_query(time.perf_counter() - start)
+
+def instrument_engine(sync_engine):
+    if METRICS_ENABLED:
+        event.listen(sync_engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(sync_engine, 'after_cursor_execute', _after_cursor_execute)
+
+class MetricsMiddleware:
+    # Plain ASGI middleware: the timings are created before the route runs
+    # and written as Server-Timing when the response headers go out
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message['type'] == 'http.response.start':
+                header = timings.server_timing(time.perf_counter() - start).encode('latin-1')
+                message['headers'] = list(message.get('headers', [])) + [(b'server-timing', header)]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_timings.reset(token)
+            route = scope.get('route')
+            route_path = getattr(route, 'path', 'unmatched')
+            REQUEST_DURATION.observe(time.perf_counter() - start, scope['method'], route_path)
+            DB_QUERIES.observe(timings.queries, route_path)
@@ -0,0 +1,77 @@
+import sys
+import logging
+
+from sqlalchemy import select, delete, func, inspect
+from sqlalchemy.exc import IntegrityError
+
+from app import models
+from app.admin import rebuild_latest_values
+from app.database import Base, get_engine, get_session_factory, add_missing_columns
+from app.lab_results import backfill_lab_results, evaluate_stored_lab_results
+
+logger = logging.getLogger(__name__)
+
+# Tables whose rows are unique per test; duplicates left by earlier retries
+# must be removed before the unique index can be created
+UNIQUE_PER_TEST = [
+    (models.DerivedHealthData, 'uq_derived_health_data_test_id_name', ('test_id', 'name')),
+    (models.LabResult, 'uq_lab_results_test_id_analyte', ('test_id', 'analyte')),
+]
+
+def remove_duplicates(bind, model, columns):
+    # The most recent row (highest id) of each group is kept
+    keep = select(func.max(model.id)).group_by(*(getattr(model, column) for column in columns))
+    with bind.begin() as connection:
+        result = connection.execute(delete(model).where(model.id.not_in(keep.scalar_subquery())))
+    return result.rowcount
+
+def index_names(bind, table):
+    return {index['name'] for index in inspect(bind).get_indexes(table.name)}
+
+def create_missing_indexes(bind):
+    # create_all skips the tables that already exist, so every index declared
+    # on the models is created here when the database does not have it yet.
+    # Indexes limited to another dialect with ddl_if are not created.
+    removed = 0
+    created = []
+    unique_per_test = {index_name: (model, columns) for model, index_name, columns in UNIQUE_PER_TEST}
+    for table in Base.metadata.sorted_tables:
+        existing = index_names(bind, table)
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name in existing:
+                continue
+            if index.name in unique_per_test:
+                removed += remove_duplicates(bind, *unique_per_test[index.name])
+            try:
+                index.create(bind=bind)
+            except IntegrityError:
+                # Other duplicates, such as two tests of a user with the same
+                # name, cannot be removed automatically
+                logger.warning("Could not create %s: the table has duplicated rows, remove them and run again", index.name)
+                continue
+            existing = index_names(bind, table)
+            if index.name in existing:
+                created.append(index.name)
+                logger.info("Created %s", index.name)
+    return created, removed
+
+def migrate(bind):
+    Base.metadata.create_all(bind=bind, checkfirst=True)
+    added = []
+    for table in Base.metadata.sorted_tables:
+        added.extend(f'{table.name}.{column}' for column in add_missing_columns(bind, table))
+    created, removed = create_missing_indexes(bind)
+    return added, created, removed
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    added, created, removed = migrate(get_engine())
+    with get_session_factory()() as db:
+        copied = backfill_lab_results(db)
+        evaluated = evaluate_stored_lab_results(db)
+        rebuilt = rebuild_latest_values(db, only_missing=True)
+    print(f"Added {len(added)} columns and {len(created)} indexes, removed {removed} duplicated results, copied {copied} lab results, flagged {evaluated}, rebuilt {rebuilt} forms")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Date, Boolean, ForeignKey, TIMESTAMP, CheckConstraint, func
+from sqlalchemy import Column, String, Integer, SmallInteger, Numeric, Date, Boolean, ForeignKey, TIMESTAMP, CheckConstraint, Index, func
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -42,9 +42,19 @@ class Test(Base):
     url = Column(String(400), nullable=False)
     test_date = Column(TIMESTAMP, nullable=True, default=None)
     submission_date = Column(TIMESTAMP, server_default=func.current_timestamp())
+    # S3 ETag of the PDF and EXTRACTION_VERSION its results were extracted
+    # with; while both are set and current, processing the test is skipped
+    content_hash = Column(String(64), nullable=True)
+    extractor_version = Column(String(32), nullable=True)
 
     user = relationship("User", back_populates="tests")
 
+    __table_args__ = (
+        Index('ix_tests_user_id_test_date', 'user_id', 'test_date'),
+        # One PDF per S3 key {user_id}/{test_name}
+        Index('uq_tests_user_id_test_name', 'user_id', 'test_name', unique=True),
+    )
+
 class Form(Base):
     __tablename__ = 'Forms'
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -69,6 +79,16 @@ class Form(Base):
     latest_alt = Column(String(255))
     latest_urea = Column(String(255))
     latest_creatinine = Column(String(255))
+    # Test date of each latest value; a new result only replaces the value
+    # when its test is at least as recent
+    latest_red_blood_cell_date = Column(TIMESTAMP, nullable=True)
+    latest_hemoglobin_date = Column(TIMESTAMP, nullable=True)
+    latest_hematocrit_date = Column(TIMESTAMP, nullable=True)
+    latest_glycated_hemoglobin_date = Column(TIMESTAMP, nullable=True)
+    latest_ast_date = Column(TIMESTAMP, nullable=True)
+    latest_alt_date = Column(TIMESTAMP, nullable=True)
+    latest_urea_date = Column(TIMESTAMP, nullable=True)
+    latest_creatinine_date = Column(TIMESTAMP, nullable=True)
 
     user = relationship("User", back_populates="forms")
 
@@ -81,4 +101,46 @@ class DerivedHealthData(Base):
     value = Column(String(255), nullable=False)
 
     form = relationship("Form")
-    test = relationship("Test")
\ No newline at end of file
+    test = relationship("Test")
+
+    __table_args__ = (
+        Index('ix_derived_health_data_form_id_name', 'form_id', 'name'),
+        Index('uq_derived_health_data_test_id_name', 'test_id', 'name', unique=True),
+    )
+
+class LabResult(Base):
+    # Typed copy of DerivedHealthData: one row per analyte of a test, in the
+    # canonical unit of the analyte, with the user and the test date
+    # denormalized so history and latest-value lookups never join Tests or
+    # cast text. Analyte codes and units are in app.lab_results.
+    __tablename__ = 'LabResults'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey('Users.id'), nullable=False)
+    test_id = Column(Integer, ForeignKey('Tests.id'), nullable=False)
+    analyte = Column(SmallInteger, nullable=False)
+    value = Column(Numeric(12, 4), nullable=False)
+    unit = Column(String(16))
+    test_date = Column(TIMESTAMP, nullable=True)
+    # -1 below, 0 within, 1 above the reference range for the user's sex and
+    # age; NULL when the unit or the range is unknown
+    flag = Column(SmallInteger, nullable=True)
+
+    test = relationship("Test")
+
+    __table_args__ = (
+        Index('uq_lab_results_test_id_analyte', 'test_id', 'analyte', unique=True),
+    )
+
+# Matches ORDER BY analyte, test_date DESC NULLS LAST, id DESC of the
+# latest-value lookup; on PostgreSQL the included value makes it an
+# index-only scan. SQLite rejects NULLS LAST in an index but already sorts
+# NULLs last on DESC, so other dialects get the plain descending column.
+Index(
+    'ix_lab_results_user_id_analyte_test_date',
+    LabResult.user_id, LabResult.analyte, LabResult.test_date.desc().nulls_last(), LabResult.id.desc(),
+    postgresql_include=['value']
+).ddl_if(dialect='postgresql')
+Index(
+    'ix_lab_results_user_id_analyte_test_date',
+    LabResult.user_id, LabResult.analyte, LabResult.test_date.desc(), LabResult.id.desc()
+).ddl_if(callable_=lambda ddl, target, bind, dialect, **kw: dialect.name != 'postgresql')
@@ -0,0 +1,36 @@
+import os
+import hmac
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+from fastapi import Depends, APIRouter, Header
+from fastapi.responses import ORJSONResponse
+
+from app.admin import rebuild_latest_values
+from app.database import get_db, run_db
+from app.forms import FORMS_BATCH_MAX_USERS
+
+# The admin routes answer 403 unless ADMIN_TOKEN is set and sent in the
+# X-Admin-Token header
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN') or None
+
+router = APIRouter(
+    prefix="/admin",
+    tags=['Admin']
+)
+
+def is_admin(x_admin_token):
+    return bool(ADMIN_TOKEN) and hmac.compare_digest((x_admin_token or "").encode(), ADMIN_TOKEN.encode())
+
+@router.post("/latest-values:rebuild")
+async def rebuild_latest_values_of_users(usersIdList: List[int], x_admin_token: Optional[str] = Header(None), db: Session = Depends(get_db)):
+    if not is_admin(x_admin_token):
+        return ORJSONResponse(content={"status": 403, "message": "Missing or invalid admin token"}, status_code=403)
+    user_ids = list(dict.fromkeys(usersIdList))
+    if not user_ids:
+        return ORJSONResponse(content={"status": 400, "message": "No user IDs were given"}, status_code=400)
+    if len(user_ids) > FORMS_BATCH_MAX_USERS:
+        return ORJSONResponse(content={"status": 400, "message": f"At most {FORMS_BATCH_MAX_USERS} users can be rebuilt at once, use python -m app.admin for more"}, status_code=400)
+
+    rebuilt = await run_db(db, rebuild_latest_values, user_ids)
+    return ORJSONResponse(content={"status": 200, "message": f"The latest values of {rebuilt} forms were rebuilt", "data": {"rebuilt": rebuilt}}, status_code=200)
@@ -1,14 +1,31 @@
-from typing import List
+import os
+import logging
+from datetime import date
+from typing import List, Optional
+
+import orjson
 
 from sqlalchemy.orm import Session
-from fastapi import Depends, APIRouter
-from fastapi.responses import JSONResponse
+from fastapi import Depends, APIRouter, Query, Header, UploadFile, File
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
-from app import models
-from app.database import get_db
+from app.database import get_db, run_db, close_db
 from app.schemas import FormRequest
-from app.scraping import data_scraping
-from app.utils import is_form_filled, create_form_response
+from app.forms import (
+    get_form_response, get_form_responses, update_user_form, form_cache, form_cache_key, form_cache_entry, etag_matches,
+    FORMS_BATCH_MAX_USERS, FORMS_BATCH_CHUNK_SIZE
+)
+from app.history import get_history
+from app.ingestion import (
+    prepare_tests_processing, select_pending_tests, finish_tests_processing,
+    prepare_test_upload, reserve_test_upload, cancel_test_upload, finish_test_upload
+)
+from app.jobs import JobQueue, get_job_queue
+from app.scraping import data_scraping_many, data_scraping_upload, delete_s3_object, s3_object_url, InvalidPdfError, UPLOAD_MAX_BYTES
+from app.utils import RequestError
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/data",
@@ -16,105 +33,150 @@ router = APIRouter(
 )
 
 @router.post("/tests-processing/{user_id}")
-async def tests_processing(user_id: int, testsIdList: List[int], db: Session = Depends(get_db)):
-
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if not user:
-        return JSONResponse(content={"status": 404, "message": f"User with ID '{user_id}' not found"}, status_code=404)
-
-    user_form = db.query(models.Form).filter(models.Form.user_id == user_id).first()
-    if not user_form:
-        user_form = models.Form(user_id=user_id)
-        db.add(user_form)
-        db.commit()
-        db.refresh(user_form)
-
-    for test_id in testsIdList:
-        test = db.query(models.Test).filter(models.Test.id == test_id).first()
-        if not test:
-            return JSONResponse(content={"status": 404, "message": f"Test with ID '{test_id}' not found"}, status_code=404)
-        elif test.user_id != user_id:
-            return JSONResponse(content={"status": 400, "message": f"Test with ID '{test_id}' is not a test of the user with ID {user_id}"}, status_code=400)
-
-        filename = test.test_name
-        dataScraped, dateScraped = data_scraping(user_id, filename)
-        test.test_date = dateScraped
-        db.add(test)
-
-        for data in dataScraped:
-            new_health_data = models.DerivedHealthData(
-                form_id=user_form.id,
-                test_id=test_id,
-                name=data.name,
-                value=data.value
-            )
-            db.add(new_health_data)    
-    db.commit()
-    
-    latest_values = {}
-    metrics = ['red_blood_cell', 'hemoglobin', 'hematocrit', 'glycated_hemoglobin', 'ast', 'alt', 'urea', 'creatinine']
-    for metric in metrics:
-        latest_value = (
-            db.query(models.DerivedHealthData)
-            .join(models.Test, models.DerivedHealthData.test_id == models.Test.id)
-            .join(models.Form, models.DerivedHealthData.form_id == models.Form.id)
-            .filter(
-                models.DerivedHealthData.name == metric,
-                models.Form.user_id == user_id
-            )
-            .order_by(models.Test.test_date.desc())
-            .first()
-        )
-        latest_values[metric] = latest_value.value if latest_value else None
-        if latest_values.get(metric) is not None:
-            setattr(user_form, f'latest_{metric}', latest_values.get(metric))
-
-    if any(latest_values.values()):
-        user_form.form_status = "In progress" if user_form.form_status != "Filled" else user_form.form_status
-        db.commit()
-        db.refresh(user_form)
-    
-    form_response = create_form_response(user, user_form)
-    
-    return JSONResponse(content={"status": 200, "message": f"The following form was updated for user with ID '{user_id}'", "data": form_response}, status_code=200)
+async def tests_processing(user_id: int, testsIdList: List[int], async_mode: bool = Query(False, alias="async"), db: Session = Depends(get_db), job_queue: JobQueue = Depends(get_job_queue)):
+    try:
+        user, user_form, tests = await run_db(db, prepare_tests_processing, user_id, testsIdList)
+    except RequestError as e:
+        return ORJSONResponse(content={"status": e.status, "message": e.message}, status_code=e.status)
+
+    if async_mode:
+        job = job_queue.submit(user_id, testsIdList)
+        return ORJSONResponse(content={"status": 202, "message": f"The tests of user with ID '{user_id}' were queued for processing", "data": job}, status_code=202)
+
+    tests = await run_in_threadpool(select_pending_tests, user_id, tests)
+    scraping_results = await data_scraping_many(user_id, [test.test_name for test in tests])
+    form_response = await run_db(db, finish_tests_processing, user, user_form, tests, scraping_results)
+
+    return ORJSONResponse(content={"status": 200, "message": f"The following form was updated for user with ID '{user_id}'", "data": form_response}, status_code=200)
+
+@router.post("/tests-upload/{user_id}")
+async def upload_test(user_id: int, file: UploadFile = File(...), db: Session = Depends(get_db)):
+    filename = os.path.basename(file.filename or "")
+    if not filename:
+        return ORJSONResponse(content={"status": 400, "message": "The file has no name"}, status_code=400)
+
+    # The user and the name are checked before the file is read
+    try:
+        user, user_form = await run_db(db, prepare_test_upload, user_id, filename)
+    except RequestError as e:
+        return ORJSONResponse(content={"status": e.status, "message": e.message}, status_code=e.status)
+
+    pdf_data = await file.read(UPLOAD_MAX_BYTES + 1)
+    if len(pdf_data) > UPLOAD_MAX_BYTES:
+        return ORJSONResponse(content={"status": 413, "message": f"The file '{filename}' is larger than {UPLOAD_MAX_BYTES} bytes"}, status_code=413)
+    if b"%PDF-" not in pdf_data[:1024]:
+        return ORJSONResponse(content={"status": 400, "message": f"The file '{filename}' is not a PDF"}, status_code=400)
+
+    key = f"{user_id}/{filename}"
+    try:
+        test_id = await run_db(db, reserve_test_upload, user_id, filename, s3_object_url(key))
+    except RequestError as e:
+        return ORJSONResponse(content={"status": e.status, "message": e.message}, status_code=e.status)
+
+    try:
+        scraping_result = await data_scraping_upload(user_id, filename, pdf_data)
+    except InvalidPdfError as e:
+        await run_db(db, cancel_test_upload, test_id)
+        return ORJSONResponse(content={"status": 400, "message": f"The file '{filename}' could not be read as a PDF: {e}"}, status_code=400)
+    except Exception:
+        logger.exception("Error while processing the upload '%s' of user '%s'", filename, user_id)
+        await run_db(db, cancel_test_upload, test_id)
+        return ORJSONResponse(content={"status": 500, "message": f"Error while uploading the file '{filename}' to AWS S3 or extracting its values for user '{user_id}'"}, status_code=500)
+
+    try:
+        form_response = await run_db(db, finish_test_upload, user, user_form, test_id, scraping_result)
+    except Exception:
+        # Neither the object nor the reserved Tests row is left behind
+        logger.exception("Error while saving the upload '%s' of user '%s'", filename, user_id)
+        await run_db(db, cancel_test_upload, test_id)
+        await run_in_threadpool(delete_s3_object, key)
+        return ORJSONResponse(content={"status": 500, "message": f"Error while saving the results of the file '{filename}' for user '{user_id}'"}, status_code=500)
+    return ORJSONResponse(content={"status": 201, "message": f"The test '{filename}' was saved and the form was updated for user with ID '{user_id}'", "data": {"test_id": test_id, "form": form_response}}, status_code=201)
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, job_queue: JobQueue = Depends(get_job_queue)):
+    job = job_queue.get(job_id)
+    if not job:
+        return ORJSONResponse(content={"status": 404, "message": f"Job with ID '{job_id}' not found"}, status_code=404)
+    return ORJSONResponse(content={"status": 200, "message": f"The following job was found with ID '{job_id}'", "data": job}, status_code=200)
 
 @router.put("/form/{user_id}")
 async def update_form(user_id: int, request_form: FormRequest, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if not user:
-        return JSONResponse(content={"status": 404, "message": f"User with ID '{user_id}' not found"}, status_code=404)
-
-    if not request_form.dict(exclude_none=True):
-        return JSONResponse(content={"status": 400, "message": "Empty form"}, status_code=400)
-
-    user_form = db.query(models.Form).filter(models.Form.user_id == user_id).first()
-    request_form_dict = request_form.dict(exclude_unset=True)
-    
-    if not user_form:
-        form_status = "Filled" if is_form_filled(request_form) else "In progress"
-        user_form = models.Form(user_id=user_id, form_status=form_status, **request_form_dict)
-        db.add(user_form)
-    else:
-        for key, value in request_form_dict.items():
-            setattr(user_form, key, value)
-        form_status = "Filled" if is_form_filled(user_form) else "In progress"
-        user_form.form_status = form_status
-    db.commit()
-    db.refresh(user_form)
-
-    return JSONResponse(content={"status": 200, "message": f"The form was updated for user with ID '{user_id}'"}, status_code=200)
+    try:
+        await run_db(db, update_user_form, user_id, request_form)
+    except RequestError as e:
+        return ORJSONResponse(content={"status": e.status, "message": e.message}, status_code=e.status)
+
+    return ORJSONResponse(content={"status": 200, "message": f"The form was updated for user with ID '{user_id}'"}, status_code=200)
 
 @router.get("/form-and-latest-tests/{user_id}")
-async def get_form(user_id: int, db: Session = Depends(get_db)):
-
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if not user:
-        return JSONResponse(content={"status": 404, "message": f"User with ID {user_id} not found"}, status_code=404)
-
-    user_form = db.query(models.Form).filter(models.Form.user_id == user_id).first()
-    if not user_form:
-        form_response = {}
-        return JSONResponse(content={"status": 200, "message": f"No form was found for user with ID '{user_id}'", "data": form_response}, status_code=200)
-    
-    form_response = create_form_response(user, user_form)
-    return JSONResponse(content={"status": 200, "message": f"The following form was found for user with ID '{user_id}'", "data": form_response}, status_code=200)
\ No newline at end of file
+async def get_form(user_id: int, if_none_match: Optional[str] = Header(None), db: Session = Depends(get_db)):
+    cache_key = form_cache_key(user_id)
+    cached = form_cache.get(cache_key)
+    if cached is None:
+        try:
+            form_response = await run_db(db, get_form_response, user_id)
+        except RequestError as e:
+            return ORJSONResponse(content={"status": e.status, "message": e.message}, status_code=e.status)
+
+        if form_response is None:
+            content = {"status": 200, "message": f"No form was found for user with ID '{user_id}'", "data": {}}
+        else:
+            content = {"status": 200, "message": f"The following form was found for user with ID '{user_id}'", "data": form_response}
+        cached = form_cache_entry(content)
+        form_cache.set(cache_key, cached)
+
+    headers = {"ETag": cached["etag"], "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, cached["etag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached["body"], status_code=200, headers=headers, media_type="application/json")
+
+def form_batch_lines(user_ids, form_responses):
+    for user_id in user_ids:
+        if user_id not in form_responses:
+            line = {"user_id": user_id, "status": 404, "message": f"User with ID {user_id} not found"}
+        elif form_responses[user_id] is None:
+            line = {"user_id": user_id, "status": 200, "message": f"No form was found for user with ID '{user_id}'", "data": {}}
+        else:
+            line = {"user_id": user_id, "status": 200, "message": f"The following form was found for user with ID '{user_id}'", "data": form_responses[user_id]}
+        yield orjson.dumps(line) + b"\n"
+
+async def form_batch_chunks(db, user_ids):
+    # The dependency closes the session before the body is streamed; a closed
+    # Session can be used again, so each chunk is loaded through it only when
+    # the previous lines were sent, and it is closed once more at the end
+    try:
+        for start in range(0, len(user_ids), FORMS_BATCH_CHUNK_SIZE):
+            chunk = user_ids[start:start + FORMS_BATCH_CHUNK_SIZE]
+            form_responses = await run_db(db, get_form_responses, chunk)
+            yield b"".join(form_batch_lines(chunk, form_responses))
+    finally:
+        await close_db(db)
+
+@router.post("/forms:batch")
+async def get_forms_batch(usersIdList: List[int], db: Session = Depends(get_db)):
+    user_ids = list(dict.fromkeys(usersIdList))
+    if not user_ids:
+        return ORJSONResponse(content={"status": 400, "message": "No user IDs were given"}, status_code=400)
+    if len(user_ids) > FORMS_BATCH_MAX_USERS:
+        return ORJSONResponse(content={"status": 400, "message": f"At most {FORMS_BATCH_MAX_USERS} users can be requested at once"}, status_code=400)
+
+    return StreamingResponse(form_batch_chunks(db, user_ids), media_type="application/x-ndjson")
+
+@router.get("/history/{user_id}")
+async def get_user_history(
+    user_id: int,
+    analytes: List[str] = Query([]),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    bucket: str = "month",
+    cursor: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=5000),
+    db: Session = Depends(get_db)
+):
+    try:
+        history = await run_db(db, get_history, user_id, analytes, start, end, bucket, cursor, limit)
+    except RequestError as e:
+        return ORJSONResponse(content={"status": e.status, "message": e.message}, status_code=e.status)
+
+    return ORJSONResponse(content={"status": 200, "message": f"The following history was found for user with ID '{user_id}'", "data": history}, status_code=200)
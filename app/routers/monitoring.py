@@ -0,0 +1,29 @@
+import os
+
+from fastapi import APIRouter
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+
+from app.database import get_pool_stats
+from app.metrics import render_metrics
+from app.warmup import readiness
+
+router = APIRouter(
+    tags=['Monitoring']
+)
+
+@router.get("/pool-stats")
+async def pool_stats():
+    # Every uvicorn worker has its own pools, the pid tells them apart
+    data = {"pid": os.getpid(), **get_pool_stats()}
+    return ORJSONResponse(content={"status": 200, "message": "Database connection pool statistics", "data": data}, status_code=200)
+
+@router.get("/ready")
+async def ready():
+    if readiness["ready"]:
+        return ORJSONResponse(content={"status": 200, "message": "Ready", "data": readiness}, status_code=200)
+    message = readiness["error"] or "Warming up"
+    return ORJSONResponse(content={"status": 503, "message": message, "data": readiness}, status_code=503)
+
+@router.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
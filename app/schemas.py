@@ -1,27 +1,41 @@
-from pydantic import BaseModel, Field
+from collections import namedtuple
 from typing import Optional
 
-class FormRequest(BaseModel):
-    weight: Optional[float] = Field(None, alias="weight")
-    height: Optional[float] = Field(None, alias="height")
-    bmi: Optional[float] = Field(None, alias="bmi")
-    blood_type: Optional[str] = Field(None, alias="blood_type")
-    abdominal_circumference: Optional[float] = Field(None, alias="abdominal_circumference")
-    allergies: Optional[str] = Field(None, alias="allergies")
-    diseases: Optional[str] = Field(None, alias="diseases")
-    medications: Optional[str] = Field(None, alias="medications")
-    family_history: Optional[str] = Field(None, alias="family_history")
-    important_notes: Optional[str] = Field(None, alias="important_notes")
-    images_reports: Optional[str] = Field(None, alias="images_reports")
-    form_status: Optional[str] = Field(None, alias="form_status")
-    latest_red_blood_cell: Optional[float] = Field(None, alias="latest_red_blood_cell")
-    latest_hemoglobin: Optional[float] = Field(None, alias="latest_hemoglobin")
-    latest_hematocrit: Optional[float] = Field(None, alias="latest_hematocrit")
-    latest_glycated_hemoglobin: Optional[float] = Field(None, alias="latest_glycated_hemoglobin")
-    latest_ast: Optional[float] = Field(None, alias="latest_ast")
-    latest_alt: Optional[float] = Field(None, alias="latest_alt")
-    latest_urea: Optional[float] = Field(None, alias="latest_urea")
-    latest_creatinine: Optional[float] = Field(None, alias="latest_creatinine")
+from pydantic import ConfigDict, Field, create_model
 
-    class Config:
-        allow_population_by_field_name = True
+# The fields of a form, in response order. Each name is at the same time the
+# column of models.Form, the field of FormRequest and the key of the form
+# responses; "required" fields must be set for the form to count as filled.
+FormField = namedtuple('FormField', 'name type required')
+
+FORM_FIELDS = (
+    FormField("weight", float, True),
+    FormField("height", float, True),
+    FormField("bmi", float, True),
+    FormField("blood_type", str, True),
+    FormField("abdominal_circumference", float, True),
+    FormField("allergies", str, True),
+    FormField("diseases", str, True),
+    FormField("medications", str, True),
+    FormField("family_history", str, True),
+    FormField("important_notes", str, False),
+    FormField("images_reports", str, False),
+    FormField("form_status", str, True),
+    FormField("latest_red_blood_cell", float, True),
+    FormField("latest_hemoglobin", float, True),
+    FormField("latest_hematocrit", float, True),
+    FormField("latest_glycated_hemoglobin", float, True),
+    FormField("latest_ast", float, True),
+    FormField("latest_alt", float, True),
+    FormField("latest_urea", float, True),
+    FormField("latest_creatinine", float, True),
+)
+
+FORM_FIELD_NAMES = tuple(field.name for field in FORM_FIELDS)
+REQUIRED_FORM_FIELD_NAMES = tuple(field.name for field in FORM_FIELDS if field.required)
+
+FormRequest = create_model(
+    'FormRequest',
+    __config__=ConfigDict(populate_by_name=True),
+    **{field.name: (Optional[field.type], Field(None, alias=field.name)) for field in FORM_FIELDS}
+)
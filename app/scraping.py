@@ -1,36 +1,436 @@
 import os
 import re
-import fitz
+import asyncio
+import logging
+import resource
+import time
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from datetime import datetime
 from fastapi.responses import JSONResponse
-from app.utils import s3_client
+from app.cache import LRUCache
+from app.layouts import LayoutRegistry, load_layouts
+from app.metrics import stage, record_stage, record_pdf, bind_current_context
+from app.utils import create_s3_client, S3_ENDPOINT_URL
+
+logger = logging.getLogger(__name__)
+
+# Downloads and extractions of a request run on this many threads; PDFs are
+# parsed out of the worker's GIL with EXTRACTION_EXECUTOR="process" instead
+SCRAPING_MAX_WORKERS = int(os.getenv('SCRAPING_MAX_WORKERS', '8'))
+
+_scraping_executor = None
+
+# "process" parses PDFs in a separate pool of processes, out of the GIL of
+# the worker that downloads them; "inline" parses them on the calling thread.
+EXTRACTION_EXECUTOR = os.getenv('EXTRACTION_EXECUTOR', 'inline')
+EXTRACTION_PROCESSES = int(os.getenv('EXTRACTION_PROCESSES', str(os.cpu_count() or 1)))
+EXTRACTION_MAX_TASKS_PER_CHILD = int(os.getenv('EXTRACTION_MAX_TASKS_PER_CHILD', '200'))
+EXTRACTION_START_METHOD = os.getenv('EXTRACTION_START_METHOD', 'forkserver')
+
+_extraction_executor = None
+
+PDF_CACHE_MAX_BYTES = int(os.getenv('PDF_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+PDF_CACHE_DIR = os.getenv('PDF_CACHE_DIR') or None
+PDF_CACHE_DIR_MAX_BYTES = int(os.getenv('PDF_CACHE_DIR_MAX_BYTES', str(1024 * 1024 * 1024)))
+
+pdf_cache = LRUCache(PDF_CACHE_MAX_BYTES, PDF_CACHE_DIR, PDF_CACHE_DIR_MAX_BYTES)
+
+# "lazy" reads pages one at a time and stops once every value was found,
+# "full" extracts the text of the whole document first.
+PDF_EXTRACTION_MODE = os.getenv('PDF_EXTRACTION_MODE', 'lazy')
+S3_READ_CHUNK_SIZE = 1024 * 1024
+
+# Objects larger than one range are downloaded with parallel ranged GETs
+S3_RANGE_CHUNK_SIZE = int(os.getenv('S3_RANGE_CHUNK_SIZE', str(8 * 1024 * 1024)))
+S3_RANGE_CONCURRENCY = int(os.getenv('S3_RANGE_CONCURRENCY', '8'))
+
+_s3_range_executor = None
+
+# Largest PDF accepted by POST /data/tests-upload
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', str(32 * 1024 * 1024)))
+
+# Created by get_s3_client on first use, or by warm_up at startup
+s3_client = None
 
 class DataScraped:
-    def __init__(self, name, value):
+    def __init__(self, name, value, unit=None):
         self.name = name
         self.value = value
+        self.unit = unit
 
-def extract_text_from_s3_pdf(user_id: int, filename: str) -> str:
-    s3_key = f"{user_id}/{filename}"
+# Each analyte is a section header followed by the pattern of its value,
+# which is only searched between the header and the next known header.
+ANALYTE_PATTERNS = {
+    "hemoglobin": ("HEMOGLOBINA", r'\s*([\d,\.]+)\s*g/dL', "g/dL"),
+    "hematocrit": ("HEMATÓCRITO", r'\s*([\d,\.]+)\s*%', "%"),
+    "red_blood_cell": ("HEMÁCIAS", r'\s*([\d,\.]+)\s*milhões/mm3', "milhões/mm3"),
+    "glycated_hemoglobin": ("HEMOGLOBINA GLICADA - HbA1c", r'\s*.*?RESULTADO:\s*([\d,\.]+)\s*%', "%"),
+    "ast": ("TRANSAMINASE OXALACÉTICA TGO (AST)", r'.*?RESULTADO:\s*([\d,\.]+)\s*U/L', "U/L"),
+    "alt": ("TRANSAMINASE PIRÚVICA TGP (ALT)", r'.*?RESULTADO:\s*([\d,\.]+)\s*U/L', "U/L"),
+    "urea": ("UREIA", r'\s*.*?RESULTADO:\s*([\d,\.]+)\s*mg/dL', "mg/dL"),
+    "creatinine": ("CREATININA", r'\s*.*?RESULTADO:\s*([\d,\.]+)\s*mg/dL', "mg/dL")
+}
+
+DATE_PATTERN = r'Atendimento\s*:\s*(\d{2}/\d{2}/\d{4})'
+
+class ExtractionEngine:
+    def __init__(self, analyte_patterns, date_pattern):
+        self.analytes = {
+            name: (header, re.compile(pattern, re.DOTALL), unit)
+            for name, (header, pattern, unit) in analyte_patterns.items()
+        }
+        self.analytes_by_header = {}
+        for name, (header, _, _) in self.analytes.items():
+            self.analytes_by_header.setdefault(header, []).append(name)
+        # Longest headers first, so "HEMOGLOBINA GLICADA - HbA1c" is not
+        # reported as a plain "HEMOGLOBINA" section.
+        headers = sorted(self.analytes_by_header, key=len, reverse=True)
+        self.header_regex = re.compile('|'.join(re.escape(header) for header in headers))
+        self.date_regex = re.compile(date_pattern)
+
+    def find_sections(self, text):
+        matches = list(self.header_regex.finditer(text))
+        sections = []
+        for index, match in enumerate(matches):
+            window_end = matches[index + 1].start() if index + 1 < len(matches) else len(text)
+            sections.append((match.group(), match.end(), window_end))
+        return sections
+
+    def extract_values(self, text):
+        found = {}
+        for header, start, window_end in self.find_sections(text):
+            for name in self.analytes_by_header[header]:
+                if name in found:
+                    continue
+                match = self.analytes[name][1].match(text, start, window_end)
+                if match:
+                    found[name] = match.group(1).replace(',', '.')
+            if len(found) == len(self.analytes):
+                break
+        return [DataScraped(name, found[name], self.analytes[name][2]) for name in self.analytes if name in found]
+
+    def extract_date(self, text):
+        match = self.date_regex.search(text)
+        if match:
+            return datetime.strptime(match.group(1), '%d/%m/%Y')
+        return None
+
+# Reports of other laboratories are described in the JSON file at
+# LAB_LAYOUTS_PATH (see app.layouts.load_layouts); anything that matches
+# none of their fingerprints is read with the patterns above.
+LAB_LAYOUTS_PATH = os.getenv('LAB_LAYOUTS_PATH') or None
+
+LAYOUTS = LayoutRegistry(ExtractionEngine)
+LAYOUTS.register("default", ANALYTE_PATTERNS, DATE_PATTERN, default=True)
+if LAB_LAYOUTS_PATH:
+    load_layouts(LAYOUTS, LAB_LAYOUTS_PATH)
+
+ENGINE = LAYOUTS.default.engine
+
+# Cached extraction results are keyed on this hash, so editing any pattern
+# or layout invalidates them while the cached PDF text stays valid.
+EXTRACTION_VERSION = LAYOUTS.version()
 
+class IncrementalExtraction:
+    # Receives the report one page at a time. Only the section opened by the
+    # last header of the previous pages can still grow, so that is the only
+    # text carried over and every page is scanned about once.
+    DATE_OVERLAP = 64
+
+    def __init__(self, engine=None, registry=None):
+        # Without an engine, the layout is detected on the first page fed
+        self.engine = engine
+        self.registry = registry or LAYOUTS
+        self.layout = None
+        self.found = {}
+        self.test_date = None
+        self._carry = ""
+        self._date_tail = ""
+
+    @property
+    def done(self):
+        return self.engine is not None and self.test_date is not None and len(self.found) == len(self.engine.analytes)
+
+    def feed(self, text):
+        if self.engine is None:
+            self.layout = self.registry.detect(text)
+            self.engine = self.layout.engine
+
+        if self.test_date is None:
+            date_text = self._date_tail + text
+            self.test_date = self.engine.extract_date(date_text)
+            self._date_tail = date_text[-self.DATE_OVERLAP:]
+
+        buffer = self._carry + text
+        sections = self.engine.find_sections(buffer)
+        for header, start, window_end in sections:
+            for name in self.engine.analytes_by_header[header]:
+                if name in self.found:
+                    continue
+                match = self.engine.analytes[name][1].match(buffer, start, window_end)
+                if match:
+                    self.found[name] = match.group(1).replace(',', '.')
+
+        if sections and any(name not in self.found for name in self.engine.analytes_by_header[sections[-1][0]]):
+            last_header_start = sections[-1][1] - len(sections[-1][0])
+            self._carry = buffer[last_header_start:]
+        else:
+            # Keep enough text for a header split across two pages
+            self._carry = buffer[-max(map(len, self.engine.analytes_by_header)):]
+        return self.done
+
+    def results(self):
+        if self.engine is None:
+            return [], None
+        data_values = [
+            DataScraped(name, self.found[name], self.engine.analytes[name][2])
+            for name in self.engine.analytes if name in self.found
+        ]
+        return data_values, self.test_date
+
+class InvalidPdfError(Exception):
+    # The bytes could not be opened as a PDF; the message is fitz's
+    pass
+
+class ScrapingResult(tuple):
+    # Unpacks as (dataScraped, dateScraped); content_hash is the S3 ETag of
+    # the PDF the values were read from, None when it could not be read
+    def __new__(cls, dataScraped, dateScraped, content_hash=None):
+        result = super().__new__(cls, (dataScraped, dateScraped))
+        result.content_hash = content_hash
+        return result
+
+    def __getnewargs__(self):
+        return self[0], self[1], self.content_hash
+
+class ExtractionStats:
+    def __init__(self):
+        self.bytes_read = 0
+        self.page_count = 0
+        self.pages_touched = 0
+        # High-water mark of the whole process (ru_maxrss) once the document
+        # was read, not the memory of this document: in a long-lived worker it
+        # stays at the largest document seen so far
+        self.process_peak_rss_kb = 0
+        self.layout = None
+        self.parse_seconds = 0.0
+        self.extract_seconds = 0.0
+
+    def as_dict(self):
+        return {
+            "layout": self.layout,
+            "bytes_read": self.bytes_read,
+            "page_count": self.page_count,
+            "pages_touched": self.pages_touched,
+            "process_peak_rss_kb": self.process_peak_rss_kb
+        }
+
+def get_s3_client():
+    global s3_client
+    if s3_client is None:
+        s3_client = create_s3_client()
+    return s3_client
+
+def get_s3_object_etag(user_id: int, filename: str):
     try:
-        response = s3_client.get_object(
-            Bucket=os.getenv('S3_BUCKET_NAME'),
-            Key=s3_key
-        )
-        pdf_data = response['Body'].read()
-        doc = fitz.open(stream=pdf_data, filetype='pdf')
-        
-        text = ""
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            text += page.get_text()
+        with stage("s3_head"):
+            response = get_s3_client().head_object(
+                Bucket=os.getenv('S3_BUCKET_NAME'),
+                Key=f"{user_id}/{filename}"
+            )
+    except Exception:
+        return None
+    etag = response.get('ETag')
+    return etag.strip('"') if isinstance(etag, str) and etag else None
 
-        doc.close()
+def get_s3_object_etags(user_id: int, filenames):
+    # HEAD requests of several objects at once, on the scraping pool
+    executor = get_scraping_executor()
+    futures = [executor.submit(bind_current_context(get_s3_object_etag), user_id, filename) for filename in filenames]
+    return [future.result() for future in futures]
+
+def copy_s3_body(body, view):
+    # Copies the body chunk by chunk straight into its slice of the shared
+    # buffer, instead of read() joining the chunks into another full copy.
+    offset = 0
+    for chunk in body.iter_chunks(chunk_size=S3_READ_CHUNK_SIZE):
+        view[offset:offset + len(chunk)] = chunk
+        offset += len(chunk)
+    return offset
+
+def fetch_s3_range(bucket, key, etag, view, start, end):
+    # IfMatch makes S3 fail the range instead of mixing two object versions
+    conditions = {"IfMatch": etag} if etag else {}
+    response = get_s3_client().get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}", **conditions)
+    received = copy_s3_body(response['Body'], view[start:end + 1])
+    if received != end - start + 1:
+        raise IOError(f"Incomplete range {start}-{end} of '{key}' on AWS S3")
+
+def download_s3_object(key: str):
+    with stage("s3_download"):
+        return fetch_s3_object(key)
+
+def fetch_s3_object(key: str):
+    bucket = os.getenv('S3_BUCKET_NAME')
+    response = get_s3_client().get_object(Bucket=bucket, Key=key, Range=f"bytes=0-{S3_RANGE_CHUNK_SIZE - 1}")
+    body = response['Body']
+    content_range = response.get('ContentRange')
+    content_length = response.get('ContentLength')
+    if isinstance(content_range, str):
+        total = int(content_range.rsplit('/', 1)[1])
+    elif isinstance(content_length, int):
+        total = content_length
+    else:
+        return body.read()
+    if not hasattr(body, 'iter_chunks'):
+        return body.read()
+
+    # The first GET doubles as the size probe; the remaining ranges are
+    # fetched in parallel, each written into its own slice of one buffer.
+    buffer = bytearray(total)
+    view = memoryview(buffer)
+    received = copy_s3_body(body, view[:content_length])
+    ranges = [
+        (start, min(start + S3_RANGE_CHUNK_SIZE, total) - 1)
+        for start in range(received, total, S3_RANGE_CHUNK_SIZE)
+    ]
+    if ranges:
+        executor = get_s3_range_executor()
+        futures = [
+            executor.submit(fetch_s3_range, bucket, key, response.get('ETag'), view, start, end)
+            for start, end in ranges
+        ]
+        for future in futures:
+            future.result()
+    return buffer
+
+def open_s3_pdf(user_id: int, filename: str):
+    import fitz
+
+    pdf_data = download_s3_object(f"{user_id}/{filename}")
+    return fitz.open(stream=pdf_data, filetype='pdf'), len(pdf_data)
+
+def iter_pdf_pages(doc):
+    for page_num in range(len(doc)):
+        yield doc.load_page(page_num).get_text()
+
+def extract_text_from_s3_pdf(user_id: int, filename: str) -> str:
+    try:
+        doc, size = open_s3_pdf(user_id, filename)
+        with stage("pdf_parse"):
+            text = "".join(iter_pdf_pages(doc))
+            record_pdf(size, len(doc))
+            doc.close()
 
         return text
     except Exception as e:
         return JSONResponse(content={"status": 500, "message": f"Error while downloading the file '{filename}' on AWS S3 for user '{user_id}'"}, status_code=500)
+
+def extract_data_from_pdf(pdf_data):
+    import fitz
+
+    stats = ExtractionStats()
+    stats.bytes_read = len(pdf_data)
+    # Parsing and extraction alternate page by page, so each is timed here
+    # and reported by the caller, in the process that serves the request
+    started = time.perf_counter()
+    try:
+        doc = fitz.open(stream=pdf_data, filetype='pdf')
+    except Exception as e:
+        # fitz's error classes differ between PyMuPDF versions
+        raise InvalidPdfError(str(e)) from None
+    try:
+        stats.page_count = len(doc)
+        extraction = IncrementalExtraction()
+        for page_text in iter_pdf_pages(doc):
+            stats.pages_touched += 1
+            parsed = time.perf_counter()
+            stats.parse_seconds += parsed - started
+            done = extraction.feed(page_text)
+            started = time.perf_counter()
+            stats.extract_seconds += started - parsed
+            if done:
+                break
+    finally:
+        doc.close()
+    stats.parse_seconds += time.perf_counter() - started
+
+    stats.process_peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    stats.layout = extraction.layout.name if extraction.layout else None
+    dataScraped, dateScraped = extraction.results()
+    return dataScraped, dateScraped, stats
+
+def extract_data_from_shared_pdf(shm_name: str, size: int):
+    # Runs in the extraction processes. The PDF arrives through shared memory
+    # rather than pickled through the pool's pipe, and the result goes back
+    # as plain tuples.
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        pdf_data = bytes(shm.buf[:size])
+    finally:
+        shm.close()
+    dataScraped, dateScraped, stats = extract_data_from_pdf(pdf_data)
+    values = tuple((data.name, data.value, data.unit) for data in dataScraped)
+    return values, dateScraped, (stats.layout, stats.page_count, stats.pages_touched, stats.process_peak_rss_kb, stats.parse_seconds, stats.extract_seconds)
+
+def extract_data_in_process_pool(pdf_data):
+    size = len(pdf_data)
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        shm.buf[:size] = pdf_data
+        future = get_extraction_executor().submit(extract_data_from_shared_pdf, shm.name, size)
+        values, dateScraped, (layout, page_count, pages_touched, process_peak_rss_kb, parse_seconds, extract_seconds) = future.result()
+    finally:
+        shm.close()
+        shm.unlink()
+
+    stats = ExtractionStats()
+    stats.bytes_read = size
+    stats.layout = layout
+    stats.page_count = page_count
+    stats.pages_touched = pages_touched
+    stats.process_peak_rss_kb = process_peak_rss_kb
+    stats.parse_seconds = parse_seconds
+    stats.extract_seconds = extract_seconds
+    return [DataScraped(name, value, unit) for name, value, unit in values], dateScraped, stats
+
+def extract_data(pdf_data):
+    if EXTRACTION_EXECUTOR == 'process':
+        dataScraped, dateScraped, stats = extract_data_in_process_pool(pdf_data)
+    else:
+        dataScraped, dateScraped, stats = extract_data_from_pdf(pdf_data)
+    record_stage("pdf_parse", stats.parse_seconds)
+    record_stage("extract", stats.extract_seconds)
+    record_pdf(stats.bytes_read, stats.pages_touched)
+    return dataScraped, dateScraped, stats
+
+def extract_data_from_s3_pdf(user_id: int, filename: str):
+    pdf_data = download_s3_object(f"{user_id}/{filename}")
+    dataScraped, dateScraped, stats = extract_data(pdf_data)
+    logger.info("Extracted '%s' of user '%s': %s", filename, user_id, stats.as_dict())
+    return dataScraped, dateScraped, stats
+
+def upload_s3_object(key: str, data: bytes):
+    with stage("s3_upload"):
+        response = get_s3_client().put_object(
+            Bucket=os.getenv('S3_BUCKET_NAME'),
+            Key=key,
+            Body=data,
+            ContentType='application/pdf'
+        )
+    etag = response.get('ETag')
+    return etag.strip('"') if isinstance(etag, str) and etag else None
+
+def delete_s3_object(key: str):
+    get_s3_client().delete_object(Bucket=os.getenv('S3_BUCKET_NAME'), Key=key)
+
+def s3_object_url(key: str):
+    bucket = os.getenv('S3_BUCKET_NAME')
+    if S3_ENDPOINT_URL:
+        return f"{S3_ENDPOINT_URL.rstrip('/')}/{bucket}/{key}"
+    return f"https://{bucket}.s3.amazonaws.com/{key}"
     
 def extract_values_from_text(text, patterns):
     results = []
@@ -47,27 +447,13 @@ def extract_values_from_text(text, patterns):
     return results
 
 def extract_test_date(text):
-    pattern_date = r'Atendimento\s*:\s*(\d{2}/\d{2}/\d{4})'
-    match = re.search(pattern_date, text)
-    if match:
-        return datetime.strptime(match.group(1), '%d/%m/%Y')
-    return None
+    return LAYOUTS.detect(text).engine.extract_date(text)
 
 def extract_data_and_date(text):
-    patterns = {
-        "hemoglobin": (r'HEMOGLOBINA\s*([\d,\.]+)\s*g/dL', "g/dL"),
-        "hematocrit": (r'HEMATÓCRITO\s*([\d,\.]+)\s*%', "%"),
-        "red_blood_cell": (r'HEMÁCIAS\s*([\d,\.]+)\s*milhões/mm3', "milhões/mm3"),
-        "glycated_hemoglobin": (r'HEMOGLOBINA GLICADA - HbA1c\s*.*?RESULTADO:\s*([\d,\.]+)\s*%', "%"),
-        "ast": (r'TRANSAMINASE OXALACÉTICA TGO \(AST\).*?RESULTADO:\s*([\d,\.]+)\s*U/L', "U/L"),
-        "alt": (r'TRANSAMINASE PIRÚVICA TGP \(ALT\).*?RESULTADO:\s*([\d,\.]+)\s*U/L', "U/L"),
-        "urea": (r'UREIA\s*.*?RESULTADO:\s*([\d,\.]+)\s*mg/dL', "mg/dL"),
-        "creatinine": (r'CREATININA\s*.*?RESULTADO:\s*([\d,\.]+)\s*mg/dL', "mg/dL")
-    }
-    
-    test_date = extract_test_date(text)
+    engine = LAYOUTS.detect(text).engine
+    test_date = engine.extract_date(text)
     
-    data_values = extract_values_from_text(text, patterns)
+    data_values = engine.extract_values(text)
     
     return data_values, test_date
 
@@ -76,6 +462,122 @@ def text_processing(text):
     return data_values, test_date
 
 def data_scraping(user_id: int, filename: str):
-    text = extract_text_from_s3_pdf(user_id, filename)
-    dataScraped, dateScraped = text_processing(text)
-    return dataScraped, dateScraped
+    etag = get_s3_object_etag(user_id, filename)
+    results_key = f"results:{EXTRACTION_VERSION}:{etag}"
+    if etag:
+        cached_results = pdf_cache.get(results_key)
+        if cached_results is not None:
+            return ScrapingResult(*cached_results, etag)
+
+    if PDF_EXTRACTION_MODE == 'lazy':
+        dataScraped, dateScraped, _ = extract_data_from_s3_pdf(user_id, filename)
+    else:
+        text_key = f"text:{etag}"
+        text = pdf_cache.get(text_key) if etag else None
+        if text is None:
+            text = extract_text_from_s3_pdf(user_id, filename)
+            if etag and isinstance(text, str):
+                pdf_cache.set(text_key, text)
+        with stage("extract"):
+            dataScraped, dateScraped = text_processing(text)
+
+    if etag:
+        pdf_cache.set(results_key, (dataScraped, dateScraped))
+    return ScrapingResult(dataScraped, dateScraped, etag)
+
+def get_s3_range_executor():
+    # Separate from the scraping pool, whose workers wait on these downloads
+    global _s3_range_executor
+    if _s3_range_executor is None:
+        _s3_range_executor = ThreadPoolExecutor(max_workers=S3_RANGE_CONCURRENCY, thread_name_prefix='s3-range')
+    return _s3_range_executor
+
+def get_scraping_executor():
+    global _scraping_executor
+    if _scraping_executor is None:
+        _scraping_executor = ThreadPoolExecutor(max_workers=SCRAPING_MAX_WORKERS, thread_name_prefix='scraping')
+    return _scraping_executor
+
+def warm_extraction_worker():
+    # Runs once in every extraction process, including the ones started to
+    # replace workers that reached EXTRACTION_MAX_TASKS_PER_CHILD
+    import fitz
+
+    fitz.open().close()
+
+def get_extraction_executor():
+    global _extraction_executor
+    if _extraction_executor is None:
+        context = multiprocessing.get_context(EXTRACTION_START_METHOD)
+        if EXTRACTION_START_METHOD == 'forkserver':
+            # Workers are forked from a server that already imported these
+            context.set_forkserver_preload(['fitz', 'app.scraping'])
+        _extraction_executor = ProcessPoolExecutor(
+            max_workers=EXTRACTION_PROCESSES,
+            mp_context=context,
+            initializer=warm_extraction_worker,
+            max_tasks_per_child=EXTRACTION_MAX_TASKS_PER_CHILD or None
+        )
+    return _extraction_executor
+
+def warm_extraction_pool():
+    # Processes are started on demand, so one task per process starts all of
+    # them before the first request pays for it
+    executor = get_extraction_executor()
+    futures = [executor.submit(os.getpid) for _ in range(EXTRACTION_PROCESSES)]
+    return {future.result() for future in futures}
+
+def shutdown_extraction_pool():
+    global _extraction_executor
+    if _extraction_executor is not None:
+        _extraction_executor.shutdown()
+        _extraction_executor = None
+
+async def data_scraping_many(user_id: int, filenames):
+    # S3 downloads and PDF parsing are blocking, so they run on the bounded
+    # worker pool instead of the event loop, all files of a request at once.
+    loop = asyncio.get_running_loop()
+    executor = get_scraping_executor()
+    # Each thread gets its own copy of the request context, so the stages it
+    # times are added to the request's Server-Timing
+    tasks = [
+        loop.run_in_executor(executor, bind_current_context(data_scraping), user_id, filename)
+        for filename in filenames
+    ]
+    return await asyncio.gather(*tasks)
+
+async def data_scraping_upload(user_id: int, filename: str, pdf_data: bytes):
+    # The upload to S3 and the extraction of the same bytes run at the same
+    # time, so a new report is never downloaded back from S3
+    loop = asyncio.get_running_loop()
+    executor = get_scraping_executor()
+    key = f"{user_id}/{filename}"
+    etag, extracted = await asyncio.gather(
+        loop.run_in_executor(executor, bind_current_context(upload_s3_object), key, pdf_data),
+        loop.run_in_executor(executor, bind_current_context(extract_data), pdf_data),
+        return_exceptions=True
+    )
+    if isinstance(extracted, Exception):
+        # No Tests row will point at the object, so it is not left in S3
+        if not isinstance(etag, Exception):
+            try:
+                await loop.run_in_executor(executor, delete_s3_object, key)
+            except Exception:
+                logger.exception("Could not delete '%s' after its extraction failed", key)
+        raise extracted
+    if isinstance(etag, Exception):
+        raise etag
+    dataScraped, dateScraped, stats = extracted
+    logger.info("Extracted uploaded '%s' of user '%s': %s", filename, user_id, stats.as_dict())
+    if etag:
+        pdf_cache.set(f"results:{EXTRACTION_VERSION}:{etag}", (dataScraped, dateScraped))
+    return ScrapingResult(dataScraped, dateScraped, etag)
+
+def data_scraping_as_completed(user_id: int, filenames):
+    executor = get_scraping_executor()
+    futures = {
+        executor.submit(data_scraping, user_id, filename): index
+        for index, filename in enumerate(filenames)
+    }
+    for future in as_completed(futures):
+        yield futures[future], future.result()
@@ -1,61 +1,63 @@
 import os
-import boto3
 from datetime import datetime
-from app.schemas import FormRequest
-
-s3_client = boto3.client(
-    "s3",
-    aws_access_key_id=os.getenv('S3_ACCESS_KEY_ID'),
-    aws_secret_access_key=os.getenv('S3_SECRET_ACCESS_KEY'),
-    region_name=os.getenv('S3_REGION_NAME')
-)
-
-def is_form_filled(form: FormRequest) -> bool:
-    required_form_fields = [
-        form.weight,
-        form.height,
-        form.bmi,
-        form.blood_type,
-        form.abdominal_circumference,
-        form.allergies,
-        form.diseases,
-        form.medications,
-        form.family_history,
-        form.form_status,
-        form.latest_red_blood_cell, 
-        form.latest_hemoglobin, 
-        form.latest_hematocrit, 
-        form.latest_glycated_hemoglobin, 
-        form.latest_ast, 
-        form.latest_alt, 
-        form.latest_urea, 
-        form.latest_creatinine
-    ]
-
-    return all(field is not None for field in required_form_fields)
+from operator import attrgetter
+from app.schemas import FORM_FIELD_NAMES, REQUIRED_FORM_FIELD_NAMES
+
+S3_MAX_POOL_CONNECTIONS = int(os.getenv('S3_MAX_POOL_CONNECTIONS', '50'))
+S3_MAX_ATTEMPTS = int(os.getenv('S3_MAX_ATTEMPTS', '5'))
+S3_RETRY_MODE = os.getenv('S3_RETRY_MODE', 'adaptive')
+S3_CONNECT_TIMEOUT = float(os.getenv('S3_CONNECT_TIMEOUT', '5'))
+S3_READ_TIMEOUT = float(os.getenv('S3_READ_TIMEOUT', '30'))
+S3_USE_ACCELERATE = os.getenv('S3_USE_ACCELERATE', 'false').lower() == 'true'
+S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL') or None
+
+def create_redis_client(url: str, setting: str):
+    # redis is only needed by the Redis backends, so it is not a requirement
+    # of the app; choosing one of them without the package is a setup error
+    try:
+        import redis
+    except ImportError:
+        raise ValueError(f"{setting}='redis' needs the 'redis' package, which is not installed (pip install redis)") from None
+    return redis.Redis.from_url(url)
+
+def create_s3_client():
+    # boto3 takes a large share of the app's import time, so it is only
+    # loaded once a client is needed
+    import boto3
+    from botocore.config import Config
+
+    config = Config(
+        max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+        retries={"max_attempts": S3_MAX_ATTEMPTS, "mode": S3_RETRY_MODE},
+        connect_timeout=S3_CONNECT_TIMEOUT,
+        read_timeout=S3_READ_TIMEOUT,
+        s3={"use_accelerate_endpoint": S3_USE_ACCELERATE}
+    )
+    return boto3.client(
+        "s3",
+        aws_access_key_id=os.getenv('S3_ACCESS_KEY_ID'),
+        aws_secret_access_key=os.getenv('S3_SECRET_ACCESS_KEY'),
+        region_name=os.getenv('S3_REGION_NAME'),
+        endpoint_url=S3_ENDPOINT_URL,
+        config=config
+    )
+
+get_form_values = attrgetter(*FORM_FIELD_NAMES)
+get_required_form_values = attrgetter(*REQUIRED_FORM_FIELD_NAMES)
+
+class RequestError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+def is_form_filled(form) -> bool:
+    return all(value is not None for value in get_required_form_values(form))
 
 def create_form_response(user, user_form):
-    return {
+    response = {
         "name": user.full_name,
-        "age": (datetime.now().date() - user.birth_date).days // 365,
-        "weight": user_form.weight,
-        "height": user_form.height,
-        "bmi": user_form.bmi,
-        "blood_type": user_form.blood_type,
-        "abdominal_circumference": user_form.abdominal_circumference,
-        "allergies": user_form.allergies,
-        "diseases": user_form.diseases,
-        "medications": user_form.medications,
-        "family_history": user_form.family_history,
-        "important_notes": user_form.important_notes,
-        "images_reports": user_form.images_reports,
-        "form_status": user_form.form_status,
-        "latest_red_blood_cell": user_form.latest_red_blood_cell,
-        "latest_hemoglobin": user_form.latest_hemoglobin,
-        "latest_hematocrit": user_form.latest_hematocrit,
-        "latest_glycated_hemoglobin": user_form.latest_glycated_hemoglobin,
-        "latest_ast": user_form.latest_ast,
-        "latest_alt": user_form.latest_alt,
-        "latest_urea": user_form.latest_urea,
-        "latest_creatinine": user_form.latest_creatinine
-    }
\ No newline at end of file
+        "age": (datetime.now().date() - user.birth_date).days // 365
+    }
+    response.update(zip(FORM_FIELD_NAMES, get_form_values(user_form)))
+    return response
@@ -0,0 +1,53 @@
+import time
+import logging
+
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+
+from app import database, scraping
+
+logger = logging.getLogger(__name__)
+
+# Filled by warm_up; GET /ready answers 200 once "ready" is set
+readiness = {"ready": False, "error": None, "steps": {}}
+
+def connect_database():
+    with database.get_engine().connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+async def connect_async_database():
+    async with database.get_async_engine().connect() as connection:
+        await connection.execute(text("SELECT 1"))
+
+def warm_up_steps():
+    steps = [
+        ("s3_client", scraping.get_s3_client),
+        ("pdf_library", scraping.warm_extraction_worker),
+        ("database", connect_database)
+    ]
+    if database.DATABASE_MODE == 'async':
+        steps.append(("async_database", connect_async_database))
+    if scraping.EXTRACTION_EXECUTOR == 'process':
+        steps.append(("extraction_pool", scraping.warm_extraction_pool))
+    return steps
+
+async def warm_up():
+    # Runs in the background after startup: the worker accepts connections
+    # right away and reports ready once the clients and pools it would
+    # otherwise create on the first requests exist
+    readiness.update(ready=False, error=None, steps={})
+    name = None
+    try:
+        for name, step in warm_up_steps():
+            start = time.perf_counter()
+            if name == "async_database":
+                await step()
+            else:
+                await run_in_threadpool(step)
+            readiness["steps"][name] = round(time.perf_counter() - start, 4)
+    except Exception as e:
+        logger.exception("Warm-up failed")
+        readiness["error"] = f"Warm-up failed at '{name}': {e}" if name else f"Warm-up failed: {e}"
+        return
+    readiness["ready"] = True
+    logger.info("Warm-up finished: %s", readiness["steps"])
@@ -0,0 +1,45 @@
+"""Extraction time by report length, per-pattern re.search vs the compiled engine.
+
+Every synthetic page mentions UREIA and CREATININA in a note, so the old
+patterns restart their `.*?RESULTADO` scan from each mention. The report
+without results is the worst case for them.
+
+    python -m benchmarks.bench_extraction
+"""
+import os
+import timeit
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app.scraping import ENGINE, extract_values_from_text
+from benchmarks.synthetic import synthetic_report_text
+
+PAGE_COUNTS = [1, 5, 10, 25, 50, 100]
+
+LEGACY_PATTERNS = {
+    "hemoglobin": (r'HEMOGLOBINA\s*([\d,\.]+)\s*g/dL', "g/dL"),
+    "hematocrit": (r'HEMATÓCRITO\s*([\d,\.]+)\s*%', "%"),
+    "red_blood_cell": (r'HEMÁCIAS\s*([\d,\.]+)\s*milhões/mm3', "milhões/mm3"),
+    "glycated_hemoglobin": (r'HEMOGLOBINA GLICADA - HbA1c\s*.*?RESULTADO:\s*([\d,\.]+)\s*%', "%"),
+    "ast": (r'TRANSAMINASE OXALACÉTICA TGO \(AST\).*?RESULTADO:\s*([\d,\.]+)\s*U/L', "U/L"),
+    "alt": (r'TRANSAMINASE PIRÚVICA TGP \(ALT\).*?RESULTADO:\s*([\d,\.]+)\s*U/L', "U/L"),
+    "urea": (r'UREIA\s*.*?RESULTADO:\s*([\d,\.]+)\s*mg/dL', "mg/dL"),
+    "creatinine": (r'CREATININA\s*.*?RESULTADO:\s*([\d,\.]+)\s*mg/dL', "mg/dL")
+}
+
+def best_of(func, repeat=5):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+def main():
+    print(f"{'pages':>6} {'results':>8} {'legacy (ms)':>12} {'engine (ms)':>12} {'engine us/page':>15}")
+    for with_results in (True, False):
+        for pages in PAGE_COUNTS:
+            text = synthetic_report_text(pages, with_results=with_results)
+            legacy = best_of(lambda: extract_values_from_text(text, LEGACY_PATTERNS))
+            engine = best_of(lambda: ENGINE.extract_values(text))
+            print(f"{pages:>6} {str(with_results):>8} {legacy * 1000:>12.3f} {engine * 1000:>12.3f} {engine * 1e6 / pages:>15.1f}")
+
+if __name__ == "__main__":
+    main()
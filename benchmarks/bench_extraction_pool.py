@@ -0,0 +1,52 @@
+"""Documents/sec of PDF extraction by number of extraction processes.
+
+Every document is a synthetic report with the results on its last page,
+so each one is parsed completely. "threads" runs the extraction inline on
+a thread pool of the same size, where the GIL serializes the work; the
+process rows go through EXTRACTION_EXECUTOR="process" (shared memory in,
+compact tuples out). Scaling stops at the number of cores available.
+
+    python -m benchmarks.bench_extraction_pool
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app import scraping
+from benchmarks.synthetic import synthetic_report_pdf
+
+DOCUMENTS = int(os.getenv("BENCH_DOCUMENTS", "64"))
+PAGES = int(os.getenv("BENCH_PAGES", "20"))
+
+def worker_counts():
+    cores = os.cpu_count() or 1
+    return sorted({1, 2, 4, cores})
+
+def run(extract, pdf_data, workers):
+    # The callers are threads, like the scraping pool that downloads the PDFs
+    with ThreadPoolExecutor(max_workers=workers) as callers:
+        start = time.perf_counter()
+        results = list(callers.map(lambda _: extract(pdf_data), range(DOCUMENTS)))
+        elapsed = time.perf_counter() - start
+    assert all(len(values) == len(scraping.ANALYTE_PATTERNS) for values, _, _ in results)
+    return DOCUMENTS / elapsed
+
+def main():
+    pdf_data = synthetic_report_pdf(PAGES)
+    print(f"{DOCUMENTS} documents of {PAGES} pages, {os.cpu_count()} cores")
+    print(f"{'workers':>8} {'threads (docs/s)':>17} {'processes (docs/s)':>19}")
+    for workers in worker_counts():
+        threads = run(scraping.extract_data_from_pdf, pdf_data, workers)
+        with patch.object(scraping, "EXTRACTION_PROCESSES", workers):
+            try:
+                scraping.warm_extraction_pool()
+                processes = run(scraping.extract_data_in_process_pool, pdf_data, workers)
+            finally:
+                scraping.shutdown_extraction_pool()
+        print(f"{workers:>8} {threads:>17.1f} {processes:>19.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""CPU time to build and serialize one form response.
+
+Compares the hand-written dict of create_form_response rendered with the
+stdlib json encoder of JSONResponse against the FORM_FIELDS mapping
+rendered with ORJSONResponse, for a single form, a form-and-latest-tests
+body, and a cache hit that reuses the serialized body.
+
+    python -m benchmarks.bench_form_response
+"""
+import os
+import time
+from datetime import date, datetime
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
+
+from app.forms import form_cache_entry
+from app.models import User, Form
+from app.schemas import FORM_FIELD_NAMES
+from app.utils import create_form_response
+
+def legacy_form_response(user, user_form):
+    return {
+        "name": user.full_name,
+        "age": (datetime.now().date() - user.birth_date).days // 365,
+        "weight": user_form.weight,
+        "height": user_form.height,
+        "bmi": user_form.bmi,
+        "blood_type": user_form.blood_type,
+        "abdominal_circumference": user_form.abdominal_circumference,
+        "allergies": user_form.allergies,
+        "diseases": user_form.diseases,
+        "medications": user_form.medications,
+        "family_history": user_form.family_history,
+        "important_notes": user_form.important_notes,
+        "images_reports": user_form.images_reports,
+        "form_status": user_form.form_status,
+        "latest_red_blood_cell": user_form.latest_red_blood_cell,
+        "latest_hemoglobin": user_form.latest_hemoglobin,
+        "latest_hematocrit": user_form.latest_hematocrit,
+        "latest_glycated_hemoglobin": user_form.latest_glycated_hemoglobin,
+        "latest_ast": user_form.latest_ast,
+        "latest_alt": user_form.latest_alt,
+        "latest_urea": user_form.latest_urea,
+        "latest_creatinine": user_form.latest_creatinine
+    }
+
+def cpu_time_per_call(func, number=20000, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.process_time()
+        for _ in range(number):
+            func()
+        elapsed = (time.process_time() - start) / number
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    user = User(full_name="Paciente Sintético", birth_date=date(1980, 5, 17))
+    user_form = Form(user_id=1, **{name: f"valor de {name}" for name in FORM_FIELD_NAMES})
+    message = "The following form was found for user with ID '1'"
+
+    def legacy():
+        content = {"status": 200, "message": message, "data": legacy_form_response(user, user_form)}
+        return JSONResponse(content=content, status_code=200).body
+
+    def mapped():
+        content = {"status": 200, "message": message, "data": create_form_response(user, user_form)}
+        return ORJSONResponse(content=content, status_code=200).body
+
+    cached = form_cache_entry({"status": 200, "message": message, "data": create_form_response(user, user_form)})
+
+    def cache_hit():
+        return Response(content=cached["body"], status_code=200, media_type="application/json").body
+
+    assert legacy_form_response(user, user_form) == create_form_response(user, user_form)
+    results = [
+        ("dict + JSONResponse", cpu_time_per_call(legacy)),
+        ("FORM_FIELDS + ORJSONResponse", cpu_time_per_call(mapped)),
+        ("cache hit, serialized body", cpu_time_per_call(cache_hit))
+    ]
+    baseline = results[0][1]
+    print(f"{'response':>30} {'CPU us/response':>16} {'speedup':>8}")
+    for name, seconds in results:
+        print(f"{name:>30} {seconds * 1e6:>16.2f} {baseline / seconds:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""One GET per patient vs POST /data/forms:batch for lists of patients.
+
+Reuses the seeded SQLite file and the simulated per-statement latency of
+bench_concurrency (BENCH_QUERY_LATENCY_MS, default 2 ms). The response
+cache is disabled so every GET reaches the database.
+
+    python -m benchmarks.bench_forms_batch
+"""
+import asyncio
+import os
+import tempfile
+import time
+from unittest.mock import patch
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import httpx
+from sqlalchemy import create_engine, NullPool
+from sqlalchemy.orm import sessionmaker
+
+from app.main import app
+from app.cache import TTLCache
+from app.database import get_db
+from benchmarks.bench_concurrency import add_query_latency, seed, USERS
+
+LIST_SIZES = [10, 50, 200]
+GET_CONCURRENCY = 10
+
+async def per_user_gets(client, user_ids):
+    semaphore = asyncio.Semaphore(GET_CONCURRENCY)
+
+    async def fetch(user_id):
+        async with semaphore:
+            response = await client.get(f"/data/form-and-latest-tests/{user_id}")
+            assert response.status_code == 200
+
+    await asyncio.gather(*(fetch(user_id) for user_id in user_ids))
+
+async def batch(client, user_ids):
+    lines = 0
+    async with client.stream("POST", "/data/forms:batch", json=user_ids) as response:
+        async for _ in response.aiter_lines():
+            lines += 1
+    assert lines == len(user_ids)
+
+async def timed(func, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        url = os.getenv("BENCH_DATABASE_URL", f"sqlite:///{directory}/bench.db")
+        engine = create_engine(url, poolclass=NullPool)
+        seed(engine)
+        add_query_latency(engine)
+        session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        def override_get_db():
+            db = session_factory()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        app.dependency_overrides[get_db] = override_get_db
+        transport = httpx.ASGITransport(app=app)
+        print(f"{'patients':>9} {f'GETs x{GET_CONCURRENCY} (ms)':>16} {'batch (ms)':>11} {'speedup':>8}")
+        with patch("app.routers.data.form_cache", TTLCache(max_entries=0, ttl=0)):
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                for size in LIST_SIZES:
+                    user_ids = list(range(1, min(size, USERS) + 1))
+                    gets = await timed(per_user_gets, client, user_ids)
+                    batched = await timed(batch, client, user_ids)
+                    print(f"{len(user_ids):>9} {gets * 1000:>16.1f} {batched * 1000:>11.1f} {gets / batched:>7.1f}x")
+        app.dependency_overrides.clear()
+        engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
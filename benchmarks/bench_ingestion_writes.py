@@ -0,0 +1,78 @@
+"""Write path of POST /data/tests-processing: per-row ORM vs batched statements.
+
+Compares fetching the tests one SELECT at a time with a single IN query,
+and adding each DerivedHealthData through the ORM with one Core bulk
+insert, on a SQLite file database.
+
+    python -m benchmarks.bench_ingestion_writes
+"""
+import os
+import tempfile
+import time
+from datetime import date, datetime
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.database import Base
+from app.ingestion import METRICS, get_user_tests, save_scraping_results
+from app.scraping import DataScraped
+
+BATCH_SIZE = int(os.getenv("BENCH_BATCH_SIZE", "50"))
+BATCHES = int(os.getenv("BENCH_BATCHES", "40"))
+
+def per_row_write(db, user_id, user_form, testsIdList, scraping_results):
+    # The write path as it was before: one SELECT per test, one ORM add per value
+    tests = []
+    for test_id in testsIdList:
+        tests.append(db.query(models.Test).filter(models.Test.id == test_id).first())
+    for test, (dataScraped, dateScraped) in zip(tests, scraping_results):
+        test.test_date = dateScraped
+        db.add(test)
+        for data in dataScraped:
+            db.add(models.DerivedHealthData(form_id=user_form.id, test_id=test.id, name=data.name, value=data.value))
+    db.commit()
+
+def batched_write(db, user_id, user_form, testsIdList, scraping_results):
+    tests = get_user_tests(db, user_id, testsIdList)
+    save_scraping_results(db, user_form, tests, scraping_results)
+
+def run(label, write):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{directory}/bench.db")
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as connection:
+            connection.execute(insert(models.User), [{"id": 1, "full_name": "User", "email": "user@example.com", "password": "x", "birth_date": date(1980, 1, 1)}])
+            connection.execute(insert(models.Form), [{"id": 1, "user_id": 1}])
+            connection.execute(insert(models.Test), [
+                {"id": test_id, "user_id": 1, "test_name": f"{test_id}.pdf", "url": ""}
+                for test_id in range(1, BATCH_SIZE * BATCHES + 1)
+            ])
+
+        Session = sessionmaker(bind=engine)
+        scraping_results = [
+            ([DataScraped(metric, "1.0") for metric in METRICS], datetime(2023, 1, 1))
+            for _ in range(BATCH_SIZE)
+        ]
+        elapsed = 0.0
+        for batch in range(BATCHES):
+            testsIdList = list(range(batch * BATCH_SIZE + 1, (batch + 1) * BATCH_SIZE + 1))
+            with Session() as db:
+                user_form = db.get(models.Form, 1)
+                start = time.perf_counter()
+                write(db, 1, user_form, testsIdList, scraping_results)
+                elapsed += time.perf_counter() - start
+
+        rows = BATCHES * BATCH_SIZE * len(METRICS)
+        print(f"{label:>12}: {rows} rows in {elapsed:6.3f} s, {rows / elapsed:10.0f} rows/s")
+
+def main():
+    print(f"{BATCHES} requests of {BATCH_SIZE} tests with {len(METRICS)} values each")
+    run("per row", per_row_write)
+    run("batched", batched_write)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""String DerivedHealthData vs the typed LabResults table.
+
+Seeds a SQLite file with string results, migrates them with
+backfill_lab_results and compares the on-disk size of both tables (with
+their indexes, from SQLite's dbstat) and the time of two queries:
+
+* latest value of every metric of a user;
+* hemoglobin results of a user between 12 and 14 g/dL, which on the string
+  table needs a CAST of every row.
+
+SQLite keeps TIMESTAMP columns as 26-byte text, so the denormalized
+test_date makes LabResults look larger than it is on PostgreSQL (8 bytes).
+Point BENCH_DATABASE_URL at an empty PostgreSQL database to measure there.
+
+    python -m benchmarks.bench_lab_results
+"""
+import os
+import tempfile
+import time
+import timeit
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine, select, func, text, Float, cast
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.ingestion import METRICS, get_latest_values
+from app.lab_results import ANALYTES, backfill_lab_results
+from benchmarks.bench_latest_values import seed, USERS, TESTS_PER_USER
+
+def string_latest_values(db, form_id):
+    # The lookup before LabResults: ranked over the string rows joined to Tests
+    order_by = (models.Test.test_date.desc(), models.DerivedHealthData.id.desc())
+    ranked = (
+        select(
+            models.DerivedHealthData.name,
+            models.DerivedHealthData.value,
+            func.row_number().over(partition_by=models.DerivedHealthData.name, order_by=order_by).label('position')
+        )
+        .join(models.Test, models.DerivedHealthData.test_id == models.Test.id)
+        .where(models.DerivedHealthData.form_id == form_id, models.DerivedHealthData.name.in_(METRICS))
+        .subquery()
+    )
+    return dict(db.execute(select(ranked.c.name, ranked.c.value).where(ranked.c.position == 1)).all())
+
+def string_range(db, form_id):
+    value = cast(models.DerivedHealthData.value, Float)
+    return db.execute(
+        select(models.Test.test_date, models.DerivedHealthData.value)
+        .join(models.Test, models.DerivedHealthData.test_id == models.Test.id)
+        .where(models.DerivedHealthData.form_id == form_id, models.DerivedHealthData.name == "hemoglobin")
+        .where(value.between(12, 14))
+    ).all()
+
+def typed_range(db, user_id):
+    return db.execute(
+        select(models.LabResult.test_date, models.LabResult.value)
+        .where(models.LabResult.user_id == user_id, models.LabResult.analyte == ANALYTES["hemoglobin"])
+        .where(models.LabResult.value.between(12, 14))
+    ).all()
+
+def object_bytes(db, name):
+    if db.get_bind().dialect.name == 'postgresql':
+        return db.execute(text("SELECT pg_relation_size(quote_ident(:name))"), {"name": name}).scalar() or 0
+    return db.execute(text("SELECT SUM(pgsize) FROM dbstat WHERE name = :name"), {"name": name}).scalar() or 0
+
+def table_bytes(db, table):
+    return object_bytes(db, table.name), sum(object_bytes(db, index.name) for index in table.indexes)
+
+def best_of(func):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=5, number=number)) / number
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(os.getenv("BENCH_DATABASE_URL", f"sqlite:///{directory}/bench.db"))
+        start = time.perf_counter()
+        seed(engine)
+        print(f"{USERS} users, {TESTS_PER_USER * len(METRICS)} results per user, "
+              f"seeded and migrated in {time.perf_counter() - start:.1f} s")
+
+        with sessionmaker(bind=engine)() as db:
+            assert backfill_lab_results(db) == 0
+            if engine.dialect.name == 'postgresql':
+                # Sets the visibility map, without it there is no index-only scan
+                with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+                    connection.execute(text('VACUUM ANALYZE "LabResults"'))
+            string_size = table_bytes(db, models.DerivedHealthData.__table__)
+            typed_size = table_bytes(db, models.LabResult.__table__)
+            print(f"\n{'table':>18} {'rows (KB)':>10} {'indexes (KB)':>13}")
+            for label, (rows, indexes) in (("DerivedHealthData", string_size), ("LabResults", typed_size)):
+                print(f"{label:>18} {rows / 1024:>10.0f} {indexes / 1024:>13.0f}")
+
+            user_id = USERS // 2
+            assert len(string_range(db, user_id)) == len(typed_range(db, user_id))
+            print(f"\n{'query':>14} {'strings (ms)':>13} {'typed (ms)':>11}")
+            for label, string_query, typed_query in (
+                ("latest values", string_latest_values, get_latest_values),
+                ("value range", string_range, typed_range),
+            ):
+                string_time = best_of(lambda: string_query(db, user_id))
+                typed_time = best_of(lambda: typed_query(db, user_id))
+                print(f"{label:>14} {string_time * 1000:>13.2f} {typed_time * 1000:>11.2f}")
+
+if __name__ == "__main__":
+    main()
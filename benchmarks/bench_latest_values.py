@@ -0,0 +1,105 @@
+"""Latest value per metric: one query per metric, a single ranked query
+and the incremental update done by ingestion.
+
+Seeds a SQLite database with thousands of results per user and times the
+lookup a full rebuild runs against the comparison of one new test's
+results with the stored latest values, which POST /data/tests-processing
+does since the forms keep the date of each latest value.
+
+    python -m benchmarks.bench_latest_values
+"""
+import os
+import random
+import tempfile
+import timeit
+from datetime import date, datetime, timedelta
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.database import Base
+from app.ingestion import METRICS, get_latest_values, apply_latest_values
+from app.lab_results import ANALYTES, backfill_lab_results
+
+USERS = int(os.getenv("BENCH_USERS", "20"))
+TESTS_PER_USER = int(os.getenv("BENCH_TESTS_PER_USER", "500"))
+
+def per_metric_latest_values(db, user_id):
+    # The lookup as it was done before: one joined query per metric
+    latest_values = {}
+    for metric in METRICS:
+        latest_value = (
+            db.query(models.DerivedHealthData)
+            .join(models.Test, models.DerivedHealthData.test_id == models.Test.id)
+            .join(models.Form, models.DerivedHealthData.form_id == models.Form.id)
+            .filter(
+                models.DerivedHealthData.name == metric,
+                models.Form.user_id == user_id
+            )
+            .order_by(models.Test.test_date.desc())
+            .first()
+        )
+        latest_values[metric] = latest_value.value if latest_value else None
+    return latest_values
+
+def seed(engine):
+    random.seed(42)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(insert(models.User), [
+            {"id": user_id, "full_name": f"User {user_id}", "email": f"user{user_id}@example.com",
+             "password": "x", "birth_date": date(1980, 1, 1)}
+            for user_id in range(1, USERS + 1)
+        ])
+        connection.execute(insert(models.Form), [
+            {"id": user_id, "user_id": user_id} for user_id in range(1, USERS + 1)
+        ])
+        tests, results = [], []
+        test_id = 0
+        for user_id in range(1, USERS + 1):
+            for _ in range(TESTS_PER_USER):
+                test_id += 1
+                tests.append({"id": test_id, "user_id": user_id, "test_name": f"{test_id}.pdf", "url": "",
+                              "test_date": datetime(2010, 1, 1) + timedelta(days=random.randint(0, 5000))})
+                results.extend(
+                    {"form_id": user_id, "test_id": test_id, "name": metric, "value": f"{random.uniform(1, 100):.1f}"}
+                    for metric in METRICS
+                )
+        connection.execute(insert(models.Test), tests)
+        connection.execute(insert(models.DerivedHealthData), results)
+    with sessionmaker(bind=engine)() as db:
+        backfill_lab_results(db)
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{directory}/bench.db")
+        seed(engine)
+        Session = sessionmaker(bind=engine)
+        print(f"{USERS} users, {TESTS_PER_USER} tests and {TESTS_PER_USER * len(METRICS)} results per user")
+
+        with Session() as db:
+            user_id = USERS // 2
+            user_form = db.get(models.Form, user_id)
+            new_results = [
+                {"user_id": user_id, "analyte": ANALYTES[metric], "value": 42.0, "test_date": datetime(2024, 1, 1)}
+                for metric in METRICS
+            ]
+            assert all(
+                float(expected) == float(actual)
+                for expected, actual in zip(per_metric_latest_values(db, user_id).values(), get_latest_values(db, user_id).values())
+            )
+            for label, func in (
+                ("one query per metric", lambda: per_metric_latest_values(db, user_id)),
+                ("single ranked query", lambda: get_latest_values(db, user_id)),
+                ("incremental, one test", lambda: apply_latest_values(user_form, new_results)),
+            ):
+                timer = timeit.Timer(func)
+                number, _ = timer.autorange()
+                best = min(timer.repeat(repeat=5, number=number)) / number
+                print(f"{label:>22}: {best * 1000:8.2f} ms")
+
+if __name__ == "__main__":
+    main()
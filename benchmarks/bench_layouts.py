@@ -0,0 +1,69 @@
+"""Per-document extraction time with 1, 10 and 50 registered lab layouts.
+
+The document is a synthetic report of the lab whose layout is registered
+last. "try all" runs every layout's engine over the text and keeps the one
+that found the most values, which is what supporting more labs costs
+without detection; "detect" fingerprints the first page and runs only the
+layout it picks.
+
+    python -m benchmarks.bench_layouts
+"""
+import os
+import timeit
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app.layouts import LayoutRegistry
+from app.scraping import ExtractionEngine, ANALYTE_PATTERNS, DATE_PATTERN
+from benchmarks.synthetic import synthetic_report_pages
+
+LAYOUT_COUNTS = [1, 10, 50]
+PAGES = int(os.getenv("BENCH_PAGES", "5"))
+
+def other_lab_patterns(index):
+    return {
+        name: (f"{header} L{index}", pattern, unit)
+        for name, (header, pattern, unit) in ANALYTE_PATTERNS.items()
+    }
+
+def make_registry(count):
+    registry = LayoutRegistry(ExtractionEngine)
+    if count == 1:
+        registry.register("synthetic", ANALYTE_PATTERNS, DATE_PATTERN, default=True)
+        return registry
+    registry.register("fallback", other_lab_patterns(0), DATE_PATTERN, default=True)
+    for index in range(1, count - 1):
+        registry.register(f"lab-{index}", other_lab_patterns(index), DATE_PATTERN, [f"Diagnósticos {index}", f"Unidade L{index}"])
+    registry.register("synthetic", ANALYTE_PATTERNS, DATE_PATTERN, ["LABORATÓRIO SINTÉTICO"])
+    assert len(registry.layouts) == count
+    return registry
+
+def try_all(registry, text):
+    best = max(registry.layouts, key=lambda layout: len(layout.engine.extract_values(text)))
+    return best.engine.extract_values(text), best.engine.extract_date(text)
+
+def detect(registry, text, first_page):
+    engine = registry.detect(first_page).engine
+    return engine.extract_values(text), engine.extract_date(text)
+
+def best_of(func):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=5, number=number)) / number
+
+def main():
+    pages = synthetic_report_pages(PAGES)
+    text = "".join(pages)
+    print(f"{PAGES}-page report, {len(text)} characters")
+    print(f"{'layouts':>8} {'try all (ms)':>13} {'detect (ms)':>12} {'detection only (µs)':>20}")
+    for count in LAYOUT_COUNTS:
+        registry = make_registry(count)
+        assert len(detect(registry, text, pages[0])[0]) == len(ANALYTE_PATTERNS)
+        assert registry.detect(pages[0]).name == "synthetic"
+        all_time = best_of(lambda: try_all(registry, text))
+        detect_time = best_of(lambda: detect(registry, text, pages[0]))
+        detection = best_of(lambda: registry.detect(pages[0]))
+        print(f"{count:>8} {all_time * 1000:>13.2f} {detect_time * 1000:>12.2f} {detection * 1e6:>20.1f}")
+
+if __name__ == "__main__":
+    main()
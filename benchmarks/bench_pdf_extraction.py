@@ -0,0 +1,52 @@
+"""Full-text vs page-lazy extraction of synthetic PDFs.
+
+The S3 client is replaced by an in-memory object store, so the numbers
+cover reading the body, PyMuPDF and the value extraction only.
+
+    python -m benchmarks.bench_pdf_extraction
+"""
+import io
+import os
+import time
+from unittest.mock import patch
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app.scraping import extract_data_from_s3_pdf, extract_text_from_s3_pdf, text_processing
+from benchmarks.synthetic import synthetic_report_pdf
+
+PAGE_COUNTS = [1, 10, 50, 100]
+
+class InMemoryS3:
+    def __init__(self, objects):
+        self.objects = objects
+
+    def get_object(self, Bucket, Key, Range=None):
+        # The ranges of the download are ignored: every report is smaller
+        # than S3_RANGE_CHUNK_SIZE, so the first range is the whole object
+        data = self.objects[Key]
+        return {"Body": io.BytesIO(data), "ContentLength": len(data)}
+
+def timed(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    print(f"{'pages':>6} {'results':>8} {'full (ms)':>10} {'lazy (ms)':>10} {'touched':>8} {'bytes':>9} {'process peak rss (MB)':>22}")
+    for results_page in ("first", "last"):
+        for pages in PAGE_COUNTS:
+            pdf_data = synthetic_report_pdf(pages, results_page=0 if results_page == "first" else None)
+            s3 = InMemoryS3({"1/report.pdf": pdf_data})
+            with patch("app.scraping.s3_client", s3):
+                full, _ = timed(lambda: text_processing(extract_text_from_s3_pdf(1, "report.pdf")))
+                lazy, (_, _, stats) = timed(lambda: extract_data_from_s3_pdf(1, "report.pdf"))
+            print(f"{pages:>6} {results_page:>8} {full * 1000:>10.1f} {lazy * 1000:>10.1f} "
+                  f"{stats.pages_touched:>8} {stats.bytes_read:>9} {stats.process_peak_rss_kb / 1024:>22.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Throughput of GET /data/form-and-latest-tests by connection pool size.
+
+Starts uvicorn with several workers for each DB_POOL_SIZE, drives it over
+HTTP with parallel clients and reads /pool-stats afterwards. Uses a SQLite
+file unless BENCH_DATABASE_URL points at PostgreSQL, which is where pool
+sizing really matters.
+
+    python -m benchmarks.bench_pool
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import httpx
+from sqlalchemy import create_engine
+
+from benchmarks.bench_concurrency import USERS, seed
+
+POOL_SIZES = [1, 2, 5, 10]
+WORKERS = int(os.getenv("BENCH_WORKERS", "4"))
+CLIENTS = int(os.getenv("BENCH_CLIENTS", "64"))
+DURATION = float(os.getenv("BENCH_DURATION", "5"))
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(database_url, pool_size, port):
+    env = dict(
+        os.environ,
+        DATABASE_URL=database_url,
+        DB_POOL_SIZE=str(pool_size),
+        DB_MAX_OVERFLOW="0",
+        DB_POOL_TIMEOUT="10"
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--workers", str(WORKERS), "--log-level", "warning"],
+        env=env
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return process
+        except httpx.TransportError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("uvicorn did not start")
+
+async def load(base_url):
+    completed = 0
+    errors = 0
+    deadline = time.monotonic() + DURATION
+    limits = httpx.Limits(max_connections=CLIENTS)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        async def worker(offset):
+            nonlocal completed, errors
+            user_id = offset
+            while time.monotonic() < deadline:
+                response = await client.get(f"/data/form-and-latest-tests/{user_id % USERS + 1}")
+                if response.status_code == 200:
+                    completed += 1
+                else:
+                    errors += 1
+                user_id += CLIENTS
+
+        await asyncio.gather(*(worker(offset) for offset in range(CLIENTS)))
+        stats = {}
+        for _ in range(WORKERS * 4):
+            data = (await client.get("/pool-stats")).json()["data"]
+            stats[data["pid"]] = data.get("async") or data["sync"]
+    return completed / DURATION, errors, stats
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = os.getenv("BENCH_DATABASE_URL", f"sqlite:///{directory}/bench.db")
+        seed(create_engine(database_url))
+        print(f"{WORKERS} uvicorn workers, {CLIENTS} clients, {DURATION:.0f} s per run")
+        print(f"{'pool':>5} {'req/s':>8} {'errors':>7} {'timeouts':>9} {'max wait (ms)':>14} {'peak in use':>12}")
+        for pool_size in POOL_SIZES:
+            port = free_port()
+            process = start_server(database_url, pool_size, port)
+            try:
+                throughput, errors, stats = asyncio.run(load(f"http://127.0.0.1:{port}"))
+            finally:
+                process.terminate()
+                process.wait()
+            timeouts = sum(s["timeouts"] for s in stats.values())
+            max_wait = max(s["wait_seconds_max"] for s in stats.values())
+            peak = max(s["peak_checked_out"] for s in stats.values())
+            print(f"{pool_size:>5} {throughput:>8.0f} {errors:>7} {timeouts:>9} {max_wait * 1000:>14.1f} {peak:>12}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Normalizing and flagging lab results: per-row Python vs one NumPy pass.
+
+Scores batches like the ones written by python -m app.backfill, with mixed
+units (creatinine in mg/dL and µmol/L, hemoglobin in g/dL and g/L) and
+users of both sexes and all ages.
+
+    python -m benchmarks.bench_reference_ranges
+"""
+import os
+import random
+import time
+from datetime import date, datetime
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app.lab_results import (
+    ANALYTES, ANALYTE_NAMES, CANONICAL_UNITS, UNIT_CONVERSIONS, REFERENCE_RANGES,
+    FLAG_LOW, FLAG_NORMAL, FLAG_HIGH, evaluate_lab_results, unit_key
+)
+from app.models import User
+
+BATCH_SIZES = [1000, 10000, 100000]
+UNITS = {
+    "creatinine": ["mg/dL", "µmol/L"],
+    "hemoglobin": ["g/dL", "g/L"],
+}
+
+def per_row_evaluation(rows, users_by_id):
+    # What the evaluation costs when every row looks up its conversion and
+    # its range one at a time
+    for row in rows:
+        name = ANALYTE_NAMES[row["analyte"]]
+        user = users_by_id[row["user_id"]]
+        key = unit_key(row["unit"])
+        if key == unit_key(CANONICAL_UNITS[name]):
+            factor, offset = 1.0, 0.0
+        elif (name, key) in UNIT_CONVERSIONS:
+            factor, offset = UNIT_CONVERSIONS[(name, key)]
+        else:
+            row["flag"] = None
+            continue
+        value = float(row["value"]) * factor + offset
+        age = (row["test_date"].date() - user.birth_date).days / 365.2425
+        low = high = None
+        for range_name, sex, from_age, range_low, range_high in REFERENCE_RANGES:
+            if range_name == name and sex in (None, user.biological_sex) and age >= from_age:
+                low, high = range_low, range_high
+        row["value"] = round(value, 4)
+        row["unit"] = CANONICAL_UNITS[name]
+        row["flag"] = None if low is None else FLAG_LOW if value < low else FLAG_HIGH if value > high else FLAG_NORMAL
+    return rows
+
+def make_batch(size, users):
+    random.seed(size)
+    rows = []
+    for _ in range(size):
+        name = random.choice(list(ANALYTES))
+        rows.append({
+            "user_id": random.choice(users).id,
+            "test_id": 1,
+            "analyte": ANALYTES[name],
+            "value": random.uniform(0.5, 60),
+            "unit": random.choice(UNITS.get(name, [CANONICAL_UNITS[name]])),
+            "test_date": datetime(2024, 1, 1),
+            "flag": None
+        })
+    return rows
+
+def timed(func, size, users_by_id, users):
+    rows = make_batch(size, users)
+    start = time.perf_counter()
+    func(rows, users_by_id)
+    return time.perf_counter() - start, rows
+
+def main():
+    users = [
+        User(id=user_id, biological_sex=random.choice("MF"), birth_date=date(random.randint(1940, 2020), 1, 1))
+        for user_id in range(1, 501)
+    ]
+    users_by_id = {user.id: user for user in users}
+    print(f"{'results':>8} {'per row (ms)':>13} {'NumPy (ms)':>11} {'speedup':>8}")
+    for size in BATCH_SIZES:
+        per_row, expected = timed(per_row_evaluation, size, users_by_id, users)
+        vectorized, rows = timed(evaluate_lab_results, size, users_by_id, users)
+        assert [row["flag"] for row in rows] == [row["flag"] for row in expected]
+        print(f"{size:>8} {per_row * 1000:>13.1f} {vectorized * 1000:>11.1f} {per_row / vectorized:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Single GET vs parallel ranged downloads against a local moto S3 server.
+
+Needs moto[server] (not part of requirements.txt). The server runs on
+localhost, so the numbers show the overhead of the ranged path and the
+client pool rather than real network gains.
+
+    python -m benchmarks.bench_s3_download
+"""
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("S3_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("S3_SECRET_ACCESS_KEY", "testing")
+os.environ.setdefault("S3_REGION_NAME", "us-east-1")
+os.environ["S3_BUCKET_NAME"] = "bench"
+
+from moto.server import ThreadedMotoServer
+
+import app.scraping as scraping
+import app.utils as utils
+
+BUCKET = os.environ["S3_BUCKET_NAME"]
+SIZES_MB = [1, 8, 32, 64]
+CONCURRENT_DOWNLOADS = 32
+POOL_SIZES = [10, 50]
+MOTO_PORT = int(os.getenv("MOTO_PORT", "5055"))
+
+def timed(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def single_get(client, key):
+    return client.get_object(Bucket=BUCKET, Key=key)["Body"].read()
+
+def make_client(endpoint, pool_size):
+    with patch.object(utils, "S3_ENDPOINT_URL", endpoint), \
+            patch.object(utils, "S3_MAX_POOL_CONNECTIONS", pool_size):
+        return utils.create_s3_client()
+
+def main():
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=MOTO_PORT)
+    server.start()
+    endpoint = f"http://127.0.0.1:{MOTO_PORT}"
+    try:
+        client = make_client(endpoint, 50)
+        client.create_bucket(Bucket=BUCKET)
+        for size in SIZES_MB:
+            client.put_object(Bucket=BUCKET, Key=f"{size}mb", Body=os.urandom(size * 1024 * 1024))
+
+        print(f"chunk size {scraping.S3_RANGE_CHUNK_SIZE // (1024 * 1024)} MB, {scraping.S3_RANGE_CONCURRENCY} ranges in parallel")
+        print(f"{'size (MB)':>10} {'single GET (MB/s)':>18} {'ranged (MB/s)':>14}")
+        with patch.object(scraping, "s3_client", client):
+            for size in SIZES_MB:
+                key = f"{size}mb"
+                single = timed(lambda: single_get(client, key))
+                ranged = timed(lambda: scraping.download_s3_object(key))
+                print(f"{size:>10} {size / single:>18.1f} {size / ranged:>14.1f}")
+
+        print(f"\n{CONCURRENT_DOWNLOADS} concurrent 1 MB downloads")
+        print(f"{'max_pool_connections':>21} {'seconds':>8}")
+        for pool_size in POOL_SIZES:
+            pooled = make_client(endpoint, pool_size)
+            def run():
+                with ThreadPoolExecutor(CONCURRENT_DOWNLOADS) as executor:
+                    list(executor.map(lambda _: single_get(pooled, "1mb"), range(CONCURRENT_DOWNLOADS)))
+            print(f"{pool_size:>21} {timed(run):>8.2f}")
+    finally:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""End-to-end benchmarks of extraction, ingestion, uploads and form reads,
+saved as JSON.
+
+Synthetic reports are generated with fitz and served by a local moto S3
+server (moto[server], not part of requirements.txt); the database is a
+seeded SQLite file unless BENCH_DATABASE_URL points at PostgreSQL. Each run
+writes its numbers with the commit and machine it ran on, and --compare
+prints the change against an earlier run:
+
+    python -m benchmarks.bench_suite
+    python -m benchmarks.bench_suite --quick --compare benchmarks/results/<earlier>.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timezone
+from unittest.mock import patch
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("S3_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("S3_SECRET_ACCESS_KEY", "testing")
+os.environ.setdefault("S3_REGION_NAME", "us-east-1")
+os.environ["S3_BUCKET_NAME"] = "bench"
+
+from fastapi.testclient import TestClient
+from moto.server import ThreadedMotoServer
+from sqlalchemy import create_engine, insert, update
+from sqlalchemy.orm import sessionmaker
+
+import app.scraping as scraping
+import app.utils as utils
+from app import models
+from app.main import app
+from app.database import Base, get_db
+from app.forms import form_cache
+from benchmarks.synthetic import synthetic_report_pdf
+
+BUCKET = os.environ["S3_BUCKET_NAME"]
+MOTO_PORT = int(os.getenv("MOTO_PORT", "5055"))
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+USERS = 200
+PAGES = [2, 10]
+BATCH_SIZES = [1, 5, 10, 20]
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def seed(engine):
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(insert(models.User), [
+            {"id": user_id, "full_name": f"User {user_id}", "email": f"user{user_id}@example.com",
+             "password": "x", "birth_date": date(1980, 1, 1), "biological_sex": "F"}
+            for user_id in range(1, USERS + 1)
+        ])
+        connection.execute(insert(models.Form), [
+            {"id": user_id, "user_id": user_id, "weight": "70", "latest_hemoglobin": "13.5"}
+            for user_id in range(1, USERS + 1)
+        ])
+        connection.execute(insert(models.Test), [
+            {"id": test_id, "user_id": 1, "test_name": f"exam{test_id}.pdf", "url": f"https://{BUCKET}/1/exam{test_id}.pdf"}
+            for test_id in range(1, max(BATCH_SIZES) + 1)
+        ])
+
+def upload_reports(client):
+    client.create_bucket(Bucket=BUCKET)
+    for pages in PAGES:
+        client.put_object(Bucket=BUCKET, Key=f"bench/{pages}-pages.pdf", Body=synthetic_report_pdf(pages))
+    report = synthetic_report_pdf(2)
+    for test_id in range(1, max(BATCH_SIZES) + 1):
+        client.put_object(Bucket=BUCKET, Key=f"1/exam{test_id}.pdf", Body=report)
+
+def bench_extraction(documents):
+    results = {}
+    for pages in PAGES:
+        key = f"bench/{pages}-pages.pdf"
+        pdf_data = scraping.download_s3_object(key)
+
+        start = time.perf_counter()
+        for _ in range(documents):
+            scraping.extract_data_from_pdf(pdf_data)
+        in_memory = documents / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(documents):
+            scraping.extract_data_from_pdf(scraping.download_s3_object(key))
+        from_s3 = documents / (time.perf_counter() - start)
+
+        results[f"{pages}_pages"] = {"docs_per_second": round(from_s3, 1), "in_memory_docs_per_second": round(in_memory, 1)}
+    return results
+
+def bench_tests_processing(client, engine, repeats):
+    results = {}
+    for batch_size in BATCH_SIZES:
+        latencies = []
+        for _ in range(repeats):
+            # Every request must really download and extract its tests
+            with engine.begin() as connection:
+                connection.execute(update(models.Test).values(content_hash=None, extractor_version=None))
+            scraping.pdf_cache.clear()
+
+            start = time.perf_counter()
+            response = client.post("/data/tests-processing/1", json=list(range(1, batch_size + 1)))
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.text
+        results[str(batch_size)] = {
+            "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2)
+        }
+    return results
+
+def bench_upload(client, engine, s3_client, repeats):
+    # A fresh report: uploaded to S3 by the client and then processed, which
+    # downloads it back, against one POST /data/tests-upload
+    report = synthetic_report_pdf(2)
+    results = {}
+    for name in ("upload_then_process", "tests_upload"):
+        latencies = []
+        for index in range(repeats):
+            filename = f"{name}-{index}.pdf"
+            start = time.perf_counter()
+            if name == "tests_upload":
+                response = client.post("/data/tests-upload/2", files={"file": (filename, report, "application/pdf")})
+            else:
+                s3_client.put_object(Bucket=BUCKET, Key=f"2/{filename}", Body=report)
+                with engine.begin() as connection:
+                    test_id = connection.execute(
+                        insert(models.Test).values(user_id=2, test_name=filename, url=f"https://{BUCKET}/2/{filename}")
+                    ).inserted_primary_key[0]
+                response = client.post("/data/tests-processing/2", json=[test_id])
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code in (200, 201), response.text
+        results[name] = {"p50_ms": round(percentile(latencies, 0.5) * 1000, 2)}
+    return results
+
+def bench_get_form(client, duration):
+    results = {}
+    for name, cached in (("cached_qps", True), ("uncached_qps", False)):
+        form_cache.clear()
+        requests = 0
+        deadline = time.perf_counter() + duration
+        start = time.perf_counter()
+        while time.perf_counter() < deadline:
+            if not cached:
+                form_cache.clear()
+            response = client.get(f"/data/form-and-latest-tests/{requests % USERS + 1}")
+            assert response.status_code == 200, response.text
+            requests += 1
+        results[name] = round(requests / (time.perf_counter() - start), 1)
+    return results
+
+def flatten(results, prefix=""):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f"{prefix}{key}.")
+        else:
+            yield f"{prefix}{key}", value
+
+def compare(previous, current):
+    before = dict(flatten(previous["results"]))
+    print(f"\ncompared with {previous['meta'].get('commit')} ({previous['meta'].get('timestamp')})")
+    print(f"{'metric':>45} {'before':>10} {'after':>10} {'change':>8}")
+    for metric, value in flatten(current["results"]):
+        if metric in before and before[metric]:
+            change = (value - before[metric]) / before[metric] * 100
+            print(f"{metric:>45} {before[metric]:>10} {value:>10} {change:>+7.1f}%")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="JSON file for the results (default: benchmarks/results/<timestamp>-<commit>.json)")
+    parser.add_argument("--compare", help="JSON file of an earlier run")
+    parser.add_argument("--quick", action="store_true", help="fewer documents and repetitions")
+    args = parser.parse_args(argv)
+    documents, repeats, duration = (10, 5, 1.0) if args.quick else (50, 30, 5.0)
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=MOTO_PORT)
+    server.start()
+    try:
+        with patch.object(utils, "S3_ENDPOINT_URL", f"http://127.0.0.1:{MOTO_PORT}"):
+            s3_client = utils.create_s3_client()
+        upload_reports(s3_client)
+
+        with tempfile.TemporaryDirectory() as directory:
+            database_url = os.getenv("BENCH_DATABASE_URL", f"sqlite:///{directory}/bench.db")
+            engine = create_engine(database_url)
+            seed(engine)
+            SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+            def override_get_db():
+                db = SessionLocal()
+                try:
+                    yield db
+                finally:
+                    db.close()
+
+            app.dependency_overrides[get_db] = override_get_db
+            client = TestClient(app)
+            with patch.object(scraping, "s3_client", s3_client):
+                results = {
+                    "extraction": bench_extraction(documents),
+                    "tests_processing": bench_tests_processing(client, engine, repeats),
+                    "upload": bench_upload(client, engine, s3_client, repeats),
+                    "get_form": bench_get_form(client, duration)
+                }
+            app.dependency_overrides.pop(get_db)
+            engine.dispose()
+    finally:
+        server.stop()
+
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    commit = git_commit()
+    run = {
+        "meta": {
+            "timestamp": timestamp,
+            "commit": commit,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "database": engine.dialect.name,
+            "quick": args.quick
+        },
+        "results": results
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{timestamp}-{commit or 'unknown'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(run, file, indent=2)
+
+    for metric, value in flatten(results):
+        print(f"{metric:>45} {value:>10}")
+    print(f"\nsaved to {output}")
+    if args.compare:
+        with open(args.compare) as file:
+            compare(json.load(file), run)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""Latency of POST /data/tests-processing by number of tests and pool size.
+
+S3 and PyMuPDF are replaced by a fixed sleep per file so the numbers only
+reflect how the route schedules the work. Pool size 1 reproduces the old
+one-test-at-a-time behaviour.
+
+    python -m benchmarks.bench_tests_processing
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from unittest.mock import patch
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, StaticPool
+from sqlalchemy.orm import sessionmaker
+
+from app import scraping
+from app.main import app
+from app.database import Base, get_db
+from app.models import User, Test
+from app.scraping import DataScraped
+
+SCRAPING_LATENCY = float(os.getenv("BENCH_SCRAPING_LATENCY", "0.05"))
+BATCH_SIZES = [1, 2, 5, 10, 20]
+POOL_SIZES = [1, 4, 8, 16]
+
+engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def override_get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def slow_data_scraping(user_id, filename):
+    time.sleep(SCRAPING_LATENCY)
+    return [DataScraped("hemoglobin", "13.5")], datetime(2023, 1, 1)
+
+def seed(max_tests):
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        db.add(User(id=1, full_name="Bench User", email="bench@example.com", password="x", birth_date=date(2000, 1, 1)))
+        db.add_all([
+            Test(id=i, user_id=1, test_name=f"exam{i}.pdf", url=f"https://bucket/1/exam{i}.pdf")
+            for i in range(1, max_tests + 1)
+        ])
+        db.commit()
+
+def main():
+    app.dependency_overrides[get_db] = override_get_db
+    client = TestClient(app)
+    seed(max(BATCH_SIZES))
+
+    print(f"simulated scraping latency per file: {SCRAPING_LATENCY * 1000:.0f} ms")
+    print(f"{'pool':>5} {'tests':>6} {'latency (ms)':>13}")
+    with patch("app.scraping.data_scraping", side_effect=slow_data_scraping):
+        for pool_size in POOL_SIZES:
+            scraping._scraping_executor = ThreadPoolExecutor(max_workers=pool_size)
+            for batch_size in BATCH_SIZES:
+                start = time.perf_counter()
+                response = client.post("/data/tests-processing/1", json=list(range(1, batch_size + 1)))
+                elapsed = time.perf_counter() - start
+                assert response.status_code == 200, response.text
+                print(f"{pool_size:>5} {batch_size:>6} {elapsed * 1000:>13.1f}")
+            scraping._scraping_executor.shutdown()
+    scraping._scraping_executor = None
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+FILLER_LINES = [
+    "Paciente: PACIENTE SINTETICO          Convênio: PARTICULAR",
+    "Material: Sangue total com EDTA       Método: Automatizado",
+    "Nota: a interpretação da CREATININA e da UREIA deve considerar a função renal.",
+    "Valores de referência para adultos, conforme literatura vigente.",
+    "Exame liberado eletronicamente. Assinatura digital do responsável técnico.",
+]
+
+RESULT_LINES = [
+    "HEMÁCIAS 4,70 milhões/mm3",
+    "HEMOGLOBINA 13,5 g/dL",
+    "HEMATÓCRITO 40,5 %",
+    "HEMOGLOBINA GLICADA - HbA1c",
+    "Método: HPLC",
+    "RESULTADO: 5,6 %",
+    "TRANSAMINASE OXALACÉTICA TGO (AST)",
+    "RESULTADO: 30 U/L",
+    "TRANSAMINASE PIRÚVICA TGP (ALT)",
+    "RESULTADO: 25 U/L",
+    "UREIA",
+    "RESULTADO: 40 mg/dL",
+    "CREATININA",
+    "RESULTADO: 1,1 mg/dL",
+]
+
+def synthetic_report_pages(pages, lines_per_page=60, with_results=True, results_page=None):
+    # By default results are printed on the last page, after every filler
+    # page, which is the worst case for a scan that starts from the top.
+    results_page = pages - 1 if results_page is None else results_page
+    report = []
+    for page in range(pages):
+        lines = [f"LABORATÓRIO SINTÉTICO - Página {page + 1} de {pages}"]
+        if page == 0:
+            lines.append("Atendimento : 01/01/2023")
+        if with_results and page == results_page:
+            lines.extend(RESULT_LINES)
+        lines.extend(FILLER_LINES[i % len(FILLER_LINES)] for i in range(lines_per_page))
+        report.append("\n".join(lines) + "\n")
+    return report
+
+def synthetic_report_text(pages, lines_per_page=60, with_results=True, results_page=None):
+    return "".join(synthetic_report_pages(pages, lines_per_page, with_results, results_page))
+
+def synthetic_report_pdf(pages, lines_per_page=60, with_results=True, results_page=None):
+    import fitz
+
+    doc = fitz.open()
+    for page_text in synthetic_report_pages(pages, lines_per_page, with_results, results_page):
+        page = doc.new_page()
+        page.insert_textbox(page.rect + (36, 36, -36, -36), page_text, fontsize=7)
+    pdf_data = doc.tobytes()
+    doc.close()
+    return pdf_data
@@ -0,0 +1,76 @@
+import time
+import fnmatch
+import threading
+
+class FakeRedis:
+    # The subset of redis.Redis the job and cache backends call, with the
+    # same bytes replies and key expiry driven by a test clock
+    def __init__(self, clock=time.monotonic):
+        self._values = {}
+        self._expiries = {}
+        self._lists = {}
+        self._clock = clock
+        self._condition = threading.Condition()
+
+    def _expire(self, key):
+        expires_at = self._expiries.get(key)
+        if expires_at is not None and expires_at <= self._clock():
+            self._values.pop(key, None)
+            del self._expiries[key]
+
+    def ttl(self, key):
+        with self._condition:
+            self._expire(key)
+            if key not in self._values:
+                return -2
+            expires_at = self._expiries.get(key)
+            return -1 if expires_at is None else int(expires_at - self._clock())
+
+    def get(self, key):
+        with self._condition:
+            self._expire(key)
+            return self._values.get(key)
+
+    def set(self, key, value, ex=None):
+        with self._condition:
+            self._values[key] = value.encode() if isinstance(value, str) else value
+            self._expiries.pop(key, None)
+            if ex is not None:
+                self._expiries[key] = self._clock() + ex
+            return True
+
+    def delete(self, *keys):
+        with self._condition:
+            deleted = 0
+            for key in keys:
+                key = key.decode() if isinstance(key, bytes) else key
+                self._expire(key)
+                deleted += self._values.pop(key, None) is not None
+                self._expiries.pop(key, None)
+            return deleted
+
+    def scan_iter(self, match="*"):
+        with self._condition:
+            for key in list(self._values):
+                self._expire(key)
+            keys = [key for key in self._values if fnmatch.fnmatchcase(key, match)]
+        return iter(key.encode() for key in keys)
+
+    def rpush(self, key, *values):
+        with self._condition:
+            items = self._lists.setdefault(key, [])
+            items.extend(value.encode() if isinstance(value, str) else value for value in values)
+            self._condition.notify_all()
+            return len(items)
+
+    def blpop(self, keys, timeout=0):
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                for key in keys:
+                    if self._lists.get(key):
+                        return key.encode(), self._lists[key].pop(0)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
@@ -0,0 +1,117 @@
+import json
+from datetime import date, datetime
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine, StaticPool
+from sqlalchemy.orm import sessionmaker
+
+from app.backfill import run_backfill
+from app.database import Base
+from app.models import User, Form, Test, DerivedHealthData, LabResult
+from app.lab_results import ANALYTES
+from app.scraping import DataScraped
+
+engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+@pytest.fixture(autouse=True)
+def setup_db():
+    Base.metadata.create_all(bind=engine)
+    with TestingSessionLocal() as db:
+        db.add_all([
+            User(id=1, full_name="Test User", email="testuser@example.com", password="password", birth_date=date(2000, 1, 1)),
+            User(id=2, full_name="Other User", email="otheruser@example.com", password="password", birth_date=date(1990, 1, 1))
+        ])
+        db.add(Form(id=1, user_id=1))
+        db.add_all([
+            Test(id=test_id, user_id=1 if test_id <= 3 else 2, test_name=f"exam{test_id}.pdf", url="")
+            for test_id in range(1, 6)
+        ])
+        db.flush()
+        db.add(DerivedHealthData(form_id=1, test_id=1, name="hemoglobin", value="9.9"))
+        db.commit()
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+def fake_data_scraping(user_id, filename):
+    if filename == "exam4.pdf":
+        raise IOError("S3 is unavailable")
+    test_id = int(filename[len("exam"):-len(".pdf")])
+    return [DataScraped("hemoglobin", f"1{test_id}.5")], datetime(2024, 1, test_id)
+
+def test_backfill_replaces_results_and_saves_checkpoint(tmp_path):
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+
+    with patch("app.scraping.data_scraping", side_effect=fake_data_scraping):
+        checkpoint = run_backfill(TestingSessionLocal, checkpoint_path, batch_size=2, workers=2)
+
+    assert checkpoint == {"last_test_id": 5, "processed": 4, "failed": [4]}
+    with open(checkpoint_path) as file:
+        assert json.load(file) == checkpoint
+
+    with TestingSessionLocal() as db:
+        values = {row.test_id: row.value for row in db.query(DerivedHealthData)}
+        assert values == {1: "11.5", 2: "12.5", 3: "13.5", 5: "15.5"}
+        assert db.query(LabResult).count() == 4
+        assert db.query(Test).filter(Test.id == 3).first().test_date == datetime(2024, 1, 3)
+        assert db.query(Form).filter(Form.user_id == 1).first().latest_hemoglobin == "13.5"
+        assert db.query(Form).filter(Form.user_id == 2).first().latest_hemoglobin == "15.5"
+
+def test_backfill_resumes_after_the_checkpoint(tmp_path):
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    with open(checkpoint_path, "w") as file:
+        json.dump({"last_test_id": 3, "processed": 3, "failed": []}, file)
+
+    with patch("app.scraping.data_scraping", side_effect=fake_data_scraping) as data_scraping:
+        checkpoint = run_backfill(TestingSessionLocal, checkpoint_path, batch_size=10, workers=1)
+
+    assert sorted(call.args[1] for call in data_scraping.call_args_list) == ["exam4.pdf", "exam5.pdf"]
+    assert checkpoint == {"last_test_id": 5, "processed": 4, "failed": [4]}
+    with TestingSessionLocal() as db:
+        assert db.query(DerivedHealthData).filter(DerivedHealthData.test_id == 1).first().value == "9.9"
+
+def test_backfill_clears_latest_values_without_results(tmp_path):
+    with TestingSessionLocal() as db:
+        db.add(LabResult(user_id=1, test_id=1, analyte=ANALYTES["urea"], value=40, test_date=datetime(2023, 1, 1)))
+        user_form = db.query(Form).filter(Form.user_id == 1).first()
+        user_form.latest_urea = "40"
+        user_form.latest_urea_date = datetime(2023, 1, 1)
+        db.commit()
+
+    with patch("app.scraping.data_scraping", side_effect=fake_data_scraping):
+        run_backfill(TestingSessionLocal, str(tmp_path / "checkpoint.json"), batch_size=10, workers=1)
+
+    with TestingSessionLocal() as db:
+        assert db.query(LabResult).filter(LabResult.analyte == ANALYTES["urea"]).count() == 0
+        user_form = db.query(Form).filter(Form.user_id == 1).first()
+        assert user_form.latest_urea is None
+        assert user_form.latest_urea_date is None
+        assert user_form.latest_hemoglobin == "13.5"
+
+def test_backfill_retries_failed_tests_on_resume(tmp_path):
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    with open(checkpoint_path, "w") as file:
+        json.dump({"last_test_id": 5, "processed": 4, "failed": [4, 99]}, file)
+
+    def data_scraping(user_id, filename):
+        test_id = int(filename[len("exam"):-len(".pdf")])
+        return [DataScraped("hemoglobin", f"1{test_id}.5")], datetime(2024, 1, test_id)
+
+    with patch("app.scraping.data_scraping", side_effect=data_scraping) as scraping:
+        checkpoint = run_backfill(TestingSessionLocal, checkpoint_path, batch_size=10, workers=1)
+
+    assert [call.args[1] for call in scraping.call_args_list] == ["exam4.pdf"]
+    assert checkpoint == {"last_test_id": 5, "processed": 5, "failed": []}
+    with TestingSessionLocal() as db:
+        assert db.query(DerivedHealthData).filter(DerivedHealthData.test_id == 4).first().value == "14.5"
+
+def test_backfill_keeps_tests_that_fail_again(tmp_path):
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    with open(checkpoint_path, "w") as file:
+        json.dump({"last_test_id": 5, "processed": 4, "failed": [4]}, file)
+
+    with patch("app.scraping.data_scraping", side_effect=fake_data_scraping):
+        checkpoint = run_backfill(TestingSessionLocal, checkpoint_path, batch_size=10, workers=1)
+
+    assert checkpoint == {"last_test_id": 5, "processed": 4, "failed": [4]}
@@ -0,0 +1,113 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+from app.cache import LRUCache, TTLCache, RedisCache
+from tests.fake_redis import FakeRedis
+
+def test_lru_cache_hit_and_miss():
+    cache = LRUCache(max_bytes=1024)
+    assert cache.get("missing") is None
+    cache.set("key", {"value": 1})
+    assert cache.get("key") == {"value": 1}
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_lru_cache_evicts_least_recently_used_by_size():
+    cache = LRUCache(max_bytes=300)
+    cache.set("a", "a" * 100)
+    cache.set("b", "b" * 100)
+    cache.get("a")
+    cache.set("c", "c" * 100)
+    assert cache.get("b") is None
+    assert cache.get("a") == "a" * 100
+    assert cache.get("c") == "c" * 100
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] <= 300
+
+def test_lru_cache_skips_values_larger_than_the_cache():
+    cache = LRUCache(max_bytes=50)
+    cache.set("big", "x" * 100)
+    assert cache.get("big") is None
+    assert cache.stats()["entries"] == 0
+
+def test_lru_cache_disk_tier(tmp_path):
+    cache = LRUCache(max_bytes=1024, directory=str(tmp_path))
+    cache.set("key", "text")
+
+    other_process_cache = LRUCache(max_bytes=1024, directory=str(tmp_path))
+    assert other_process_cache.get("key") == "text"
+    assert other_process_cache.stats()["disk_hits"] == 1
+    assert other_process_cache.stats()["entries"] == 1
+
+def test_lru_cache_disk_tier_is_bounded(tmp_path):
+    cache = LRUCache(max_bytes=1024, directory=str(tmp_path), max_disk_bytes=300)
+    cache.set("a", "a" * 100)
+    cache.set("b", "b" * 100)
+    # The oldest file is the least recently used until it is read again
+    os.utime(cache._disk_path("a"), (1, 1))
+    os.utime(cache._disk_path("b"), (2, 2))
+    LRUCache(max_bytes=1024, directory=str(tmp_path)).get("a")
+    cache.set("c", "c" * 100)
+    cache.set("big", "x" * 400)
+
+    assert sorted(os.listdir(tmp_path)) == sorted(cache._disk_path(key).rsplit(os.sep, 1)[1] for key in ("a", "c"))
+    assert cache.stats()["disk_bytes"] <= 300
+    assert cache.stats()["disk_evictions"] == 1
+
+    other_process_cache = LRUCache(max_bytes=1024, directory=str(tmp_path), max_disk_bytes=300)
+    assert other_process_cache.stats()["disk_bytes"] == cache.stats()["disk_bytes"]
+    assert other_process_cache.get("b") is None
+
+def test_ttl_cache_expires_entries():
+    now = [0.0]
+    cache = TTLCache(max_entries=10, ttl=5, clock=lambda: now[0])
+    cache.set("key", "value")
+    now[0] = 4.9
+    assert cache.get("key") == "value"
+    now[0] = 5.0
+    assert cache.get("key") is None
+    assert cache.stats()["entries"] == 0
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    cache.delete("a")
+    assert cache.get("a") is None
+    assert cache.stats()["evictions"] == 1
+
+def test_redis_cache_get_set_and_delete():
+    cache = RedisCache("redis://unused", prefix="forms", ttl=60, client=FakeRedis())
+    assert cache.get("form:1") is None
+    cache.set("form:1", {"etag": '"abc"', "body": "{}"})
+    cache.set("form:2", {"etag": '"def"', "body": "{}"})
+    assert cache.get("form:1") == {"etag": '"abc"', "body": "{}"}
+
+    cache.delete("form:1")
+    assert cache.get("form:1") is None
+    assert cache.get("form:2") is not None
+    cache.clear()
+    assert cache.get("form:2") is None
+
+def test_redis_cache_expires_entries():
+    now = [0.0]
+    redis = FakeRedis(clock=lambda: now[0])
+    cache = RedisCache("redis://unused", prefix="forms", ttl=0.5, client=redis)
+    cache.set("form:1", {"body": "{}"})
+    # Redis TTLs are whole seconds, so a shorter one is rounded up
+    assert redis.ttl("forms:form:1") == 1
+    now[0] = 0.9
+    assert cache.get("form:1") == {"body": "{}"}
+    now[0] = 1.0
+    assert cache.get("form:1") is None
+
+def test_redis_cache_needs_the_redis_package():
+    with patch.dict("sys.modules", {"redis": None}):
+        with pytest.raises(ValueError, match="FORM_CACHE_BACKEND='redis' needs the 'redis' package"):
+            RedisCache("redis://localhost:6379/0")
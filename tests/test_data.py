@@ -1,4 +1,7 @@
-from datetime import date
+import json
+import time
+from datetime import date, datetime
+from unittest.mock import MagicMock, patch
 
 import pytest
 from fastapi.testclient import TestClient
@@ -7,7 +10,16 @@ from sqlalchemy.orm import sessionmaker
 
 from app.main import app
 from app.database import Base, get_db
-from app.models import User, Form
+from app.cache import RedisCache
+from app.forms import form_cache, get_form_responses
+from app.ingestion import get_latest_values, reserve_test_upload
+from app.metrics import instrument_engine, current_timings, RequestTimings
+from app.jobs import InMemoryJobBackend, RedisJobBackend, JobQueue, get_job_queue
+from app.lab_results import backfill_lab_results
+from app.models import User, Form, Test, DerivedHealthData, LabResult
+from app.scraping import DataScraped, ScrapingResult, EXTRACTION_VERSION
+from app.utils import RequestError
+from tests.fake_redis import FakeRedis
 
 DATABASE_URL = "sqlite:///:memory:"
 engine = create_engine(
@@ -15,6 +27,7 @@ engine = create_engine(
     connect_args={"check_same_thread": False},
     poolclass=StaticPool,
 )
+instrument_engine(engine)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def override_get_db():
@@ -26,11 +39,15 @@ def override_get_db():
 
 app.dependency_overrides[get_db] = override_get_db
 
+job_queue = JobQueue(InMemoryJobBackend(), session_factory=TestingSessionLocal, workers=1)
+app.dependency_overrides[get_job_queue] = lambda: job_queue
+
 client = TestClient(app)
 
 @pytest.fixture(autouse=True)
 def setup_db():
     Base.metadata.create_all(bind=engine)
+    form_cache.clear()
     yield
     Base.metadata.drop_all(bind=engine)
 
@@ -80,6 +97,38 @@ def test_form1_for_test_user1(test_user1):
         db.add(form)
         db.commit()
 
+@pytest.fixture
+def test_user2():
+    user_id = 2
+    with TestingSessionLocal() as db:
+        user = User(
+            id=user_id,
+            full_name="Other User",
+            email="otheruser@example.com",
+            password="password",
+            birth_date=date(1990, 1, 1),
+            biological_sex="F"
+        )
+        db.add(user)
+        db.commit()
+    return user_id
+
+@pytest.fixture
+def tests_for_test_user1(test_user1):
+    with TestingSessionLocal() as db:
+        tests = [
+            Test(id=1, user_id=test_user1, test_name="exam1.pdf", url="https://bucket/1/exam1.pdf"),
+            Test(id=2, user_id=test_user1, test_name="exam2.pdf", url="https://bucket/1/exam2.pdf")
+        ]
+        db.add_all(tests)
+        db.commit()
+    return [1, 2]
+
+def fake_data_scraping(user_id, filename):
+    if filename == "exam1.pdf":
+        return [DataScraped("hemoglobin", "13.5"), DataScraped("urea", "40")], datetime(2023, 1, 1)
+    return [DataScraped("hemoglobin", "14.1")], datetime(2024, 1, 1)
+
 @pytest.fixture
 def partial_form():
     partial_form_data = {
@@ -127,6 +176,42 @@ def test_read_root():
     assert response.status_code == 200
     assert response.json() == {"message": "Welcome to the data processing API"}
 
+def test_pool_stats():
+    response = client.get("/pool-stats")
+    assert response.status_code == 200
+    assert response.json()["status"] == 200
+    assert "pid" in response.json()["data"]
+    assert "sync" in response.json()["data"]
+
+def test_metrics(test_user1, tests_for_test_user1):
+    with patch("app.scraping.data_scraping", side_effect=fake_data_scraping):
+        response = client.post(f"/data/tests-processing/{test_user1}", json=tests_for_test_user1)
+    server_timing = response.headers["server-timing"]
+    assert "db;dur=" in server_timing
+    assert "latest_values;dur=" in server_timing
+    assert "total;dur=" in server_timing
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'http_request_duration_seconds_count{method="POST",route="/data/tests-processing/{user_id}"' in response.text
+    assert 'stage_duration_seconds_count{stage="latest_values"' in response.text
+
+def test_metrics_query_timing_survives_failed_statements():
+    timings = RequestTimings()
+    token = current_timings.set(timings)
+    try:
+        with engine.connect() as connection:
+            with pytest.raises(Exception):
+                connection.exec_driver_sql("SELECT * FROM missing_table")
+            time.sleep(0.05)
+            connection.exec_driver_sql("SELECT 1")
+            # Nothing of the failed statement is left on the pooled connection
+            assert not connection.info.get("query_start")
+    finally:
+        current_timings.reset(token)
+    assert timings.queries == 1
+    assert timings.stages["db"] < 0.05
+
 def test_pdf_tests_processing_user_not_found():
     user_id = 1
     test_list = [1]
@@ -143,6 +228,319 @@ def test_pdf_tests_processing_test_not_found(test_user1):
     assert response.status_code == 404
     assert response.json() == {"status": 404, "message": f"Test with ID '{test_list[0]}' not found"}
 
+def test_pdf_tests_processing_test_of_other_user(test_user2, tests_for_test_user1):
+    user_id = test_user2
+    test_list = tests_for_test_user1
+    response = client.post(f"/data/tests-processing/{user_id}", json=test_list)
+    assert response.status_code == 400
+    assert response.json() == {"status": 400, "message": f"Test with ID '{test_list[0]}' is not a test of the user with ID {user_id}"}
+
+def test_pdf_tests_processing_reports_first_invalid_test(test_user2, tests_for_test_user1):
+    user_id = test_user2
+    response = client.post(f"/data/tests-processing/{user_id}", json=[99, 1])
+    assert response.status_code == 404
+    assert response.json() == {"status": 404, "message": "Test with ID '99' not found"}
+
+    response = client.post(f"/data/tests-processing/{user_id}", json=[1, 99])
+    assert response.status_code == 400
+    assert response.json() == {"status": 400, "message": f"Test with ID '1' is not a test of the user with ID {user_id}"}
+
+def test_pdf_tests_processing(test_user1, tests_for_test_user1):
+    user_id = test_user1
+    test_list = tests_for_test_user1
+    with patch("app.scraping.data_scraping", side_effect=fake_data_scraping) as mock_scraping:
+        response = client.post(f"/data/tests-processing/{user_id}", json=test_list)
+    assert mock_scraping.call_count == 2
+    assert response.status_code == 200
+    assert response.json()["message"] == f"The following form was updated for user with ID '{user_id}'"
+
+    data_from_response = response.json()["data"]
+    assert data_from_response["form_status"] == "In progress"
+    assert data_from_response["latest_hemoglobin"] == "14.1"
+    assert data_from_response["latest_urea"] == "40"
+    assert data_from_response["latest_creatinine"] is None
+
+    with TestingSessionLocal() as db:
+        assert db.query(DerivedHealthData).count() == 3
+        assert db.query(LabResult).count() == 3
+        assert db.query(Test).filter(Test.id == 2).first().test_date == datetime(2024, 1, 1)
+
+def fake_hashed_data_scraping(user_id, filename):
+    return ScrapingResult(*fake_data_scraping(user_id, filename), f'"etag-{filename}"')
+
+def fake_s3_object_etag(user_id, filename):
+    return f'"etag-{filename}"'
+
+def test_pdf_tests_processing_retry_is_idempotent(test_user1, tests_for_test_user1):
+    user_id = test_user1
+    with patch("app.scraping.data_scraping", side_effect=fake_hashed_data_scraping) as mock_scraping, \
+            patch("app.scraping.get_s3_object_etag", side_effect=fake_s3_object_etag):
+        client.post(f"/data/tests-processing/{user_id}", json=tests_for_test_user1 + [1])
+        assert mock_scraping.call_count == 2
+
+        response = client.post(f"/data/tests-processing/{user_id}", json=tests_for_test_user1)
+        assert mock_scraping.call_count == 2
+    assert response.status_code == 200
+    assert response.json()["data"]["latest_hemoglobin"] == "14.1"
+
+    with TestingSessionLocal() as db:
+        test = db.query(Test).filter(Test.id == 1).first()
+        assert test.content_hash == '"etag-exam1.pdf"'
+        assert test.extractor_version == EXTRACTION_VERSION
+        db.query(Test).update({Test.extractor_version: "outdated"})
+        db.commit()
+
+    with patch("app.scraping.data_scraping", side_effect=fake_hashed_data_scraping) as mock_scraping:
+        client.post(f"/data/tests-processing/{user_id}", json=tests_for_test_user1)
+    assert mock_scraping.call_count == 2
+
+    with TestingSessionLocal() as db:
+        assert db.query(DerivedHealthData).count() == 3
+        assert db.query(LabResult).count() == 3
+
+def test_pdf_tests_processing_reextracts_overwritten_pdf(test_user1, tests_for_test_user1):
+    user_id = test_user1
+    with patch("app.scraping.data_scraping", side_effect=fake_hashed_data_scraping):
+        client.post(f"/data/tests-processing/{user_id}", json=[1])
+
+    # exam1.pdf was replaced in S3 by a report without urea
+    def replaced_data_scraping(user_id, filename):
+        return ScrapingResult([DataScraped("hemoglobin", "12.5")], datetime(2023, 1, 1), "etag-replaced")
+
+    with patch("app.scraping.data_scraping", side_effect=replaced_data_scraping) as mock_scraping, \
+            patch("app.scraping.get_s3_object_etag", return_value="etag-replaced"):
+        response = client.post(f"/data/tests-processing/{user_id}", json=[1])
+    assert mock_scraping.call_count == 1
+    assert response.json()["data"]["latest_hemoglobin"] == "12.5"
+    assert response.json()["data"]["latest_urea"] is None
+
+    with TestingSessionLocal() as db:
+        assert [row.name for row in db.query(DerivedHealthData)] == ["hemoglobin"]
+        assert db.query(LabResult).count() == 1
+        assert db.query(Test).filter(Test.id == 1).first().content_hash == "etag-replaced"
+
+def test_pdf_tests_processing_keeps_newer_latest_values(test_user1, tests_for_test_user1):
+    user_id = test_user1
+    with patch("app.scraping.data_scraping", side_effect=fake_data_scraping):
+        client.post(f"/data/tests-processing/{user_id}", json=[2])
+        response = client.post(f"/data/tests-processing/{user_id}", json=[1])
+
+    data_from_response = response.json()["data"]
+    assert data_from_response["latest_hemoglobin"] == "14.1"
+    assert data_from_response["latest_urea"] == "40"
+    with TestingSessionLocal() as db:
+        user_form = db.query(Form).filter(Form.user_id == user_id).first()
+        assert user_form.latest_hemoglobin_date == datetime(2024, 1, 1)
+        assert user_form.latest_urea_date == datetime(2023, 1, 1)
+
+def test_admin_rebuild_latest_values(test_user1, tests_for_test_user1):
+    user_id = test_user1
+    with patch("app.scraping.data_scraping", side_effect=fake_data_scraping):
+        client.post(f"/data/tests-processing/{user_id}", json=tests_for_test_user1)
+    with TestingSessionLocal() as db:
+        db.query(Form).update({Form.latest_hemoglobin: "1.0", Form.latest_hemoglobin_date: None})
+        db.commit()
+
+    with patch("app.routers.admin.ADMIN_TOKEN", "secret"):
+        response = client.post("/admin/latest-values:rebuild", json=[user_id])
+        assert response.status_code == 403
+        response = client.post("/admin/latest-values:rebuild", json=[user_id], headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 200
+    assert response.json()["data"]["rebuilt"] == 1
+    with TestingSessionLocal() as db:
+        user_form = db.query(Form).filter(Form.user_id == user_id).first()
+        assert user_form.latest_hemoglobin == "14.1"
+        assert user_form.latest_hemoglobin_date == datetime(2024, 1, 1)
+
+def test_upload_test_extracts_without_downloading(test_user1):
+    import fitz
+
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "Atendimento : 01/01/2023\nHEMOGLOBINA 13,5 g/dL\nUREIA\nRESULTADO: 40 mg/dL")
+    pdf_data = doc.tobytes()
+    doc.close()
+
+    s3 = MagicMock()
+    s3.put_object.return_value = {"ETag": '"uploaded"'}
+    with patch("app.scraping.s3_client", s3), patch("app.scraping.EXTRACTION_EXECUTOR", "inline"):
+        response = client.post(f"/data/tests-upload/{test_user1}", files={"file": ("exam3.pdf", pdf_data, "application/pdf")})
+        assert response.status_code == 201
+        duplicate = client.post(f"/data/tests-upload/{test_user1}", files={"file": ("exam3.pdf", pdf_data, "application/pdf")})
+        not_pdf = client.post(f"/data/tests-upload/{test_user1}", files={"file": ("notes.pdf", b"hello", "application/pdf")})
+    assert duplicate.status_code == 409
+    assert not_pdf.status_code == 400
+    assert s3.put_object.call_count == 1
+    assert s3.get_object.call_count == 0
+    assert s3.put_object.call_args.kwargs["Key"] == f"{test_user1}/exam3.pdf"
+
+    data_from_response = response.json()["data"]
+    assert data_from_response["form"]["latest_hemoglobin"] == "13.5"
+    assert data_from_response["form"]["latest_urea"] == "40"
+    with TestingSessionLocal() as db:
+        test = db.query(Test).filter(Test.id == data_from_response["test_id"]).first()
+        assert test.test_name == "exam3.pdf"
+        assert test.test_date == datetime(2023, 1, 1)
+        assert test.content_hash == "uploaded"
+        assert db.query(DerivedHealthData).filter(DerivedHealthData.test_id == test.id).count() == 2
+
+def test_upload_test_rejects_unreadable_pdf(test_user1):
+    s3 = MagicMock()
+    s3.put_object.return_value = {"ETag": '"uploaded"'}
+    with patch("app.scraping.s3_client", s3), patch("app.scraping.EXTRACTION_EXECUTOR", "inline"):
+        response = client.post(f"/data/tests-upload/{test_user1}", files={"file": ("bad.pdf", b"%PDF-1.4\ngarbage", "application/pdf")})
+    assert response.status_code == 400
+    assert response.json()["message"].startswith("The file 'bad.pdf' could not be read as a PDF")
+    assert s3.delete_object.call_args.kwargs["Key"] == f"{test_user1}/bad.pdf"
+    with TestingSessionLocal() as db:
+        assert db.query(Test).filter(Test.test_name == "bad.pdf").count() == 0
+
+def test_upload_test_checks_user_before_reading(test_user1):
+    with patch("starlette.datastructures.UploadFile.read") as read:
+        response = client.post("/data/tests-upload/99", files={"file": ("exam3.pdf", b"%PDF-1.4", "application/pdf")})
+    assert response.status_code == 404
+    assert read.call_count == 0
+
+def test_upload_test_removes_object_when_saving_fails(test_user1):
+    s3 = MagicMock()
+    s3.put_object.return_value = {"ETag": '"uploaded"'}
+    scraping_result = ScrapingResult([DataScraped("hemoglobin", "13.5")], datetime(2023, 1, 1), "uploaded")
+    with patch("app.scraping.s3_client", s3), \
+            patch("app.routers.data.data_scraping_upload", return_value=scraping_result), \
+            patch("app.routers.data.finish_test_upload", side_effect=RuntimeError("database is gone")):
+        response = client.post(f"/data/tests-upload/{test_user1}", files={"file": ("exam3.pdf", b"%PDF-1.4", "application/pdf")})
+    assert response.status_code == 500
+    assert s3.delete_object.call_args.kwargs["Key"] == f"{test_user1}/exam3.pdf"
+    with TestingSessionLocal() as db:
+        assert db.query(Test).filter(Test.test_name == "exam3.pdf").count() == 0
+
+def test_reserve_test_upload_allows_one_upload_per_name(test_user1):
+    with TestingSessionLocal() as db:
+        reserve_test_upload(db, test_user1, "exam3.pdf", "https://bucket/1/exam3.pdf")
+        with pytest.raises(RequestError) as error:
+            reserve_test_upload(db, test_user1, "exam3.pdf", "https://bucket/1/exam3.pdf")
+    assert error.value.status == 409
+
+def test_get_latest_values_picks_most_recent_test(test_user1, tests_for_test_user1):
+    with TestingSessionLocal() as db:
+        form = Form(user_id=test_user1)
+        db.add(form)
+        db.commit()
+        db.query(Test).filter(Test.id == 1).update({"test_date": datetime(2024, 1, 1)})
+        db.query(Test).filter(Test.id == 2).update({"test_date": datetime(2023, 1, 1)})
+        db.add_all([
+            DerivedHealthData(form_id=form.id, test_id=1, name="hemoglobin", value="14.1"),
+            DerivedHealthData(form_id=form.id, test_id=2, name="hemoglobin", value="13.5"),
+            DerivedHealthData(form_id=form.id, test_id=2, name="urea", value="40")
+        ])
+        db.commit()
+
+        assert backfill_lab_results(db) == 3
+        assert backfill_lab_results(db) == 0
+        latest_values = get_latest_values(db, test_user1)
+
+    assert latest_values["hemoglobin"] == "14.1"
+    assert latest_values["urea"] == "40"
+    assert latest_values["creatinine"] is None
+    assert len(latest_values) == 8
+
+def wait_for_job(job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/data/jobs/{job_id}").json()["data"]
+        if job["state"] in ("completed", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job '{job_id}' did not finish in {timeout} seconds")
+
+def test_pdf_tests_processing_async(test_user1, tests_for_test_user1):
+    user_id = test_user1
+    test_list = tests_for_test_user1
+    with patch("app.scraping.data_scraping", side_effect=fake_data_scraping):
+        response = client.post(f"/data/tests-processing/{user_id}?async=true", json=test_list)
+        assert response.status_code == 202
+        assert response.json()["data"]["state"] == "queued"
+        job = wait_for_job(response.json()["data"]["id"])
+
+    assert job["state"] == "completed"
+    assert job["processed"] == job["total"] == 2
+    assert job["result"]["latest_hemoglobin"] == "14.1"
+
+    with TestingSessionLocal() as db:
+        assert db.query(DerivedHealthData).count() == 3
+
+def test_pdf_tests_processing_async_test_not_found(test_user1):
+    user_id = test_user1
+    response = client.post(f"/data/tests-processing/{user_id}?async=true", json=[1])
+    assert response.status_code == 404
+    assert response.json() == {"status": 404, "message": "Test with ID '1' not found"}
+
+def test_get_job_not_found():
+    response = client.get("/data/jobs/unknown")
+    assert response.status_code == 404
+    assert response.json() == {"status": 404, "message": "Job with ID 'unknown' not found"}
+
+def test_in_memory_jobs_expire_after_finishing():
+    now = [0.0]
+    backend = InMemoryJobBackend(ttl=60, clock=lambda: now[0])
+    backend.save({"id": "finished", "state": "queued"})
+    backend.save({"id": "running", "state": "queued"})
+    backend.update("finished", state="completed", result={"latest_urea": "40"})
+    backend.update("running", state="running")
+
+    now[0] = 59.0
+    assert backend.get("finished")["result"] == {"latest_urea": "40"}
+    now[0] = 60.0
+    assert backend.get("finished") is None
+    assert backend.get("running")["state"] == "running"
+
+def wait_for_backend_job(backend, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = backend.get(job_id)
+        if job["state"] in ("completed", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job '{job_id}' did not finish in {timeout} seconds")
+
+def test_redis_jobs_are_claimed_and_processed(test_user1, tests_for_test_user1):
+    redis = FakeRedis()
+    backend = RedisJobBackend("redis://unused", ttl=60, client=redis)
+    redis_job_queue = JobQueue(backend, session_factory=TestingSessionLocal, workers=1)
+    try:
+        with patch("app.scraping.data_scraping", side_effect=fake_data_scraping):
+            submitted = redis_job_queue.submit(test_user1, tests_for_test_user1)
+            assert backend.get(submitted["id"])["tests"] == tests_for_test_user1
+            job = wait_for_backend_job(backend, submitted["id"])
+    finally:
+        redis_job_queue.stop()
+
+    assert job["state"] == "completed"
+    assert job["processed"] == job["total"] == 2
+    assert job["result"]["latest_hemoglobin"] == "14.1"
+    assert 0 < redis.ttl(f"jobs:{submitted['id']}") <= 60
+    # The worker took the job off the shared queue
+    assert backend.dequeue(timeout=0) is None
+
+def test_redis_jobs_expire():
+    now = [0.0]
+    backend = RedisJobBackend("redis://unused", ttl=60, client=FakeRedis(clock=lambda: now[0]))
+    backend.save({"id": "job", "state": "queued", "processed": 0})
+    backend.enqueue("job")
+    assert backend.dequeue(timeout=1) == "job"
+
+    now[0] = 50.0
+    backend.update("job", state="completed", processed=2)
+    now[0] = 100.0
+    assert backend.get("job") == {"id": "job", "state": "completed", "processed": 2}
+    now[0] = 110.0
+    assert backend.get("job") is None
+    backend.update("job", state="failed")
+    assert backend.get("job") is None
+
+def test_redis_jobs_need_the_redis_package():
+    with patch.dict("sys.modules", {"redis": None}):
+        with pytest.raises(ValueError, match="JOBS_BACKEND='redis' needs the 'redis' package"):
+            RedisJobBackend("redis://localhost:6379/0")
 
 def test_form_update_user_does_not_exist(partial_form):
     user_id = 1
@@ -247,4 +645,163 @@ def test_get_form_not_found(test_user1):
     response = client.get(f"/data/form-and-latest-tests/{user_id}")
     assert response.status_code == 200
     assert response.json()["status"] == 200
-    assert response.json()["message"] == f"No form was found for user with ID '{user_id}'"
\ No newline at end of file
+    assert response.json()["message"] == f"No form was found for user with ID '{user_id}'"
+
+def test_get_form_not_modified_is_served_from_cache(test_user1, test_form1_for_test_user1):
+    user_id = test_user1
+
+    response = client.get(f"/data/form-and-latest-tests/{user_id}")
+    etag = response.headers["ETag"]
+
+    with patch("app.routers.data.get_form_response") as get_form_response:
+        response = client.get(f"/data/form-and-latest-tests/{user_id}", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+
+        response = client.get(f"/data/form-and-latest-tests/{user_id}")
+        assert response.status_code == 200
+        assert response.json()["data"]["weight"] == "70"
+        get_form_response.assert_not_called()
+
+def test_get_form_cache_is_invalidated_by_form_update(test_user1, test_form1_for_test_user1):
+    user_id = test_user1
+
+    etag = client.get(f"/data/form-and-latest-tests/{user_id}").headers["ETag"]
+    client.put(f"/data/form/{user_id}", json={"weight": "72"})
+
+    response = client.get(f"/data/form-and-latest-tests/{user_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["data"]["weight"] == "72.0"
+    assert response.headers["ETag"] != etag
+
+def test_get_form_redis_cache_is_invalidated_by_form_update(test_user1, test_form1_for_test_user1):
+    user_id = test_user1
+    redis_cache = RedisCache("redis://unused", prefix="forms", ttl=60, client=FakeRedis())
+
+    with patch("app.forms.form_cache", redis_cache), patch("app.routers.data.form_cache", redis_cache):
+        etag = client.get(f"/data/form-and-latest-tests/{user_id}").headers["ETag"]
+        assert redis_cache.get(f"form:{user_id}")["etag"] == etag
+
+        client.put(f"/data/form/{user_id}", json={"weight": "72"})
+        assert redis_cache.get(f"form:{user_id}") is None
+
+        response = client.get(f"/data/form-and-latest-tests/{user_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["data"]["weight"] == "72.0"
+
+def test_get_form_cache_is_invalidated_by_tests_processing(test_user1, tests_for_test_user1):
+    user_id = test_user1
+
+    response = client.get(f"/data/form-and-latest-tests/{user_id}")
+    assert response.json()["data"] == {}
+
+    with patch("app.scraping.data_scraping", side_effect=fake_data_scraping):
+        client.post(f"/data/tests-processing/{user_id}", json=tests_for_test_user1)
+
+    response = client.get(f"/data/form-and-latest-tests/{user_id}")
+    assert response.json()["data"]["latest_hemoglobin"] is not None
+
+def test_get_forms_batch(test_user1, test_form1_for_test_user1, test_user2):
+    response = client.post("/data/forms:batch", json=[2, 99, 1, 2])
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["user_id"] for line in lines] == [2, 99, 1]
+    assert lines[0]["data"] == {}
+    assert lines[0]["message"] == "No form was found for user with ID '2'"
+    assert lines[1]["status"] == 404
+    assert lines[1]["message"] == "User with ID 99 not found"
+    assert lines[2]["data"]["name"] == "Test User"
+    assert lines[2]["data"]["latest_hemoglobin"] == "14.5"
+
+def test_get_forms_batch_loads_one_chunk_at_a_time(test_user1, test_form1_for_test_user1, test_user2):
+    loaded = []
+
+    def recording_get_form_responses(db, user_ids):
+        loaded.append(list(user_ids))
+        return get_form_responses(db, user_ids)
+
+    with patch("app.routers.data.FORMS_BATCH_CHUNK_SIZE", 2), \
+            patch("app.routers.data.get_form_responses", side_effect=recording_get_form_responses):
+        response = client.post("/data/forms:batch", json=[2, 99, 1])
+    assert [json.loads(line)["user_id"] for line in response.text.splitlines()] == [2, 99, 1]
+    assert loaded == [[2, 99], [1]]
+
+def test_get_forms_batch_limits(test_user1):
+    response = client.post("/data/forms:batch", json=[])
+    assert response.status_code == 400
+
+    with patch("app.routers.data.FORMS_BATCH_MAX_USERS", 2):
+        response = client.post("/data/forms:batch", json=[1, 2, 3])
+    assert response.status_code == 400
+    assert response.json()["message"] == "At most 2 users can be requested at once"
+
+@pytest.fixture
+def history_for_test_user1(test_user1, tests_for_test_user1):
+    with TestingSessionLocal() as db:
+        db.add(Test(id=3, user_id=test_user1, test_name="exam3.pdf", url="https://bucket/1/exam3.pdf"))
+        db.add_all([
+            LabResult(user_id=test_user1, test_id=1, analyte=2, value=13.0, unit="g/dL", test_date=datetime(2024, 1, 5)),
+            LabResult(user_id=test_user1, test_id=2, analyte=2, value=15.0, unit="g/dL", test_date=datetime(2024, 1, 20)),
+            LabResult(user_id=test_user1, test_id=3, analyte=2, value=14.0, unit="g/dL", test_date=datetime(2024, 3, 2)),
+            LabResult(user_id=test_user1, test_id=1, analyte=8, value=1.1, unit="mg/dL", test_date=datetime(2024, 1, 5)),
+            LabResult(user_id=test_user1, test_id=2, analyte=8, value=1.3, unit="mg/dL", test_date=None)
+        ])
+        db.commit()
+    return test_user1
+
+def test_get_history_monthly_buckets(history_for_test_user1):
+    user_id = history_for_test_user1
+
+    response = client.get(f"/data/history/{user_id}")
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert data["next_cursor"] is None
+    assert data["series"] == {
+        "hemoglobin": [
+            {"period": "2024-01-01", "min": 13.0, "mean": 14.0, "max": 15.0, "count": 2},
+            {"period": "2024-03-01", "min": 14.0, "mean": 14.0, "max": 14.0, "count": 1}
+        ],
+        "creatinine": [
+            {"period": "2024-01-01", "min": 1.1, "mean": 1.1, "max": 1.1, "count": 1}
+        ]
+    }
+
+    response = client.get(f"/data/history/{user_id}", params={"analytes": "hemoglobin", "start": "2024-02-01", "bucket": "year"})
+    assert response.json()["data"]["series"] == {
+        "hemoglobin": [{"period": "2024-01-01", "min": 14.0, "mean": 14.0, "max": 14.0, "count": 1}]
+    }
+
+def test_get_history_cursor_pagination(history_for_test_user1):
+    user_id = history_for_test_user1
+
+    pages = []
+    cursor = None
+    while True:
+        params = {"limit": 1, **({"cursor": cursor} if cursor else {})}
+        data = client.get(f"/data/history/{user_id}", params=params).json()["data"]
+        pages.append(data["series"])
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+
+    assert pages == [
+        {"hemoglobin": [{"period": "2024-01-01", "min": 13.0, "mean": 14.0, "max": 15.0, "count": 2}]},
+        {"hemoglobin": [{"period": "2024-03-01", "min": 14.0, "mean": 14.0, "max": 14.0, "count": 1}]},
+        {"creatinine": [{"period": "2024-01-01", "min": 1.1, "mean": 1.1, "max": 1.1, "count": 1}]}
+    ]
+
+def test_get_history_errors(test_user1):
+    assert client.get("/data/history/99").json() == {"status": 404, "message": "User with ID 99 not found"}
+
+    response = client.get(f"/data/history/{test_user1}", params={"analytes": "glucose"})
+    assert response.status_code == 400
+    assert response.json()["message"] == "Unknown analyte 'glucose'"
+
+    response = client.get(f"/data/history/{test_user1}", params={"bucket": "week"})
+    assert response.status_code == 400
+
+    response = client.get(f"/data/history/{test_user1}", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+    assert response.json()["message"] == "Invalid cursor"
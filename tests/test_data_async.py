@@ -0,0 +1,74 @@
+from datetime import date, datetime
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, NullPool
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.main import app
+from app.database import Base, get_db
+from app.models import User, Test
+from app.scraping import DataScraped
+
+@pytest.fixture
+def async_client(tmp_path):
+    database_path = tmp_path / "test.db"
+    sync_engine = create_engine(f"sqlite:///{database_path}")
+    Base.metadata.create_all(bind=sync_engine)
+    with sync_engine.begin() as connection:
+        connection.execute(User.__table__.insert(), [{
+            "id": 1,
+            "full_name": "Test User",
+            "email": "testuser@example.com",
+            "password": "password",
+            "birth_date": date(2000, 1, 1),
+            "biological_sex": "M"
+        }])
+        connection.execute(Test.__table__.insert(), [
+            {"id": 1, "user_id": 1, "test_name": "exam1.pdf", "url": "https://bucket/1/exam1.pdf"}
+        ])
+
+    # A new connection per session, since TestClient runs each request on its own event loop
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{database_path}", poolclass=NullPool)
+    AsyncTestingSessionLocal = async_sessionmaker(async_engine, autoflush=False)
+
+    async def override_get_async_db():
+        async with AsyncTestingSessionLocal() as db:
+            yield db
+
+    previous_override = app.dependency_overrides.get(get_db)
+    app.dependency_overrides[get_db] = override_get_async_db
+    yield TestClient(app)
+    if previous_override:
+        app.dependency_overrides[get_db] = previous_override
+    else:
+        del app.dependency_overrides[get_db]
+    sync_engine.dispose()
+
+def test_async_get_form_user_not_found(async_client):
+    response = async_client.get("/data/form-and-latest-tests/2")
+    assert response.status_code == 404
+    assert response.json()["message"] == "User with ID 2 not found"
+
+def test_async_update_and_get_form(async_client):
+    response = async_client.put("/data/form/1", json={"weight": 70, "blood_type": "O+"})
+    assert response.status_code == 200
+
+    response = async_client.get("/data/form-and-latest-tests/1")
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert data["name"] == "Test User"
+    assert data["weight"] == "70.0"
+    assert data["blood_type"] == "O+"
+    assert data["form_status"] == "In progress"
+
+def test_async_tests_processing(async_client):
+    scraped = ([DataScraped("hemoglobin", "13.5")], datetime(2023, 1, 1))
+    with patch("app.scraping.data_scraping", return_value=scraped):
+        response = async_client.post("/data/tests-processing/1", json=[1])
+    assert response.status_code == 200
+    assert response.json()["data"]["latest_hemoglobin"] == "13.5"
+
+    response = async_client.post("/data/tests-processing/1", json=[2])
+    assert response.status_code == 404
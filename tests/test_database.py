@@ -0,0 +1,76 @@
+import pytest
+from sqlalchemy import create_engine, exc, inspect, text
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.pool import QueuePool
+
+from app.database import Base, PoolMetrics, instrumented_pool_class, to_async_url, add_missing_columns
+from app.migrate import migrate
+from app.models import LabResult
+
+def test_to_async_url():
+    assert to_async_url("postgresql://user:secret@db:5432/app") == "postgresql+asyncpg://user:secret@db:5432/app"
+    assert to_async_url("postgresql+psycopg2://user@db/app") == "postgresql+asyncpg://user@db/app"
+    assert to_async_url("sqlite:///./app.db") == "sqlite+aiosqlite:///./app.db"
+    with pytest.raises(ValueError):
+        to_async_url("mysql://user@db/app")
+
+def test_to_async_url_translates_libpq_options():
+    assert to_async_url("postgresql://user@db/app?sslmode=require") == "postgresql+asyncpg://user@db/app?ssl=require"
+    assert to_async_url("postgresql://user@db/app?ssl=verify-full&target_session_attrs=read-write") == \
+        "postgresql+asyncpg://user@db/app?ssl=verify-full&target_session_attrs=read-write"
+    with pytest.raises(ValueError, match="sslrootcert"):
+        to_async_url("postgresql://user@db/app?sslmode=verify-ca&sslrootcert=/etc/ca.pem")
+
+def test_pool_metrics_records_checkouts_and_timeouts():
+    metrics = PoolMetrics()
+    engine = create_engine("sqlite://", poolclass=instrumented_pool_class(QueuePool, metrics), pool_size=1, max_overflow=0, pool_timeout=0.01)
+    metrics.pool = engine.pool
+    connection = engine.connect()
+    with pytest.raises(exc.TimeoutError):
+        engine.connect()
+    connection.close()
+
+    stats = metrics.snapshot()
+    assert stats["checkouts"] == 1
+    assert stats["timeouts"] == 1
+    assert stats["connections_created"] == 1
+    assert stats["peak_checked_out"] == 1
+    assert stats["checked_out"] == 0
+
+def test_add_missing_columns():
+    engine = create_engine("sqlite://")
+    with engine.begin() as connection:
+        connection.execute(text('CREATE TABLE "LabResults" (id INTEGER PRIMARY KEY, user_id INTEGER, test_id INTEGER, '
+                                'analyte SMALLINT, value NUMERIC(12, 4), unit VARCHAR(16), test_date TIMESTAMP)'))
+
+    assert add_missing_columns(engine, LabResult.__table__) == ["flag"]
+    assert "flag" in {column["name"] for column in inspect(engine).get_columns("LabResults")}
+    assert add_missing_columns(engine, LabResult.__table__) == []
+
+def test_migrate_creates_missing_indexes():
+    # Tables as created before the models declared any index
+    engine = create_engine("sqlite://")
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            connection.execute(CreateTable(table))
+
+    added, created, removed = migrate(engine)
+
+    assert added == [] and removed == 0
+    for table in Base.metadata.sorted_tables:
+        names = {index["name"] for index in inspect(engine).get_indexes(table.name)}
+        assert names == {index.name for index in table.indexes}
+    assert "ix_tests_user_id_test_date" in created
+    assert "ix_derived_health_data_form_id_name" in created
+    assert migrate(engine) == ([], [], 0)
+
+def test_migrate_skips_unique_index_over_duplicated_tests():
+    engine = create_engine("sqlite://")
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            connection.execute(CreateTable(table))
+        connection.execute(text('INSERT INTO "Tests" (user_id, test_name, url) VALUES (1, \'exam.pdf\', \'\'), (1, \'exam.pdf\', \'\')'))
+
+    _, created, _ = migrate(engine)
+    assert "uq_tests_user_id_test_name" not in created
+    assert "ix_tests_user_id_test_date" in created
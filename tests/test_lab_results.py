@@ -0,0 +1,84 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+import numpy as np
+
+from app.lab_results import (
+    ANALYTES, FLAG_LOW, FLAG_NORMAL, FLAG_HIGH, parse_lab_value, format_lab_value, lab_result_rows,
+    normalize_units, reference_flags, evaluate_lab_results
+)
+from app.ingestion import apply_latest_values
+from app.models import User, Form
+from app.scraping import DataScraped
+
+def test_parse_lab_value():
+    assert parse_lab_value("13.5") == Decimal("13.5")
+    assert parse_lab_value("1.234.5") is None
+    assert parse_lab_value("NaN") is None
+    assert parse_lab_value(None) is None
+
+def test_format_lab_value_drops_the_column_scale():
+    assert format_lab_value(Decimal("14.5000")) == "14.5"
+    assert format_lab_value(Decimal("40.0000")) == "40"
+    assert format_lab_value(Decimal("0.0500")) == "0.05"
+
+def test_latest_values_drop_trailing_zeros_of_the_report():
+    user_form = Form(user_id=1)
+    rows = lab_result_rows(1, 2, datetime(2024, 1, 1), [DataScraped("hemoglobin", "12.0")])
+    apply_latest_values(user_form, rows)
+    # The same text a rebuild reads back from the numeric column
+    assert user_form.latest_hemoglobin == format_lab_value(Decimal("12.0000")) == "12"
+
+def test_lab_result_rows_skips_unknown_and_unparsable_values():
+    rows = lab_result_rows(1, 2, datetime(2024, 1, 1), [
+        DataScraped("hemoglobin", "13.5"),
+        DataScraped("urea", "4O"),
+        DataScraped("unknown", "1")
+    ])
+    assert rows == [{
+        "user_id": 1,
+        "test_id": 2,
+        "analyte": ANALYTES["hemoglobin"],
+        "value": Decimal("13.5"),
+        "unit": "g/dL",
+        "test_date": datetime(2024, 1, 1),
+        "flag": None
+    }]
+
+def test_normalize_units_converts_to_the_canonical_unit():
+    analytes = np.array([ANALYTES["creatinine"], ANALYTES["creatinine"], ANALYTES["hemoglobin"], ANALYTES["urea"]])
+    values = np.array([88.42, 1.2, 135.0, 7.0])
+    normalized, known = normalize_units(analytes, values, ["µmol/L", "mg/dL", "g/L", "mg/mmol"])
+
+    np.testing.assert_allclose(normalized, [1.0, 1.2, 13.5, 7.0])
+    assert known.tolist() == [True, True, True, False]
+
+def test_reference_flags_by_sex_and_age():
+    hemoglobin = ANALYTES["hemoglobin"]
+    analytes = np.full(5, hemoglobin)
+    values = np.array([13.0, 13.0, 13.0, 11.0, 18.0])
+    # unknown sex, male, female, female child, male with unknown age
+    sexes = np.array([0, 1, 2, 2, 1])
+    ages = np.array([40.0, 40.0, 40.0, 10.0, np.nan])
+
+    flags, known = reference_flags(analytes, values, sexes, ages)
+    assert flags.tolist() == [FLAG_NORMAL, FLAG_LOW, FLAG_NORMAL, FLAG_LOW, FLAG_HIGH]
+    assert known.all()
+
+def test_evaluate_lab_results_uses_the_user_of_each_row():
+    users = {
+        1: User(id=1, biological_sex="M", birth_date=date(1980, 1, 1)),
+        2: User(id=2, biological_sex="F", birth_date=date(1980, 1, 1))
+    }
+    rows = (
+        lab_result_rows(1, 10, datetime(2024, 1, 1), [DataScraped("creatinine", "106", "µmol/L")]) +
+        lab_result_rows(2, 11, datetime(2024, 1, 1), [DataScraped("creatinine", "106", "µmol/L")]) +
+        lab_result_rows(2, 11, datetime(2024, 1, 1), [DataScraped("ast", "20", "mg")])
+    )
+
+    evaluate_lab_results(rows, users)
+    assert [(row["value"], row["unit"], row["flag"]) for row in rows] == [
+        (1.1988, "mg/dL", FLAG_NORMAL),
+        (1.1988, "mg/dL", FLAG_HIGH),
+        (Decimal("20"), "mg", None)
+    ]
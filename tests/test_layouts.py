@@ -0,0 +1,62 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from app.layouts import LayoutRegistry, load_layouts
+from app.scraping import ExtractionEngine, IncrementalExtraction, ANALYTE_PATTERNS, DATE_PATTERN, LAYOUTS
+
+OTHER_LAB_PATTERNS = {
+    "hemoglobin": ("Hemoglobin", r'\s*([\d\.]+)\s*g/dL', "g/dL"),
+    "creatinine": ("Creatinine", r'\s*([\d\.]+)\s*mg/dL', "mg/dL")
+}
+OTHER_LAB_DATE_PATTERN = r'Collected:\s*(\d{2}/\d{2}/\d{4})'
+
+def make_registry():
+    registry = LayoutRegistry(ExtractionEngine)
+    registry.register("default", ANALYTE_PATTERNS, DATE_PATTERN, default=True)
+    return registry
+
+def test_detect_falls_back_to_the_default_layout():
+    registry = make_registry()
+    registry.register("other", OTHER_LAB_PATTERNS, OTHER_LAB_DATE_PATTERN, ["Other Diagnostics"])
+
+    assert registry.detect("Atendimento : 01/01/2023\nHEMOGLOBINA 13,5 g/dL").name == "default"
+    assert registry.detect("OTHER Lab\nHemoglobin 13.5 g/dL").name == "default"
+    assert registry.detect("Other Diagnostics Inc.\nHemoglobin 13.5 g/dL").name == "other"
+
+def test_detect_prefers_the_most_specific_layout():
+    registry = make_registry()
+    registry.register("network", OTHER_LAB_PATTERNS, OTHER_LAB_DATE_PATTERN, ["Diagnostics"])
+    registry.register("branch", OTHER_LAB_PATTERNS, OTHER_LAB_DATE_PATTERN, ["Diagnostics", "North Branch"])
+    registry.register("same", OTHER_LAB_PATTERNS, OTHER_LAB_DATE_PATTERN, ["Diagnostics"])
+
+    assert registry.detect("Diagnostics - North Branch").name == "branch"
+    assert registry.detect("Diagnostics - South Branch").name == "network"
+
+def test_register_validates_layouts():
+    registry = make_registry()
+    with pytest.raises(ValueError):
+        registry.register("default", OTHER_LAB_PATTERNS, OTHER_LAB_DATE_PATTERN, ["Other"])
+    with pytest.raises(ValueError):
+        registry.register("no-fingerprint", OTHER_LAB_PATTERNS, OTHER_LAB_DATE_PATTERN)
+
+def test_load_layouts_and_extract_with_the_detected_layout(tmp_path):
+    path = tmp_path / "layouts.json"
+    path.write_text(json.dumps([{
+        "name": "other",
+        "fingerprints": ["Other Diagnostics"],
+        "date_pattern": OTHER_LAB_DATE_PATTERN,
+        "analytes": {name: list(pattern) for name, pattern in OTHER_LAB_PATTERNS.items()}
+    }]))
+    registry = load_layouts(make_registry(), str(path))
+    assert registry.version() != LAYOUTS.version()
+
+    extraction = IncrementalExtraction(registry=registry)
+    extraction.feed("Other Diagnostics Inc.\nCollected: 02/03/2024\nHemoglobin 13.5 g/dL\n")
+    assert extraction.feed("Creatinine 1.1 mg/dL\n")
+
+    data_values, test_date = extraction.results()
+    assert extraction.layout.name == "other"
+    assert [(data.name, data.value) for data in data_values] == [("hemoglobin", "13.5"), ("creatinine", "1.1")]
+    assert test_date == datetime(2024, 3, 2)
@@ -0,0 +1,39 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.metrics import Histogram, REGISTRY, RequestTimings, current_timings, stage, bind_current_context
+
+def test_histogram_exposition():
+    histogram = Histogram('test_duration_seconds', 'Test durations', ('stage',), buckets=(0.1, 1.0))
+    REGISTRY.remove(histogram)
+    histogram.observe(0.05, 'parse')
+    histogram.observe(0.5, 'parse')
+    histogram.observe(5, 'parse')
+
+    lines = histogram.expose(42)
+    assert '# TYPE test_duration_seconds histogram' in lines
+    assert 'test_duration_seconds_bucket{stage="parse",pid="42",le="0.1"} 1' in lines
+    assert 'test_duration_seconds_bucket{stage="parse",pid="42",le="1.0"} 2' in lines
+    assert 'test_duration_seconds_bucket{stage="parse",pid="42",le="+Inf"} 3' in lines
+    assert 'test_duration_seconds_count{stage="parse",pid="42"} 3' in lines
+
+def test_stages_of_worker_threads_add_to_the_request():
+    timings = RequestTimings()
+    token = current_timings.set(timings)
+    try:
+        def work():
+            with stage("s3_download"):
+                time.sleep(0.01)
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            for future in [executor.submit(bind_current_context(work)) for _ in range(2)]:
+                future.result()
+        timings.add_query(0.002)
+    finally:
+        current_timings.reset(token)
+
+    assert timings.stages["s3_download"] >= 0.02
+    header = timings.server_timing(0.05)
+    assert header.startswith("s3_download;dur=")
+    assert 'db_queries;desc="1"' in header
+    assert header.endswith("total;dur=50.0")
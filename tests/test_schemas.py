@@ -0,0 +1,23 @@
+from datetime import date
+
+from app.models import User, Form
+from app.schemas import FORM_FIELDS, FORM_FIELD_NAMES, FormRequest
+from app.utils import create_form_response, is_form_filled
+
+def test_form_fields_match_model_and_request():
+    columns = set(Form.__table__.columns.keys())
+    assert set(FORM_FIELD_NAMES) <= columns
+    assert list(FormRequest.model_fields) == list(FORM_FIELD_NAMES)
+
+def test_create_form_response_follows_form_fields():
+    user = User(full_name="Test User", birth_date=date(1990, 1, 1))
+    user_form = Form(**{name: f"value of {name}" for name in FORM_FIELD_NAMES})
+    response = create_form_response(user, user_form)
+    assert list(response) == ["name", "age", *FORM_FIELD_NAMES]
+    assert response["latest_urea"] == "value of latest_urea"
+
+def test_is_form_filled_only_needs_required_fields():
+    values = {field.name: "1" for field in FORM_FIELDS if field.required}
+    assert is_form_filled(Form(**values))
+    values.pop("latest_creatinine")
+    assert not is_form_filled(Form(**values))
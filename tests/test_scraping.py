@@ -1,13 +1,28 @@
+import io
+import pickle
 import unittest
 from unittest.mock import MagicMock
+import fitz
+from botocore.response import StreamingBody
 from datetime import datetime
 from starlette.responses import JSONResponse
 
 from app.scraping import (
     data_scraping, DataScraped, extract_text_from_s3_pdf,
-    extract_values_from_text, extract_test_date, extract_data_and_date, text_processing
+    extract_values_from_text, extract_test_date, extract_data_and_date, text_processing,
+    ENGINE, pdf_cache, ScrapingResult, IncrementalExtraction, extract_data_from_s3_pdf, download_s3_object,
+    extract_data_in_process_pool, extract_data_from_pdf, shutdown_extraction_pool
 )
 
+def make_pdf(pages):
+    doc = fitz.open()
+    for page_text in pages:
+        page = doc.new_page()
+        page.insert_text((72, 72), page_text)
+    pdf_data = doc.tobytes()
+    doc.close()
+    return pdf_data
+
 class TestScrapingFunctions(unittest.TestCase):
 
     def setUp(self):
@@ -41,7 +56,8 @@ class TestScrapingFunctions(unittest.TestCase):
         filename = "example.pdf"
 
         # Mock return value for extract_text_from_s3_pdf
-        with unittest.mock.patch.dict('os.environ', {'S3_BUCKET_NAME': 'mock-bucket'}):
+        with unittest.mock.patch.dict('os.environ', {'S3_BUCKET_NAME': 'mock-bucket'}), \
+                unittest.mock.patch('app.scraping.PDF_EXTRACTION_MODE', 'full'):
             with unittest.mock.patch('app.scraping.s3_client', self.mock_s3_client):
                 # Mantendo o mock anterior para test_data_scraping
                 with unittest.mock.patch('app.scraping.extract_text_from_s3_pdf', return_value="Mock PDF content"):
@@ -50,6 +66,119 @@ class TestScrapingFunctions(unittest.TestCase):
                     self.assertTrue(all(isinstance(data, DataScraped) for data in extracted_data))
                     self.assertIsInstance(extracted_date, (datetime, type(None)))
 
+    def test_data_scraping_uses_cache_keyed_on_etag(self):
+        self.mock_s3_client.head_object.return_value = {'ETag': '"abc123"'}
+        text = "Atendimento : 01/01/2023\nHEMOGLOBINA 13,5 g/dL"
+        pdf_cache.clear()
+
+        with unittest.mock.patch('app.scraping.s3_client', self.mock_s3_client), \
+                unittest.mock.patch('app.scraping.PDF_EXTRACTION_MODE', 'full'):
+            with unittest.mock.patch('app.scraping.extract_text_from_s3_pdf', return_value=text) as mock_extract:
+                first = data_scraping(1, "example.pdf")
+                second = data_scraping(1, "example.pdf")
+                self.assertEqual(mock_extract.call_count, 1)
+                self.assertEqual([(d.name, d.value) for d in second[0]], [(d.name, d.value) for d in first[0]])
+                self.assertEqual(second[1], datetime(2023, 1, 1))
+                self.assertEqual(second.content_hash, 'abc123')
+
+                # A new pattern set invalidates the parsed values but not the text
+                with unittest.mock.patch('app.scraping.EXTRACTION_VERSION', 'other-version'):
+                    with unittest.mock.patch('app.scraping.text_processing', wraps=text_processing) as mock_processing:
+                        data_scraping(1, "example.pdf")
+                        self.assertEqual(mock_processing.call_count, 1)
+                self.assertEqual(mock_extract.call_count, 1)
+        pdf_cache.clear()
+
+    def test_scraping_result_unpacks_and_pickles(self):
+        result = ScrapingResult([DataScraped("urea", "40")], datetime(2023, 1, 1), '"abc123"')
+        dataScraped, dateScraped = result
+        self.assertEqual(dateScraped, datetime(2023, 1, 1))
+        copy = pickle.loads(pickle.dumps(result))
+        self.assertEqual(copy.content_hash, '"abc123"')
+        self.assertEqual(copy[0][0].value, "40")
+
+    def test_extract_data_from_s3_pdf_stops_after_all_values_are_found(self):
+        first_page = "\n".join([
+            "Atendimento : 01/01/2023",
+            "HEMÁCIAS 4,7 milhões/mm3",
+            "HEMOGLOBINA 13,5 g/dL",
+            "HEMATÓCRITO 40,5 %",
+            "HEMOGLOBINA GLICADA - HbA1c RESULTADO: 5,6 %",
+            "TRANSAMINASE OXALACÉTICA TGO (AST) RESULTADO: 30 U/L",
+            "TRANSAMINASE PIRÚVICA TGP (ALT) RESULTADO: 25 U/L",
+            "UREIA RESULTADO: 40 mg/dL",
+            "CREATININA RESULTADO: 1,1 mg/dL"
+        ])
+        pdf_data = make_pdf([first_page, "Observações", "Assinatura"])
+        self.mock_s3_client.get_object.return_value = {'Body': io.BytesIO(pdf_data)}
+
+        with unittest.mock.patch('app.scraping.s3_client', self.mock_s3_client):
+            data_values, test_date, stats = extract_data_from_s3_pdf(1, "example.pdf")
+
+        self.assertEqual(len(data_values), 8)
+        self.assertEqual(test_date, datetime(2023, 1, 1))
+        self.assertEqual(stats.page_count, 3)
+        self.assertEqual(stats.pages_touched, 1)
+        self.assertEqual(stats.bytes_read, len(pdf_data))
+
+    def test_extract_data_in_process_pool_matches_inline_extraction(self):
+        pdf_data = make_pdf([
+            "Atendimento : 01/01/2023\nHEMOGLOBINA 13,5 g/dL",
+            "UREIA RESULTADO: 40 mg/dL"
+        ])
+
+        with unittest.mock.patch('app.scraping.EXTRACTION_PROCESSES', 1):
+            try:
+                data_values, test_date, stats = extract_data_in_process_pool(pdf_data)
+            finally:
+                shutdown_extraction_pool()
+        inline_values, inline_date, _ = extract_data_from_pdf(pdf_data)
+
+        self.assertEqual([(data.name, data.value) for data in data_values], [(data.name, data.value) for data in inline_values])
+        self.assertEqual(test_date, inline_date)
+        self.assertEqual(stats.page_count, 2)
+        self.assertEqual(stats.bytes_read, len(pdf_data))
+
+    def test_download_s3_object_with_parallel_ranges(self):
+        data = bytes(range(256)) * 40
+
+        def get_object(Bucket, Key, Range, **kwargs):
+            start, end = map(int, Range[len("bytes="):].split("-"))
+            chunk = data[start:end + 1]
+            return {
+                'Body': StreamingBody(io.BytesIO(chunk), len(chunk)),
+                'ContentLength': len(chunk),
+                'ContentRange': f"bytes {start}-{start + len(chunk) - 1}/{len(data)}",
+                'ETag': '"abc"'
+            }
+
+        self.mock_s3_client.get_object.side_effect = get_object
+        with unittest.mock.patch('app.scraping.s3_client', self.mock_s3_client), \
+                unittest.mock.patch('app.scraping.S3_RANGE_CHUNK_SIZE', 1000):
+            downloaded = download_s3_object("1/example.pdf")
+
+        self.assertEqual(bytes(downloaded), data)
+        self.assertEqual(self.mock_s3_client.get_object.call_count, 11)
+        ranges = sorted(call.kwargs['Range'] for call in self.mock_s3_client.get_object.call_args_list)
+        self.assertIn("bytes=10000-10239", ranges)
+        self.assertTrue(all(call.kwargs.get('IfMatch') == '"abc"' for call in self.mock_s3_client.get_object.call_args_list[1:]))
+
+    def test_incremental_extraction_matches_whole_text_extraction(self):
+        pages = [
+            "Atendimento : 01/01/2023\nHEMOGLOBINA 13,5 g/dL\nUREIA\nMaterial: soro\n",
+            "RESULTADO: 40 mg/dL\nCREATININA Nota\n",
+            "CREATININA\nRESULTADO: 1,1 mg/dL\n"
+        ]
+        extraction = IncrementalExtraction()
+        for page in pages:
+            extraction.feed(page)
+        data_values, test_date = extraction.results()
+        expected_values, expected_date = extract_data_and_date("".join(pages))
+
+        self.assertEqual(test_date, expected_date)
+        self.assertEqual([(d.name, d.value) for d in data_values], [(d.name, d.value) for d in expected_values])
+        self.assertEqual([d.name for d in data_values], ["hemoglobin", "urea", "creatinine"])
+
     def test_extract_values_from_text(self):
         text = """
         HEMOGLOBINA 13.5 g/dL
@@ -130,6 +259,25 @@ class TestScrapingFunctions(unittest.TestCase):
             self.assertEqual(result.name, expected.name)
             self.assertEqual(result.value, expected.value)
 
+    def test_extraction_engine_searches_only_inside_each_section(self):
+        text = """
+        HEMOGLOBINA GLICADA - HbA1c RESULTADO: 5,6 %
+        HEMOGLOBINA 13,5 g/dL
+        UREIA Material: soro
+        CREATININA RESULTADO: 1,1 mg/dL
+        """
+        results = {data.name: data.value for data in ENGINE.extract_values(text)}
+        self.assertEqual(results, {"hemoglobin": "13.5", "glycated_hemoglobin": "5.6", "creatinine": "1.1"})
+
+    def test_extraction_engine_uses_first_matching_section(self):
+        text = """
+        CREATININA Valores de referência: 0,7 a 1,3
+        CREATININA RESULTADO: 0,9 mg/dL
+        CREATININA RESULTADO: 1,4 mg/dL
+        """
+        results = ENGINE.extract_values(text)
+        self.assertEqual([(data.name, data.value) for data in results], [("creatinine", "0.9")])
+
     def test_text_processing(self):
         text = """
         Atendimento : 01/01/2023
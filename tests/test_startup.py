@@ -0,0 +1,64 @@
+import os
+import sys
+import json
+import asyncio
+import time
+import subprocess
+from unittest.mock import MagicMock, patch
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.warmup import readiness, warm_up
+
+# Generous enough for a slow CI machine; eagerly loading boto3, fitz or a
+# database driver again shows up in the module check below first
+IMPORT_TIME_BUDGET = 3.0
+
+IMPORT_SCRIPT = """
+import sys, json, time
+start = time.perf_counter()
+import app.main
+import app.database
+elapsed = time.perf_counter() - start
+heavy = [name for name in ('boto3', 'botocore', 'fitz', 'pymupdf') if name in sys.modules]
+print(json.dumps({"seconds": elapsed, "heavy": heavy, "engine": app.database._engine is not None}))
+"""
+
+def test_import_time_budget():
+    env = dict(os.environ, DATABASE_URL="sqlite://")
+    output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], env=env, capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    assert result["heavy"] == []
+    assert result["engine"] is False
+    assert result["seconds"] < IMPORT_TIME_BUDGET
+
+def test_ready_after_warm_up():
+    # The lifespan runs without touching the configured database or S3: the
+    # steps are stand-ins and the job queue is never started
+    async def connect_async_database():
+        pass
+
+    steps = [
+        ("s3_client", lambda: None),
+        ("database", lambda: None),
+        ("async_database", connect_async_database)
+    ]
+    readiness.update(ready=False, error=None, steps={})
+    assert TestClient(app).get("/ready").status_code == 503
+
+    with patch("app.warmup.warm_up_steps", return_value=steps), patch("app.main.get_job_queue", return_value=MagicMock()), TestClient(app) as client:
+        deadline = time.monotonic() + 10
+        response = client.get("/ready")
+        while response.status_code != 200 and time.monotonic() < deadline:
+            time.sleep(0.05)
+            response = client.get("/ready")
+    assert response.status_code == 200
+    assert set(response.json()["data"]["steps"]) == {"s3_client", "database", "async_database"}
+
+def test_warm_up_reports_failure_before_the_first_step():
+    readiness.update(ready=False, error=None, steps={})
+    with patch("app.warmup.warm_up_steps", side_effect=RuntimeError("no settings")):
+        asyncio.run(warm_up())
+    assert readiness["ready"] is False
+    assert readiness["error"] == "Warm-up failed: no settings"